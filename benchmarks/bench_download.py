@@ -0,0 +1,53 @@
+"""
+Benchmark single-stream vs multi-range video downloads
+
+Serves a random video from a local range-capable origin that caps each
+connection's bandwidth (like a CDN does per TCP stream) and downloads it
+with downloader.download_video at several segment counts.
+
+Usage:
+    python -m benchmarks.bench_download [--size-mb 32] [--rate-mb 8] [--segments 1 2 4 8]
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from benchmarks.fake_origin import FakeOrigin
+from downloader import download_video
+from kand import close_async_client
+
+
+async def run(size_mb: int, rate_mb: float, segment_counts) -> None:
+    data = os.urandom(size_mb * 1024 * 1024)
+    origin = FakeOrigin(rate_per_connection=rate_mb * 1024 * 1024).start()
+    url = origin.add_video('/video.mp4', data)
+    baseline = None
+    try:
+        print(f"{size_mb}MB video, {rate_mb}MB/s per connection")
+        print(f"{'segments':>8}  {'seconds':>8}  {'MB/s':>8}  {'speedup':>8}")
+        for segments in segment_counts:
+            with tempfile.TemporaryFile() as dest:
+                started = time.perf_counter()
+                size, _ = await download_video(url, dest, max_size=len(data), segments=segments)
+                elapsed = time.perf_counter() - started
+                dest.seek(0)
+                assert size == len(data) and dest.read() == data, "downloaded bytes differ"
+            baseline = baseline or elapsed
+            print(f"{segments:>8}  {elapsed:>8.2f}  {size / elapsed / 1024 / 1024:>8.1f}  {baseline / elapsed:>7.1f}x")
+    finally:
+        await close_async_client()
+        origin.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=32)
+    parser.add_argument('--rate-mb', type=float, default=8)
+    parser.add_argument('--segments', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    asyncio.run(run(args.size_mb, args.rate_mb, args.segments))
+
+
+if __name__ == '__main__':
+    main()
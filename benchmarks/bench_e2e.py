@@ -0,0 +1,201 @@
+"""
+End-to-end benchmark of link drops on localhost
+
+Replays bursts of messages with viralkand.com links through the bot's real
+handlers. viralkand.com requests are routed to a local FakeOrigin serving
+synthetic pages and videos, and the bot talks to a local FakeBotAPI, so
+nothing leaves the machine and MongoDB is not needed. Reports latency per
+link (message received -> sendVideo received by the fake API), videos per
+minute, per-stage timings and peak RSS (which includes the fake servers'
+in-memory videos, shown separately as the RSS after setup). With
+--local-mode the fake API stands in for a local Bot API server and uploads
+hand it file paths instead of bytes.
+
+Usage:
+    python -m benchmarks.bench_e2e [--links 20] [--burst 5] [--interval 0.5]
+                                   [--sizes-mb 1 4 8] [--videos N] [--page-latency 0.05]
+                                   [--rate-mb 0] [--api-latency 0] [--local-mode] [--verbose]
+"""
+import os
+
+# Set before the bot's config is imported: everyone is an admin of every chat, no /metrics server
+os.environ.setdefault('ADMIN_IDS', '[1000]')
+os.environ.setdefault('GROUP_IDS', '[]')
+os.environ.setdefault('METRICS_PORT', '0')
+
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import httpx
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+from telegram.request import HTTPXRequest
+import kand
+import ratelimit
+import bot
+import metrics
+from scheduler import job_scheduler
+from config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY
+from benchmarks.fake_origin import FakeOrigin, synthetic_page, synthetic_video
+from benchmarks.fake_bot_api import FakeBotAPI
+
+ADMIN_ID = 1000
+
+
+class _OriginTransport(httpx.AsyncHTTPTransport):
+    """Sends requests for viralkand.com to the local fake origin instead"""
+    
+    def __init__(self, port: int, **kwargs):
+        super().__init__(**kwargs)
+        self.port = port
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host in ('viralkand.com', 'www.viralkand.com'):
+            request.url = request.url.copy_with(scheme='http', host='127.0.0.1', port=self.port)
+        return await super().handle_async_request(request)
+
+
+def _current_rss() -> int:
+    """Resident set size of this process in bytes"""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize()
+
+
+def _percentile(values, q: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def _update(update_id: int, chat_id: int, text: str, application: Application) -> Update:
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'Bench'},
+            'from': {'id': ADMIN_ID, 'is_bot': False, 'first_name': 'Admin'},
+            'text': text
+        }
+    }, application.bot)
+
+
+async def run(args) -> None:
+    origin = FakeOrigin(
+        rate_per_connection=args.rate_mb * 1024 * 1024 if args.rate_mb else None,
+        latency=args.page_latency
+    ).start()
+    api = FakeBotAPI(latency=args.api_latency).start()
+    
+    # One video per distinct URL (fewer videos than links repeats them, exercising the caches),
+    # every other one without faststart
+    video_count = args.videos or args.links
+    video_urls = []
+    for i in range(video_count):
+        size_mb = args.sizes_mb[i % len(args.sizes_mb)]
+        video = synthetic_video(size_mb * 1024 * 1024, faststart=i % 2 == 0)
+        video_urls.append(origin.add_video(f'/videos/{i}.mp4', video))
+    # A 320x180 baseline JPEG header (SOF0) followed by 20KB of noise
+    sof = b'\xff\xc0\x00\x11\x08\x00\xb4\x01\x40\x03' + b'\x01\x22\x00\x02\x11\x01\x03\x11\x01'
+    thumbnail_url = origin.add_video('/thumbnail.jpg', b'\xff\xd8' + sof + os.urandom(20 * 1024))
+    links = []
+    for i in range(args.links):
+        origin.add_page(f'/bench-{i}/', synthetic_page(title=f'Bench {i}', video_url=video_urls[i % video_count],
+                                                        image=thumbnail_url))
+        links.append(f'https://viralkand.com/bench-{i}/')
+    
+    kand._async_client = httpx.AsyncClient(
+        headers=kand.HEADERS,
+        follow_redirects=True,
+        transport=ratelimit.LimitedTransport(_OriginTransport(origin._server.server_port, limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )), ratelimit.origin_limiter)
+    )
+    request = HTTPXRequest(connection_pool_size=8, read_timeout=600, write_timeout=600,
+                           connect_timeout=60, pool_timeout=60)
+    bot.local_mode = args.local_mode
+    application = (
+        Application.builder()
+        .token('123456:bench')
+        .base_url(api.base_url)
+        .request(request)
+        .local_mode(args.local_mode)
+        .concurrent_updates(True)
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.handle_message))
+    
+    setup_rss = _current_rss()
+    submitted = {}
+    try:
+        async with application:
+            await bot.post_init(application)
+            started = time.monotonic()
+            
+            # Each link gets its own chat so its sendVideo can be matched to it
+            for offset in range(0, args.links, args.burst):
+                burst = []
+                for i in range(offset, min(offset + args.burst, args.links)):
+                    chat_id = -1000000 - i
+                    submitted[chat_id] = time.monotonic()
+                    burst.append(application.process_update(_update(i + 1, chat_id, links[i], application)))
+                await asyncio.gather(*burst)
+                if offset + args.burst < args.links:
+                    await asyncio.sleep(args.interval)
+            
+            while job_scheduler.queued or job_scheduler.running:
+                await asyncio.sleep(0.05)
+            elapsed = time.monotonic() - started
+            await bot.post_shutdown(application)
+    finally:
+        api.stop()
+        origin.stop()
+    
+    sent = {call.chat_id: call for call in api.calls_for('sendVideo')}
+    latencies = [sent[chat_id].received_at - at for chat_id, at in submitted.items() if chat_id in sent]
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    
+    print(f"{args.links} links in bursts of {args.burst} every {args.interval}s, "
+          f"{video_count} videos of {'/'.join(map(str, args.sizes_mb))}MB")
+    print(f"videos sent:     {len(latencies)}/{args.links} in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed * 60:.1f} videos/minute)")
+    if latencies:
+        print(f"latency per link: p50 {_percentile(latencies, 0.5):.2f}s  "
+              f"p95 {_percentile(latencies, 0.95):.2f}s  p99 {_percentile(latencies, 0.99):.2f}s")
+    print(f"origin requests: {origin.requests}, {origin.bytes_sent / 1024 / 1024:.1f}MB served")
+    print(f"Bot API calls:   {len(api.calls)} ({len(sent)} sendVideo), "
+          f"{sum(call.size for call in api.calls) / 1024 / 1024:.1f}MB sent, "
+          f"{sum(call.local_size for call in api.calls) / 1024 / 1024:.1f}MB read from local files")
+    print(f"RSS:             {setup_rss / 1024 / 1024:.0f}MB after setup, {peak_rss / 1024 / 1024:.0f}MB peak")
+    print(f"{'stage':>8}  {'count':>6}  {'avg':>7}  {'p50':>7}  {'p95':>7}")
+    for stage in ('check', 'fetch', 'parse', 'download', 'upload'):
+        summary = metrics.stage_seconds.summary(stage=stage)
+        if summary['count']:
+            print(f"{stage:>8}  {summary['count']:>6}  {summary['avg']:>6.3f}s  "
+                  f"{summary['p50']:>6.3f}s  {summary['p95']:>6.3f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--links', type=int, default=20)
+    parser.add_argument('--burst', type=int, default=5, help='messages sent at once')
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between bursts')
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--videos', type=int, default=0, help='distinct videos (default: one per link)')
+    parser.add_argument('--page-latency', type=float, default=0.05, help='origin delay before each response')
+    parser.add_argument('--rate-mb', type=float, default=0, help='origin MB/s per connection (0: unlimited)')
+    parser.add_argument('--api-latency', type=float, default=0, help='Bot API delay per call')
+    parser.add_argument('--local-mode', action='store_true', help='upload by file path (local Bot API server)')
+    parser.add_argument('--verbose', action='store_true', help="keep the bot's info logging")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
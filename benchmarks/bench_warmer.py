@@ -0,0 +1,112 @@
+"""
+Benchmark first-time links with and without the cache warmer
+
+A local FakeOrigin serves viralkand-style posts, a sitemap and an RSS feed
+(the fixture feed) listing some of them. The cache warmer polls the feed
+once, then every post is requested the way a posted link is handled: scrape
+(answered from the metadata cache for warmed posts) and video (from the
+video cache when prefetched, else downloaded). Reports the poll's duration
+and the first-request latency of warmed vs. cold posts.
+
+Usage:
+    python -m benchmarks.bench_warmer [--posts 20] [--feed-posts 10] [--size-mb 4]
+                                      [--page-latency 0.05] [--rate 20] [--prefetch-mb 64] [--feed rss]
+"""
+import os
+import tempfile
+
+# Set before the bot's config is imported: a throwaway video cache, no /metrics server
+os.environ.setdefault('VIDEO_CACHE_DIR', tempfile.mkdtemp(prefix='bench-warmer-'))
+os.environ.setdefault('METRICS_PORT', '0')
+
+import time
+import asyncio
+import logging
+import argparse
+import httpx
+import kand
+import ratelimit
+from videocache import video_cache
+from downloader import download_video
+from warmer import CacheWarmer
+from benchmarks.bench_e2e import _OriginTransport, _percentile
+from benchmarks.fake_origin import FakeOrigin, synthetic_page, synthetic_video, synthetic_sitemap, synthetic_feed
+
+
+async def _first_request(link: str) -> float:
+    """Seconds to scrape a link and get its video, as for a link posted in a chat"""
+    started = time.perf_counter()
+    result = await kand.validate_and_check_url_async(link)
+    video_url = result['metadata']['video_url']
+    cached = video_cache.open(video_url)
+    if cached:
+        video_cache.discard(cached[0])
+    else:
+        with tempfile.TemporaryFile() as dest:
+            await download_video(video_url, dest)
+    return time.perf_counter() - started
+
+
+async def run(args) -> None:
+    origin = FakeOrigin(latency=args.page_latency).start()
+    links = []
+    for i in range(args.posts):
+        video_url = origin.add_video(f'/videos/{i}.mp4', synthetic_video(args.size_mb * 1024 * 1024))
+        origin.add_page(f'/post-{i}/', synthetic_page(title=f'Post {i}', video_url=video_url))
+        links.append(f'https://viralkand.com/post-{i}/')
+    # The fixture feed lists the first feed_posts posts, the others stay cold
+    published = links[:args.feed_posts]
+    origin.add_feed('/sitemap.xml', synthetic_sitemap(published))
+    origin.add_feed('/feed/', synthetic_feed(published[::-1]))
+    feed_url = 'https://viralkand.com/sitemap.xml' if args.feed == 'sitemap' else 'https://viralkand.com/feed/'
+    
+    kand._async_client = httpx.AsyncClient(
+        headers=kand.HEADERS,
+        follow_redirects=True,
+        transport=ratelimit.LimitedTransport(_OriginTransport(origin._server.server_port), ratelimit.origin_limiter)
+    )
+    warmer = CacheWarmer(feed_urls=[feed_url], max_entries=args.posts, rate=args.rate,
+                         prefetch_bytes=args.prefetch_mb * 1024 * 1024)
+    try:
+        started = time.perf_counter()
+        warmed = await warmer.poll()
+        poll_seconds = time.perf_counter() - started
+        requests_after_poll = origin.requests
+        
+        latencies = {link: await _first_request(link) for link in links}
+    finally:
+        await kand.close_async_client()
+        origin.stop()
+    
+    warm = [latencies[link] for link in published]
+    cold = [latencies[link] for link in links[args.feed_posts:]]
+    stats = warmer.stats()
+    print(f"{args.posts} posts of {args.size_mb}MB, {args.feed_posts} in the {args.feed} feed, "
+          f"{args.page_latency}s origin latency")
+    print(f"warmer poll:     {warmed} posts scraped, {stats['prefetched']} videos "
+          f"({stats['prefetched_bytes'] / 1024 / 1024:.0f}MB) prefetched in {poll_seconds:.2f}s, "
+          f"{requests_after_poll} origin requests")
+    for name, values in (('warmed', warm), ('cold', cold)):
+        if values:
+            print(f"{name + ' posts:':<16} p50 {_percentile(values, 0.5) * 1000:.1f}ms  "
+                  f"p95 {_percentile(values, 0.95) * 1000:.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=20)
+    parser.add_argument('--feed-posts', type=int, default=10, help='posts listed in the feed (warmed)')
+    parser.add_argument('--size-mb', type=int, default=4)
+    parser.add_argument('--page-latency', type=float, default=0.05, help='origin delay before each response')
+    parser.add_argument('--rate', type=float, default=20, help='warmer scrapes per second')
+    parser.add_argument('--prefetch-mb', type=int, default=64, help='warmer prefetch budget (0: only scrape)')
+    parser.add_argument('--feed', choices=('rss', 'sitemap'), default='rss')
+    parser.add_argument('--verbose', action='store_true', help='keep info logging')
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
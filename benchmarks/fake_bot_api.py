@@ -0,0 +1,167 @@
+"""
+Local stand-in for the Telegram Bot API
+
+Answers the methods the bot uses (getMe, sendMessage, sendVideo,
+sendMediaGroup, editMessageText, deleteMessage, ...) with minimal valid results and records
+when each call arrived, for which chat and how many bytes it carried. Point
+python-telegram-bot at it with Application.builder().base_url(api.base_url).
+
+It also stands in for a local Bot API server (Application.builder().local_mode(True)):
+file:// inputs are read from disk like the real server does, and answered
+with an error when the file does not exist. Methods listed in `failures`
+are answered with 502 Bad Gateway (a NetworkError for the bot) that many times.
+"""
+import re
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+
+class Call(NamedTuple):
+    method: str
+    chat_id: Optional[int]
+    received_at: float  # time.monotonic() when the request body was read
+    duration: float  # seconds spent receiving the request body
+    size: int
+    local_size: int = 0  # bytes of the file:// inputs read from disk (local mode)
+    text: Optional[str] = None  # text of sendMessage/editMessageText calls
+
+
+def _field(content_type: str, body: bytes, name: str) -> Optional[str]:
+    """Get a (non-file) field from a form-encoded or multipart request body"""
+    if content_type.startswith('multipart/'):
+        pattern = rb'name="' + name.encode() + rb'"\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--'
+        match = re.search(pattern, body, re.DOTALL)
+        return match.group(1).decode('utf-8', 'replace') if match else None
+    values = parse_qs(body.decode('utf-8', 'replace')).get(name)
+    return values[0] if values else None
+
+
+def _local_files(video: Optional[str], media: Optional[str]) -> List[str]:
+    """Get the paths of the file:// inputs of a sendVideo/sendMediaGroup call"""
+    inputs = [video] + [item.get('media') for item in json.loads(media)] if media else [video]
+    return [unquote(urlparse(value).path) for value in inputs if value and value.startswith('file://')]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_POST(self):
+        api = self.server.api
+        method = self.path.rstrip('/').rsplit('/', 1)[-1]
+        started = time.monotonic()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        received_at = time.monotonic()
+        content_type = self.headers.get('Content-Type', '')
+        chat_id = _field(content_type, body, 'chat_id')
+        chat_id = int(chat_id) if chat_id else None
+        media = _field(content_type, body, 'media') if method == 'sendMediaGroup' else None
+        video = _field(content_type, body, 'video') if method == 'sendVideo' else None
+        text = _field(content_type, body, 'text') if method in ('sendMessage', 'editMessageText') else None
+        
+        # Like the local server, read file:// inputs from disk
+        local_size = 0
+        missing = None
+        for path in _local_files(video, media):
+            try:
+                with open(path, 'rb') as local_file:
+                    local_size += len(local_file.read())
+            except OSError:
+                missing = path
+        
+        if api.latency:
+            time.sleep(api.latency)
+        with api.lock:
+            api.calls.append(Call(method, chat_id, received_at, received_at - started, len(body), local_size, text))
+        
+        with api.lock:
+            failing = api.failures.get(method, 0) > 0
+            if failing:
+                api.failures[method] -= 1
+        if failing:
+            status = 502
+            payload = json.dumps({'ok': False, 'error_code': 502, 'description': 'Bad Gateway'})
+        elif missing:
+            status = 400
+            payload = json.dumps({'ok': False, 'error_code': 400, 'description': f'Bad Request: file {missing} not found'})
+        else:
+            status = 200
+            payload = json.dumps({'ok': True, 'result': api.result(method, chat_id, len(json.loads(media)) if media else 0)})
+        payload = payload.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    do_GET = do_POST
+
+
+class FakeBotAPI:
+    """Threaded HTTP server on localhost answering Bot API calls"""
+    
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: List[Call] = []
+        self.failures: Dict[str, int] = {}  # method -> how many of its next calls fail
+        self.lock = threading.Lock()
+        self._message_id = 0
+        self._server = None
+    
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/bot"
+    
+    def _message(self, chat_id: Optional[int], **fields) -> Dict:
+        with self.lock:
+            self._message_id += 1
+            message_id = self._message_id
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id or 0, 'type': 'supergroup', 'title': 'Bench'},
+            'from': BOT_USER,
+            **fields
+        }
+    
+    def _video_message(self, chat_id: Optional[int]) -> Dict:
+        message = self._message(chat_id)
+        file_id = f"bench-{message['message_id']}"
+        message['video'] = {'file_id': file_id, 'file_unique_id': file_id, 'width': 0, 'height': 0, 'duration': 0}
+        return message
+    
+    def result(self, method: str, chat_id: Optional[int], media_count: int = 0):
+        """Build the result object Telegram would return for method"""
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'sendVideo':
+            return self._video_message(chat_id)
+        if method == 'sendMediaGroup':
+            return [self._video_message(chat_id) for _ in range(media_count)]
+        if method in ('sendMessage', 'editMessageText'):
+            return self._message(chat_id, text='')
+        return True
+    
+    def calls_for(self, method: str) -> List[Call]:
+        with self.lock:
+            return [call for call in self.calls if call.method == method]
+    
+    def start(self) -> 'FakeBotAPI':
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+    
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,235 @@
+"""
+Local stand-in for viralkand.com and its video CDN
+
+Serves synthetic viralkand-style pages, sitemaps/feeds and in-memory videos over HTTP,
+with optional Range support, a per-connection bandwidth cap, a delay
+before each response and injected faults (503 answers, connections dropped
+mid-video), so scraping and download strategies can be compared without
+touching the real site.
+"""
+import os
+import re
+import html
+import time
+import struct
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional
+
+# Bytes written per socket write when serving a body
+WRITE_SIZE = 65536
+
+
+def synthetic_page(title: Optional[str] = 'Synthetic video', video_url: Optional[str] = None,
+                   image: Optional[str] = None, description: Optional[str] = 'Benchmark page',
+                   body_size: int = 64 * 1024, head_padding: int = 0) -> bytes:
+    """
+    Build a page shaped like a viralkand.com post
+
+    Tags passed as None are left out. body_size bytes of markup follow the
+    head (the part the scraper should skip), head_padding bytes of inline
+    script precede the meta tags (the part it cannot).
+    """
+    tags = []
+    for attr, name, value in (('property', 'og:title', title), ('property', 'og:description', description),
+                              ('property', 'og:image', image), ('itemprop', 'contentURL', video_url)):
+        if value is not None:
+            tags.append(f'<meta {attr}="{name}" content="{html.escape(value)}">')
+    script = f"<script>/*{'x' * head_padding}*/</script>" if head_padding else ''
+    paragraph = '<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>\n'
+    body = paragraph * (body_size // len(paragraph) + 1)
+    return (
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\">{script}"
+        f"<title>{html.escape(title or '')}</title>{''.join(tags)}</head>"
+        f"<body>{body}</body></html>"
+    ).encode()
+
+
+def synthetic_sitemap(urls: List[str], lastmod: str = '2026-01-01T00:00:00+00:00') -> bytes:
+    """Build a sitemap listing urls, the last one modified latest (like a newly added post)"""
+    entries = ''.join(
+        f"<url><loc>{html.escape(url)}</loc><lastmod>{lastmod[:17]}{i % 60:02d}{lastmod[19:]}</lastmod></url>"
+        for i, url in enumerate(urls)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+    ).encode()
+
+
+def synthetic_feed(urls: List[str], title: str = 'Viralkand') -> bytes:
+    """Build an RSS 2.0 feed with one item per url, in the given (newest first) order"""
+    items = ''.join(
+        f"<item><title>Post {i}</title><link>{html.escape(url)}</link></item>" for i, url in enumerate(urls)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0">'
+        f"<channel><title>{html.escape(title)}</title>{items}</channel></rss>"
+    ).encode()
+
+
+def _box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def synthetic_video(size: int, duration: int = 30, width: int = 1280, height: int = 720,
+                    faststart: bool = True) -> bytes:
+    """
+    Build an MP4-shaped file of about size bytes
+
+    It has the boxes a header probe reads (ftyp, moov with mvhd and a video
+    trak with tkhd/mdia/hdlr) and random bytes as media data. With
+    faststart=False the moov comes after mdat, like many encoder outputs.
+    """
+    mvhd = _box(b'mvhd', struct.pack('>4xIIII', 0, 0, 1000, duration * 1000) + bytes(80))
+    matrix = struct.pack('>9i', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    tkhd = _box(b'tkhd', struct.pack('>4xIIIII', 0, 0, 1, 0, duration * 1000) + bytes(16) + matrix
+                + struct.pack('>II', width << 16, height << 16))
+    hdlr = _box(b'hdlr', bytes(8) + b'vide' + bytes(12) + b'VideoHandler\0')
+    moov = _box(b'moov', mvhd + _box(b'trak', tkhd + _box(b'mdia', hdlr)))
+    ftyp = _box(b'ftyp', b'isom' + struct.pack('>I', 512) + b'isomiso2avc1mp41')
+    mdat = _box(b'mdat', os.urandom(max(0, size - len(ftyp) - len(moov) - 8)))
+    return ftyp + moov + mdat if faststart else ftyp + mdat + moov
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_HEAD(self):
+        self._serve(send_body=False)
+    
+    def do_GET(self):
+        self._serve(send_body=True)
+    
+    def _serve(self, send_body: bool):
+        origin = self.server.origin
+        path = self.path.split('?', 1)[0]
+        origin.requests += 1
+        if origin.latency:
+            time.sleep(origin.latency)
+        
+        with origin.lock:
+            failing = origin.errors > 0
+            origin.errors -= failing
+        if failing:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        
+        page = origin.pages.get(path)
+        feed = origin.feeds.get(path)
+        if page is not None or feed is not None:
+            page = page if page is not None else feed
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8' if feed is None else 'application/xml')
+            self.send_header('Content-Length', str(len(page)))
+            self.end_headers()
+            if send_body:
+                self._write_throttled(memoryview(page))
+            return
+        
+        data = origin.videos.get(path)
+        if data is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        
+        start, end, status = 0, len(data) - 1, 200
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if match and origin.accept_ranges:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else end, end)
+            status = 206
+        
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        if origin.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.end_headers()
+        if send_body:
+            body = memoryview(data)[start:end + 1]
+            with origin.lock:
+                dropping = origin.drops > 0 and len(body) > origin.drop_after
+                origin.drops -= dropping
+            if dropping:
+                # Send part of the body, then hang up
+                self._write_throttled(body[:origin.drop_after])
+                self.close_connection = True
+                return
+            self._write_throttled(body)
+    
+    def _write_throttled(self, body: memoryview):
+        rate = self.server.origin.rate_per_connection
+        started = time.monotonic()
+        sent = 0
+        try:
+            for offset in range(0, len(body), WRITE_SIZE):
+                chunk = body[offset:offset + WRITE_SIZE]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                self.server.origin.bytes_sent += len(chunk)
+                if rate:
+                    # Sleep until this connection is back under its bandwidth cap
+                    delay = sent / rate - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeOrigin:
+    """Threaded HTTP server on localhost serving registered pages and videos"""
+    
+    def __init__(self, rate_per_connection: Optional[float] = None, accept_ranges: bool = True,
+                 latency: float = 0.0, errors: int = 0, drops: int = 0, drop_after: int = 1024 * 1024):
+        self.pages: Dict[str, bytes] = {}
+        self.feeds: Dict[str, bytes] = {}
+        self.videos: Dict[str, bytes] = {}
+        self.rate_per_connection = rate_per_connection
+        self.accept_ranges = accept_ranges
+        self.latency = latency
+        self.errors = errors  # the next `errors` requests are answered with 503
+        self.drops = drops  # the next `drops` video bodies are cut after drop_after bytes
+        self.drop_after = drop_after
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self._server = None
+    
+    def add_page(self, path: str, html_bytes: bytes) -> str:
+        """Serve an HTML page at path, returns its URL"""
+        self.pages[path] = html_bytes
+        return self.url(path)
+    
+    def add_feed(self, path: str, xml_bytes: bytes) -> str:
+        """Serve a sitemap or RSS feed at path, returns its URL"""
+        self.feeds[path] = xml_bytes
+        return self.url(path)
+    
+    def add_video(self, path: str, data: bytes) -> str:
+        """Serve data at path, returns its URL"""
+        self.videos[path] = data
+        return self.url(path)
+    
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}{path}"
+    
+    def start(self) -> 'FakeOrigin':
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.origin = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+    
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
@@ -1,13 +1,49 @@
-import logging
 import os
+import signal
+import struct
+import asyncio
+import logging
 import tempfile
-import requests
-from telegram import Update, InputFile
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from pathlib import Path
+from typing import Optional, Tuple
+import startup
+# Heavy third-party imports are timed one by one for the startup report (the imports below are then free)
+startup.time_imports('telegram', 'telegram.ext', 'httpx', 'requests', 'bs4', 'pymongo')
+import httpx
+from telegram import Update, InputFile, InputMediaVideo
+from telegram.constants import MediaGroupLimit
+from telegram.error import BadRequest
+from telegram.helpers import escape_markdown
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes
 from telegram.request import HTTPXRequest
-from config import BOT_TOKEN, ADMIN_IDS, GROUP_IDS
-from kand import extract_urls as extract_urls_kand, validate_and_check_url as validate_viralkand
-from database import connect_mongodb, get_admins, add_admin, is_admin as db_is_admin, get_bot_stats
+from config import (
+    BOT_TOKEN, GROUP_IDS, MAX_VIDEO_SIZE, DOWNLOAD_SPOOL_MAX_SIZE, VIDEO_CACHE_DIR,
+    LOCAL_BOT_API_URL, LOCAL_BOT_API_FILE_URL, LOCAL_BOT_API_TIMEOUT,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_LISTEN, PORT,
+    JOB_BACKEND, BOT_ROLE, METRICS_PORT, METRICS_LISTEN
+)
+from kand import (
+    extract_urls as extract_urls_kand, validate_and_check_url_async as validate_viralkand, close_async_client,
+    get_async_client, scrape_flight
+)
+from cache import metadata_cache, negative_cache, file_id_cache
+from videocache import video_cache
+from downloader import download_video, probe_size, VideoTooLarge, DownloadError
+from retry import TRANSIENT_STATUS
+from mp4probe import probe as probe_mp4
+from scheduler import job_scheduler, QueueFull
+from jobqueue import job_queue
+from singleflight import SingleFlight
+from ratelimit import origin_limiter
+from governor import resource_governor, Reservation, BudgetExhausted
+from warmer import cache_warmer
+import metrics
+from database import (
+    connect_mongodb, connect_mongodb_async, get_admins_async as get_admins, add_admin_async as add_admin,
+    is_admin_async as db_is_admin, get_bot_stats_async as get_bot_stats
+)
+
+startup.mark('imported')
 
 # Enable logging
 logging.basicConfig(
@@ -16,10 +52,123 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Only plain messages are handled (commands and link drops), so nothing else is subscribed
+ALLOWED_UPDATES = [Update.MESSAGE]
+
+# Coalesces concurrent download/uploads of the same video_url
+upload_flight = SingleFlight()
+
+# Whether video jobs go through the MongoDB lease queue (set in main once connected)
+use_job_queue = False
+
+# Whether the bot talks to a local Bot API server, which uploads videos from their file path
+local_mode = bool(LOCAL_BOT_API_URL)
+
+# /metrics server, started with the bot when METRICS_PORT is set
+metrics_server = None
+
+# Background MongoDB connect, so updates are served before it is done
+connect_task: Optional[asyncio.Task] = None
+
+# Telegram's limits for video thumbnails (which must be JPEG)
+THUMBNAIL_MAX_SIZE = 200 * 1024
+THUMBNAIL_MAX_SIDE = 320
+
+
+class UploadFailed(Exception):
+    """Raised by upload_video once its chat was told why the video could not be sent"""
+    
+    def __init__(self, message: str, retryable: bool):
+        super().__init__(message)
+        self.message = message
+        self.retryable = retryable
+
+
+def _queue_depth() -> dict:
+    """Queued and running video jobs (cluster-wide with the MongoDB queue)"""
+    if use_job_queue:
+        counts = job_queue.counts()
+        return {'queued': counts['queued'], 'running': counts['running']}
+    stats = job_scheduler.stats()
+    return {'queued': stats['queued'], 'running': stats['running']}
+
+
+def _cache_lookups() -> dict:
+    """Lookups per cache tier and outcome"""
+    metadata_stats = metadata_cache.stats()
+    file_id_stats = file_id_cache.stats()
+    return {
+        'metadata_memory_hit': metadata_stats['memory_hits'],
+        'metadata_db_hit': metadata_stats['db_hits'],
+        'metadata_miss': metadata_stats['misses'],
+        'negative_hit': negative_cache.memory_hits + negative_cache.db_hits,
+        'negative_miss': negative_cache.misses,
+        'file_id_hit': file_id_stats['hits'],
+        'file_id_miss': file_id_stats['misses'],
+        'video_disk_hit': video_cache.hits,
+        'video_disk_miss': video_cache.misses
+    }
+
+
+metrics.registry.register(metrics.Gauge('viralkand_jobs', 'Video jobs by state', _queue_depth, label='state'))
+metrics.registry.register(metrics.Gauge(
+    'viralkand_cache_lookups_total', 'Cache lookups by cache and outcome', _cache_lookups, label='result', kind='counter'
+))
+metrics.registry.register(metrics.Gauge(
+    'viralkand_video_cache_bytes', 'Bytes of videos in the on-disk cache', lambda: video_cache.stats()['bytes']
+))
+metrics.registry.register(metrics.Gauge(
+    'viralkand_coalesced_total', 'Requests that shared another in-flight request',
+    lambda: {'scrape': scrape_flight.coalesced, 'upload': upload_flight.coalesced}, label='kind', kind='counter'
+))
 
-def is_admin(user_id: int) -> bool:
+
+def _origin_stat(field: str):
+    """Callback reading one field of the per-host origin limiter stats"""
+    return lambda: {host: stats[field] for host, stats in origin_limiter.stats().items()}
+
+
+metrics.registry.register(metrics.Gauge(
+    'viralkand_origin_limit', 'Adaptive concurrency limit per origin host', _origin_stat('limit'), label='host'
+))
+metrics.registry.register(metrics.Gauge(
+    'viralkand_origin_active', 'Requests in flight per origin host', _origin_stat('active'), label='host'
+))
+metrics.registry.register(metrics.Gauge(
+    'viralkand_origin_waiting', 'Requests waiting for a slot per origin host', _origin_stat('waiting'), label='host'
+))
+metrics.registry.register(metrics.Gauge(
+    'viralkand_origin_throttled_total', 'Throttling answers and timeouts per origin host',
+    _origin_stat('throttled'), label='host', kind='counter'
+))
+metrics.registry.register(metrics.Gauge(
+    'viralkand_startup_seconds', 'Seconds spent per startup phase, or after process start per milestone',
+    lambda: {**startup.phases, **startup.milestones}, label='phase'
+))
+metrics.registry.register(metrics.Gauge(
+    'viralkand_budget_used_bytes', 'Bytes reserved by video jobs in flight per resource',
+    lambda: dict(resource_governor.used), label='resource'
+))
+metrics.registry.register(metrics.Gauge(
+    'viralkand_budget_limit_bytes', 'Budget of bytes video jobs may hold per resource (0 is unlimited)',
+    lambda: dict(resource_governor.limits), label='resource'
+))
+metrics.registry.register(metrics.Gauge(
+    'viralkand_budget_rejected_total', 'Video jobs rejected after waiting for the memory/disk budget',
+    lambda: resource_governor.rejected, kind='counter'
+))
+metrics.registry.register(metrics.Gauge(
+    'viralkand_warmer_total', 'Cache warmer polls, scraped posts, prefetched videos and bytes, errors',
+    cache_warmer.stats, label='kind', kind='counter'
+))
+mp4_layouts = metrics.registry.register(metrics.Counter(
+    'viralkand_mp4_layout_total', 'Uploaded videos by MP4 layout (faststart, moov_at_end or unparsed)'
+))
+
+
+async def is_admin(user_id: int) -> bool:
     """Check if user is an admin"""
-    return db_is_admin(user_id)
+    return await db_is_admin(user_id)
 
 
 def is_allowed_group(chat_id: int) -> bool:
@@ -29,74 +178,322 @@ def is_allowed_group(chat_id: int) -> bool:
     return chat_id in GROUP_IDS
 
 
-async def download_and_upload_video(video_url: str, update: Update, caption: str = None) -> None:
-    """Download video from URL and upload to Telegram"""
-    temp_path = None
+class StreamingInputFile(InputFile):
+    """InputFile that hands the open file to httpx, which streams it from disk in chunks"""
+    
+    def __init__(self, video_file, filename: str, attach: bool = False):
+        super().__init__(b'', filename=filename, attach=attach)
+        self.input_file_content = video_file
+
+
+def _video_input(video_file, filename: str = 'video.mp4', attach: bool = False):
+    """Upload source for a fetched video (its path in local mode, streamed when it lives in the disk cache)"""
+    if local_mode:
+        # The local server reads the file itself - only its file:// URI goes over the wire
+        video_file.flush()
+        return Path(video_file.name)
+    video_file.seek(0)
+    if video_cache.enabled:
+        return StreamingInputFile(video_file, filename, attach)
+    # InputFile reads the whole file anyway, so hand it the bytes directly
+    return InputFile(video_file.read(), filename=filename, attach=attach)
+
+
+def _video_footprint(size: int) -> dict:
+    """Memory and disk bytes a downloaded video of size bytes holds until it is released"""
+    if video_cache.enabled or local_mode:
+        # A file on disk, streamed from there (or read by the local server) on upload
+        return {'disk': size}
+    # A spooled buffer, spilling to disk when large, that is read into memory whole for the upload.
+    # download_video keeps a video that fits in the spool there (no ranged download into a real file)
+    if size <= DOWNLOAD_SPOOL_MAX_SIZE:
+        return {'memory': 2 * size}
+    return {'memory': size, 'disk': size}
+
+
+async def _video_needs(video_url: str) -> dict:
+    """
+    Memory and disk a video will hold once fetched, from its probed size
+    (nothing if it is in the disk cache)
+    
+    Raises:
+        VideoTooLarge: If the origin announces more than MAX_VIDEO_SIZE
+    """
+    if video_url in video_cache:
+        return {}
+    size = await probe_size(video_url)
+    if size is not None and size > MAX_VIDEO_SIZE:
+        raise VideoTooLarge(size, MAX_VIDEO_SIZE)
+    # Without a Content-Length the video may be as large as allowed
+    return _video_footprint(MAX_VIDEO_SIZE if size is None else size)
+
+
+async def fetch_video(video_url: str, reservation: Optional[Reservation]):
+    """
+    Get a video as an open file, from the disk cache or else downloaded
+    
+    Downloads go into the disk cache (reused for upload retries and re-posts)
+    or, with the cache disabled, into a buffer spilling to a temp file when large
+    (always a named temp file in local mode, which uploads by path). Before the
+    download starts, the memory/disk the video will hold (probed without
+    keeping a connection open) is added to reservation; pass None when the
+    caller already reserved it.
+    
+    Returns:
+        Tuple: (open file, size in bytes, sha256 hex digest), release it with video_cache.discard
+    
+    Raises:
+        BudgetExhausted: If there was no room for the video within RESOURCE_WAIT_TIMEOUT
+    """
+    if video_cache.enabled:
+        cached = await asyncio.to_thread(video_cache.open, video_url)
+        if cached:
+            logger.info(f"Video served from disk cache: {video_url}")
+            return cached
+    
+    if reservation is not None:
+        await reservation.reserve(**await _video_needs(video_url))
+    
+    if video_cache.enabled:
+        video_file = await asyncio.to_thread(video_cache.create)
+    elif local_mode:
+        os.makedirs(VIDEO_CACHE_DIR, exist_ok=True)
+        video_file = tempfile.NamedTemporaryFile(dir=VIDEO_CACHE_DIR, suffix='.tmp')
+    else:
+        video_file = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_MAX_SIZE, suffix='.mp4')
+    
+    try:
+        # Oversized videos are rejected before/while streaming
+        with metrics.timed('download'):
+            file_size, content_hash = await download_video(video_url, video_file)
+        metrics.stage_bytes.inc(file_size, stage='download')
+        if video_cache.enabled:
+            cached = await asyncio.to_thread(video_cache.commit, video_file, video_url, content_hash, file_size)
+            if cached and local_mode:
+                # The temp file was moved into the cache - reopen it by the path the local server reads
+                video_file.close()
+                video_file = open(video_cache.path(content_hash), 'rb')
+        return video_file, file_size, content_hash
+    except BaseException:
+        video_cache.discard(video_file)
+        raise
+
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Width and height of a JPEG from its start-of-frame segment, None if not found"""
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Markers without a length
+            offset += 2
+            continue
+        length = struct.unpack_from('>H', data, offset + 2)[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if offset + 9 > len(data):
+                return None
+            height, width = struct.unpack_from('>HH', data, offset + 5)
+            return width, height
+        offset += 2 + length
+    return None
+
+
+async def fetch_thumbnail(image_url: Optional[str]) -> Optional[bytes]:
+    """
+    Download a page's og:image as a video thumbnail
+    
+    Best effort: None if missing, not a JPEG, too large (bytes or sides) or
+    if anything goes wrong, the video is then sent without one.
+    """
+    if not image_url or not image_url.startswith(('http://', 'https://')):
+        return None
+    try:
+        async with get_async_client().stream('GET', image_url, timeout=15) as response:
+            if response.status_code != 200:
+                return None
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data += chunk
+                if len(data) > THUMBNAIL_MAX_SIZE:
+                    logger.info(f"Thumbnail over {THUMBNAIL_MAX_SIZE} bytes, not used: {image_url}")
+                    return None
+    except Exception as e:
+        # Not only httpx.HTTPError (e.g. httpx.InvalidURL): a failure here must not fail the video
+        logger.warning(f"Could not fetch thumbnail {image_url}: {type(e).__name__}: {str(e)}")
+        return None
+    if not data.startswith(b'\xff\xd8\xff'):
+        return None
+    size = _jpeg_size(bytes(data))
+    if size is None or max(size) > THUMBNAIL_MAX_SIDE:
+        logger.info(f"Thumbnail size {size} not usable (max {THUMBNAIL_MAX_SIDE}px a side): {image_url}")
+        return None
+    return bytes(data)
+
+
+async def _video_attributes(video_file, thumbnail: Optional[bytes]) -> dict:
+    """Duration, dimensions (from the MP4 header) and thumbnail to send with an uploaded video"""
+    info = await asyncio.to_thread(probe_mp4, video_file)
+    attributes = {}
+    if info is None:
+        mp4_layouts.inc(layout='unparsed')
+    else:
+        mp4_layouts.inc(layout='faststart' if info.faststart else 'moov_at_end')
+        attributes = {key: value for key, value in
+                      (('duration', info.duration), ('width', info.width), ('height', info.height)) if value}
+    if thumbnail:
+        attributes['thumbnail'] = thumbnail
+    return attributes
+
+
+async def send_cached_video(file_id: str, video_url: str, update: Update, caption: str = None) -> bool:
+    """Re-send an already uploaded video by its file_id, returns False if Telegram rejects it"""
+    try:
+        await update.effective_chat.send_video(
+            video=file_id,
+            caption=caption,
+            supports_streaming=True
+        )
+        logger.info(f"Video sent from file_id cache: {video_url}")
+        return True
+    except BadRequest as e:
+        # Stale or foreign file_id - drop it and upload again
+        logger.warning(f"Cached file_id rejected for {video_url}: {str(e)}")
+        await file_id_cache.invalidate_async(video_url, file_id)
+        return False
+
+
+async def download_and_upload_video(video_url: str, update: Update, caption: str = None,
+                                    thumbnail_url: Optional[str] = None) -> None:
+    """Download video from URL and upload to Telegram (with the page's og:image as thumbnail_url)"""
+    # Videos uploaded before are re-sent by file_id without downloading anything
+    file_id = await file_id_cache.get_async(video_url)
+    if file_id and await send_cached_video(file_id, video_url, update, caption):
+        return
+    
+    # Chats asking for the same video at the same time wait for one download and
+    # upload, then re-send the resulting file_id
+    led = False
+    
+    async def lead():
+        nonlocal led
+        led = True
+        return await upload_video(video_url, update, caption, thumbnail_url)
+    
+    error_msg = "❌ Could not send the video, please try again later."
+    for _ in range(2):
+        try:
+            file_id, shared = await upload_flight.do(video_url, lead)
+        except UploadFailed as e:
+            if led:
+                # upload_video told this chat already
+                return
+            error_msg = e.message
+            if not e.retryable:
+                break
+            continue
+        if not shared or (file_id and await send_cached_video(file_id, video_url, update, caption)):
+            return
+        # The shared upload failed - try again, still coalesced with the other chats
+        # waiting for it so they do not all download the video at once
+    await update.effective_chat.send_message(error_msg)
+    logger.warning(f"Shared upload failed ({error_msg}): {video_url}")
+
+
+async def upload_video(video_url: str, update: Update, caption: str = None,
+                       thumbnail_url: Optional[str] = None) -> Optional[str]:
+    """
+    Download video from URL and upload it to the chat, returns the Telegram file_id
+    
+    Raises:
+        UploadFailed: After telling the chat why it failed, so chats sharing
+            the upload (upload_flight) can report the same reason
+    """
+    video_file = None
     status_msg = None
     chat_id = update.effective_chat.id
+    reservation = resource_governor.reservation()
     
     try:
         # Send processing message (use chat.send_message since original message is deleted)
         status_msg = await update.effective_chat.send_message("⬇️ Downloading video...")
         
-        # Create temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-        temp_path = temp_file.name
-        temp_file.close()
-        
-        # Download video
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(video_url, headers=headers, stream=True, timeout=300)
-        response.raise_for_status()
-        
-        # Save video to temp file
-        with open(temp_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        # Check file size (Telegram limit is 50MB for bots)
-        file_size = os.path.getsize(temp_path)
+        # Download video (or reuse the copy in the disk cache) while fetching the thumbnail
+        (video_file, file_size, content_hash), thumbnail = await asyncio.gather(
+            fetch_video(video_url, reservation), fetch_thumbnail(thumbnail_url)
+        )
         file_size_mb = file_size / (1024 * 1024)
         
-        if file_size > 50 * 1024 * 1024:  # 50MB
-            if status_msg:
-                await status_msg.edit_text(f"❌ Video file is too large ({file_size_mb:.2f}MB). Max size: 50MB")
-            return
-        
         # Log file size for debugging
         logger.info(f"Video file size: {file_size_mb:.2f}MB")
         
+        # Same bytes already uploaded under another URL - skip the upload
+        file_id = await file_id_cache.get_by_hash_async(content_hash)
+        if file_id and await send_cached_video(file_id, video_url, update, caption):
+            await file_id_cache.set_async(video_url, file_id, content_hash)
+            if status_msg:
+                await status_msg.delete()
+            return file_id
+        
         # Update status
         if status_msg:
             await status_msg.edit_text("⬆️ Uploading video...")
         
         # Upload video to Telegram (timeouts handled at application level)
         # Use InputFile to ensure proper video format with audio preserved
-        with open(temp_path, 'rb') as video_file:
-            video_input = InputFile(
-                video_file,
-                filename='video.mp4'
-            )
-            await update.effective_chat.send_video(
+        # Duration, size and thumbnail let clients show a preview before Telegram processed the file
+        attributes = await _video_attributes(video_file, thumbnail)
+        video_input = _video_input(video_file)
+        with metrics.timed('upload'):
+            message = await update.effective_chat.send_video(
                 video=video_input,
                 caption=caption,
-                supports_streaming=True
+                supports_streaming=True,
+                **attributes
             )
+        metrics.stage_bytes.inc(file_size, stage='upload')
+        
+        # Remember the file_id so the next request for this video costs no upload
+        sent = message.video or message.document
+        if sent:
+            await file_id_cache.set_async(video_url, sent.file_id, content_hash)
         
         # Delete status message
         if status_msg:
             await status_msg.delete()
         logger.info(f"Video uploaded successfully: {video_url}")
+        return sent.file_id if sent else None
         
-    except requests.exceptions.RequestException as e:
+    except VideoTooLarge as e:
+        error_msg = f"❌ Video file is too large ({e.size / (1024 * 1024):.2f}MB). Max size: {e.limit / (1024 * 1024):.0f}MB"
+        if status_msg:
+            await status_msg.edit_text(error_msg)
+        else:
+            await update.effective_chat.send_message(error_msg)
+        logger.info(f"Video rejected as too large ({e.size} bytes): {video_url}")
+        retryable = False
+    except BudgetExhausted as e:
+        error_msg = "❌ Too many videos in progress right now, please try again later."
+        if status_msg:
+            await status_msg.edit_text(error_msg)
+        else:
+            await update.effective_chat.send_message(error_msg)
+        logger.warning(f"Video rejected, {str(e)}: {video_url}")
+        retryable = True
+    except (httpx.HTTPError, DownloadError) as e:
         error_msg = f"❌ Error downloading video: {str(e)}"
         if status_msg:
             await status_msg.edit_text(error_msg)
         else:
             await update.effective_chat.send_message(error_msg)
         logger.error(f"Error downloading video: {str(e)}")
+        # A dead link stays dead
+        retryable = not (isinstance(e, httpx.HTTPStatusError) and e.response.status_code not in TRANSIENT_STATUS)
     except Exception as e:
         error_type = type(e).__name__
         error_msg = f"❌ Error uploading video: {error_type}: {str(e)}"
@@ -105,13 +502,13 @@ async def download_and_upload_video(video_url: str, update: Update, caption: str
         else:
             await update.effective_chat.send_message(error_msg)
         logger.error(f"Error uploading video: {error_type}: {str(e)}", exc_info=True)
+        retryable = True
     finally:
-        # Clean up temp file
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+        # Release the file (removes the temp file of a video not kept in the cache, if any)
+        if video_file:
+            video_cache.discard(video_file)
+        reservation.release()
+    raise UploadFailed(error_msg, retryable)
 
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -121,7 +518,7 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not is_allowed_group(chat_id):
         return
     
-    stats = get_bot_stats()
+    stats = await get_bot_stats()
     if stats:
         response = f"🤖 **Bot Status**\n\n"
         response += f"👥 Total Admins: {stats['total_admins']}\n"
@@ -132,6 +529,60 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         response += f"❌ MongoDB: Not Connected\n"
         response += f"🔄 Bot: Active"
     
+    queue_stats = await job_queue.stats_async() if use_job_queue else job_scheduler.stats()
+    queued = 'unknown' if queue_stats['queued'] is None else queue_stats['queued']
+    response += f"\n📥 Queue: {queued} queued, {queue_stats['running']}/{queue_stats['workers']} running, "
+    response += f"avg wait {queue_stats['avg_wait']:.1f}s, oldest waiting {queue_stats['oldest_wait']:.1f}s"
+    
+    response += f"\n🔗 Coalesced: {scrape_flight.coalesced} scrapes, {upload_flight.coalesced} uploads"
+    cache_stats = metadata_cache.stats()
+    response += f"\n🗂 Metadata cache: {cache_stats['size']}/{cache_stats['maxsize']} entries, "
+    response += f"{cache_stats['memory_hits']} memory hits, {cache_stats['db_hits']} db hits, {cache_stats['misses']} misses"
+    negative_stats = negative_cache.stats()
+    response += f"\n🚫 Negative cache: {negative_stats['size']}/{negative_stats['maxsize']} entries, "
+    response += f"{negative_stats['memory_hits'] + negative_stats['db_hits']} hits"
+    file_id_stats = file_id_cache.stats()
+    response += f"\n🎞 File ID cache: {file_id_stats['hits']} hits, {file_id_stats['misses']} misses"
+    if video_cache.enabled:
+        disk_stats = video_cache.stats()
+        response += f"\n💾 Video cache: {disk_stats['files']} videos, {disk_stats['bytes'] / (1024 * 1024):.0f}/"
+        response += f"{disk_stats['max_bytes'] / (1024 * 1024):.0f}MB, {disk_stats['hits']} hits, {disk_stats['evictions']} evictions"
+    
+    if cache_warmer.enabled:
+        warmer_stats = cache_warmer.stats()
+        response += f"\n🔥 Warmer: {warmer_stats['warmed']} posts scraped in {warmer_stats['polls']} polls, "
+        response += f"{warmer_stats['prefetched']} videos ({warmer_stats['prefetched_bytes'] / (1024 * 1024):.0f}MB) prefetched"
+    
+    budget = resource_governor.stats()
+    response += f"\n🧮 Budget: memory {budget['memory_used'] / (1024 * 1024):.0f}/"
+    response += f"{budget['memory_limit'] / (1024 * 1024):.0f}MB, disk {budget['disk_used'] / (1024 * 1024):.0f}/"
+    response += f"{budget['disk_limit'] / (1024 * 1024):.0f}MB, {budget['waiting']} waiting, {budget['rejected']} rejected"
+    
+    # Names from outside (hosts, error types, startup milestones) are escaped: a stray _ or *
+    # would open a Markdown entity that never closes and Telegram would reject the whole reply
+    for host, host_stats in origin_limiter.stats().items():
+        response += f"\n🌐 {escape_markdown(host)}: {host_stats['active']}/{host_stats['limit']} in flight, "
+        response += f"{host_stats['waiting']} waiting, {host_stats['throttled']} throttled"
+    
+    layouts = {labels['layout']: int(count) for labels, count in mp4_layouts.items()}
+    if layouts:
+        response += f"\n🎬 MP4 layout: {layouts.get('faststart', 0)} faststart, "
+        response += f"{layouts.get('moov_at_end', 0)} moov at end, {layouts.get('unparsed', 0)} unparsed"
+    
+    response += "\n⏱ Stages (count, avg, p95):"
+    for stage in ('check', 'fetch', 'parse', 'download', 'upload'):
+        summary = metrics.stage_seconds.summary(stage=stage)
+        if summary['count']:
+            response += f"\n  {stage}: {summary['count']}, {summary['avg']:.2f}s, {summary['p95']:.2f}s"
+    response += f"\n🚀 Throughput: download {metrics.throughput('download') / (1024 * 1024):.1f}MB/s, "
+    response += f"upload {metrics.throughput('upload') / (1024 * 1024):.1f}MB/s"
+    error_counts = metrics.errors.items()
+    if error_counts:
+        response += "\n⚠️ Errors: " + ", ".join(
+            escape_markdown(f"{labels['stage']} {labels['type']}") + f" x{int(count)}" for labels, count in error_counts
+        )
+    response += f"\n🕐 Startup: {escape_markdown(startup.report())}"
+    
     await update.message.reply_text(response, parse_mode='Markdown')
 
 
@@ -149,12 +600,12 @@ async def randi(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         
         # Check if current user is admin
         current_user_id = update.effective_user.id
-        if not is_admin(current_user_id):
+        if not await is_admin(current_user_id):
             await update.message.reply_text("❌ Only admins can promote users.")
             return
         
         # Add admin
-        if add_admin(target_user_id):
+        if await add_admin(target_user_id):
             await update.message.reply_text(f"✅ {target_user.first_name} has been promoted to admin!")
         else:
             await update.message.reply_text("❌ Failed to promote user. Check MongoDB connection.")
@@ -163,15 +614,15 @@ async def randi(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         current_user_id = update.effective_user.id
         
         # Check if current user is already admin
-        if is_admin(current_user_id):
+        if await is_admin(current_user_id):
             await update.message.reply_text("✅ You are already an admin!")
             return
         
         # Check if any admin exists to authorize
-        admins = get_admins()
+        admins = await get_admins()
         if not admins:
             # First user becomes admin
-            if add_admin(current_user_id):
+            if await add_admin(current_user_id):
                 await update.message.reply_text("✅ You have been promoted to admin!")
             else:
                 await update.message.reply_text("❌ Failed to promote. Check MongoDB connection.")
@@ -191,7 +642,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     # Check if user is admin
     user_id = update.effective_user.id
-    if not is_admin(user_id):
+    if not await is_admin(user_id):
         # Delete user's message first
         try:
             await update.message.delete()
@@ -216,17 +667,38 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     except Exception as e:
         logger.warning(f"Could not delete user message: {str(e)}")
     
-    # Check each URL found in the message
-    for url in urls:
-        # Only process viralkand.com URLs
-        if 'viralkand.com' in url.lower():
-            result = validate_viralkand(url)
+    # Hand the scrape/download/upload to the job scheduler so the handler returns at once
+    # (or to the MongoDB queue, for whichever worker replica claims it first)
+    try:
+        if use_job_queue:
+            position = await job_queue.submit(chat_id, {'urls': urls, 'update': update.to_dict()})
         else:
-            # Unknown domain
-            await update.effective_chat.send_message("invalid")
+            position = await job_scheduler.submit(chat_id, lambda: process_urls(urls, update))
+    except QueueFull:
+        await update.effective_chat.send_message("❌ Too many videos in progress. Please try again later.")
+        logger.warning(f"Job queue full, rejected links from chat {chat_id}")
+        return
+    
+    if position:
+        await update.effective_chat.send_message(f"⏳ Queued, position {position}")
+
+
+async def process_urls(urls: list, update: Update) -> None:
+    """Validate every link from a message concurrently and send their videos (runs as a scheduled job)"""
+    # The same link posted twice in one message is handled once
+    urls = list(dict.fromkeys(urls))
+    
+    # Only viralkand.com URLs are processed
+    viralkand_urls = [url for url in urls if 'viralkand.com' in url.lower()]
+    invalid = len(urls) - len(viralkand_urls)
+    for url in urls:
+        if url not in viralkand_urls:
             logger.info(f"Unknown domain: {url}")
-            break
-        
+    
+    results = await asyncio.gather(*(validate_viralkand(url) for url in viralkand_urls))
+    
+    videos = {}
+    for url, result in zip(viralkand_urls, results):
         # Log result for debugging
         logger.info(f"URL validation result for {url}: valid={result.get('valid')}, exists={result.get('exists')}, video_url={result.get('metadata', {}).get('video_url')}")
         
@@ -241,38 +713,342 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 if metadata.get('title'):
                     caption_parts.append(f"📌 {metadata['title']}")
                 
-                caption = "\n".join(caption_parts) if caption_parts else None
-                
-                # Download and upload video
-                await download_and_upload_video(video_url, update, caption)
-                logger.info(f"Video URL extracted and uploaded: {video_url}")
+                videos.setdefault(video_url, ("\n".join(caption_parts) if caption_parts else None, metadata.get('image')))
             else:
                 # No video URL found
-                await update.effective_chat.send_message("invalid")
+                invalid += 1
                 logger.warning(f"Valid URL but no video found: {url}. Metadata: {metadata}")
-            break  # Only process first valid URL
         else:
             # Invalid URL or doesn't exist
-            await update.effective_chat.send_message("invalid")
+            invalid += 1
             logger.warning(f"Invalid URL or not accessible: {url}. valid={result.get('valid')}, exists={result.get('exists')}, message={result.get('message')}")
-            break
+    
+    if invalid:
+        await update.effective_chat.send_message("invalid" if len(urls) == 1 else f"invalid ({invalid} of {len(urls)} links)")
+    
+    if len(videos) == 1:
+        # Download and upload video
+        video_url, (caption, image) = next(iter(videos.items()))
+        await download_and_upload_video(video_url, update, caption, image)
+        logger.info(f"Video URL extracted and uploaded: {video_url}")
+    elif videos:
+        # Several videos go out as media groups (up to 10 per album)
+        items = [(video_url, caption, image) for video_url, (caption, image) in videos.items()]
+        for start in range(0, len(items), MediaGroupLimit.MAX_MEDIA_LENGTH):
+            await send_video_group(items[start:start + MediaGroupLimit.MAX_MEDIA_LENGTH], update)
+
+
+async def send_video_group(videos: list, update: Update) -> None:
+    """
+    Send up to 10 videos as one album
+    
+    videos holds (video_url, caption, thumbnail_url) tuples. Videos already
+    uploaded are referenced by file_id; the others are downloaded (with their
+    thumbnails) concurrently and uploaded in the same sendMediaGroup request.
+    Videos that fail to download are reported and left out of the album.
+    Videos that do not fit the memory/disk budget next to the others are
+    sent one by one once the album is out and its budget released.
+    
+    Uploads are coalesced with other chats per video_url (upload_flight):
+    a video another chat is uploading is sent by its file_id once that is
+    done, and chats asking for a video this album uploads wait for it.
+    """
+    deferred = []
+    try:
+        await _send_album(videos, update, deferred)
+    finally:
+        # Deferred videos were never part of the album, whatever happened to it (unless the job was cancelled)
+        if not asyncio.current_task().cancelling():
+            for video_url, caption, thumbnail_url in deferred:
+                await download_and_upload_video(video_url, update, caption, thumbnail_url)
+
+
+async def _send_album(videos: list, update: Update, deferred: list) -> None:
+    """Send an album as described in send_video_group, adding the videos left out for lack of budget to deferred"""
+    chat = update.effective_chat
+    file_ids = list(await asyncio.gather(*(file_id_cache.get_async(video_url) for video_url, _, _ in videos)))
+    downloads = {}
+    thumbnails = {}
+    status_msg = None
+    reservation = resource_governor.reservation()
+    claimed = []
+    
+    async def no_upload():
+        # Only waits for another chat's upload; if it already ended, the video is downloaded here
+        return None
+    
+    def land_uploads():
+        # Hand the album's file_ids (None where it failed) to the chats waiting for them
+        while claimed:
+            i = claimed.pop()
+            upload_flight.finish(videos[i][0], file_ids[i])
+    
+    try:
+        # Videos another chat is uploading right now: wait for their file_id instead of downloading them again
+        inflight = [i for i, file_id in enumerate(file_ids) if not file_id and videos[i][0] in upload_flight]
+        shared = await asyncio.gather(*(upload_flight.do(videos[i][0], no_upload) for i in inflight),
+                                      return_exceptions=True)
+        dropped = set()
+        for i, result in zip(inflight, shared):
+            if isinstance(result, UploadFailed) and not result.retryable:
+                # Would fail here the same way (too large, dead link): report it and leave it out
+                await chat.send_message(result.message)
+                dropped.add(i)
+            elif isinstance(result, BaseException):
+                # Worth a try of our own
+                continue
+            else:
+                file_ids[i] = result[0]
+        
+        missing = [i for i, file_id in enumerate(file_ids) if not file_id and i not in dropped]
+        if missing:
+            # Room for the whole album is reserved in one go: holding part of it while waiting
+            # for more could wait on bytes only this job holds
+            needs = await asyncio.gather(*(_video_needs(videos[i][0]) for i in missing), return_exceptions=True)
+            failed = [(i, need) for i, need in zip(missing, needs) if isinstance(need, BaseException)]
+            probed = [(i, need) for i, need in zip(missing, needs) if not isinstance(need, BaseException)]
+            picked = resource_governor.admit([need for _, need in probed])
+            deferred += [videos[i] for k, (i, _) in enumerate(probed) if k not in picked]
+            missing = [probed[k][0] for k in picked]
+            # Chats asking for these videos meanwhile wait for the album's upload
+            claimed = [i for i in missing if upload_flight.claim(videos[i][0]) is not None]
+            total = {}
+            for k in picked:
+                for resource, size in probed[k][1].items():
+                    total[resource] = total.get(resource, 0) + size
+            
+            async def fetch_all():
+                try:
+                    await reservation.reserve(**total)
+                except BudgetExhausted as e:
+                    return [e] * len(missing)
+                return await asyncio.gather(*(fetch_video(videos[i][0], None) for i in missing), return_exceptions=True)
+            
+            if missing:
+                status_msg = await chat.send_message(f"⬇️ Downloading {len(missing)} videos...")
+            results, fetched = await asyncio.gather(
+                fetch_all(), asyncio.gather(*(fetch_thumbnail(videos[i][2]) for i in missing))
+            )
+            thumbnails = dict(zip(missing, fetched))
+            for i, result in failed + list(zip(missing, results)):
+                video_url = videos[i][0]
+                if isinstance(result, VideoTooLarge):
+                    await chat.send_message(f"❌ Video file is too large ({result.size / (1024 * 1024):.2f}MB). Max size: {result.limit / (1024 * 1024):.0f}MB")
+                    logger.info(f"Video rejected as too large ({result.size} bytes): {video_url}")
+                elif isinstance(result, BudgetExhausted):
+                    await chat.send_message("❌ Too many videos in progress right now, please try again later.")
+                    logger.warning(f"Video rejected, {str(result)}: {video_url}")
+                elif isinstance(result, BaseException):
+                    await chat.send_message(f"❌ Error downloading video: {str(result)}")
+                    logger.error(f"Error downloading video {video_url}: {type(result).__name__}: {str(result)}")
+                else:
+                    # Same bytes already uploaded under another URL - reference them instead
+                    video_file, file_size, content_hash = result
+                    file_id = await file_id_cache.get_by_hash_async(content_hash)
+                    if file_id:
+                        video_cache.discard(video_file)
+                        file_ids[i] = file_id
+                        await file_id_cache.set_async(video_url, file_id, content_hash)
+                    else:
+                        downloads[i] = result
+        
+        included = [i for i in range(len(videos)) if file_ids[i] or i in downloads]
+        if not included:
+            return
+        if status_msg and downloads:
+            await status_msg.edit_text(f"⬆️ Uploading {len(downloads)} videos...")
+        
+        attributes = {i: await _video_attributes(downloads[i][0], thumbnails.get(i)) for i in downloads}
+        
+        # Albums attach each upload as its own part of the multipart request
+        sources = [
+            _video_input(downloads[i][0], f'video{i}.mp4', attach=len(included) > 1) if i in downloads else file_ids[i]
+            for i in included
+        ]
+        
+        try:
+            with metrics.timed('upload'):
+                if len(sources) == 1:
+                    messages = [await chat.send_video(
+                        video=sources[0], caption=videos[included[0]][1], supports_streaming=True,
+                        **attributes.get(included[0], {})
+                    )]
+                else:
+                    messages = await chat.send_media_group(media=[
+                        InputMediaVideo(media=source, caption=videos[i][1], supports_streaming=True,
+                                        **attributes.get(i, {}))
+                        for i, source in zip(included, sources)
+                    ])
+        except BadRequest as e:
+            # A cached file_id in the album was rejected - fall back to one video at a time,
+            # which finds and drops the stale file_id
+            logger.warning(f"Media group rejected, sending videos one by one: {str(e)}")
+            # Free the album's downloads first, the single uploads reserve their own room
+            for video_file, _, _ in downloads.values():
+                video_cache.discard(video_file)
+            downloads = {}
+            reservation.release()
+            land_uploads()
+            for i in included:
+                await download_and_upload_video(videos[i][0], update, videos[i][1], videos[i][2])
+            return
+        except Exception as e:
+            # Timeouts, network errors, flood waits: the status message goes away below, so reply anew
+            error_type = type(e).__name__
+            await chat.send_message(f"❌ Error uploading video: {error_type}: {str(e)}")
+            logger.error(f"Error uploading album: {error_type}: {str(e)}", exc_info=True)
+            return
+        metrics.stage_bytes.inc(sum(downloads[i][1] for i in downloads), stage='upload')
+        
+        # Remember the new file_ids so the next request for these videos costs no upload
+        for i, message in zip(included, messages):
+            sent = message.video or message.document
+            if i in downloads and sent:
+                file_ids[i] = sent.file_id
+                await file_id_cache.set_async(videos[i][0], sent.file_id, downloads[i][2])
+        logger.info(f"Sent album of {len(messages)} videos ({len(downloads)} uploaded)")
+    finally:
+        if status_msg:
+            try:
+                await status_msg.delete()
+            except Exception as e:
+                logger.warning(f"Could not delete status message: {str(e)}")
+        # Release the files (removes temp files of videos not kept in the cache, if any)
+        for video_file, _, _ in downloads.values():
+            video_cache.discard(video_file)
+        reservation.release()
+        land_uploads()
+
+
+async def run_queued_job(application: Application, payload: dict) -> None:
+    """Run a job claimed from the MongoDB queue (the update is rebuilt for this bot)"""
+    update = Update.de_json(payload['update'], application.bot)
+    await process_urls(payload['urls'], update)
+
+
+async def start_metrics_server() -> None:
+    """Serve /metrics on METRICS_PORT (a busy port is logged, not fatal)"""
+    global metrics_server
+    if not METRICS_PORT:
+        return
+    try:
+        metrics_server = await metrics.start_server(METRICS_LISTEN, METRICS_PORT)
+    except OSError as e:
+        logger.error(f"Could not start metrics server on port {METRICS_PORT}: {str(e)}")
+
+
+async def connect_database() -> None:
+    """Connect to MongoDB in the background (admins fall back to config and caches to memory until then)"""
+    with startup.phase('database connect'):
+        connected = await connect_mongodb_async()
+    if connected:
+        startup.mark('database')
+        logger.info(f"Startup: {startup.report()}")
+    else:
+        logger.warning("MongoDB connection failed. Using config file for admins.")
+
+
+async def track_first_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Log the startup report when the first update arrives (time-to-first-update)"""
+    if startup.mark('first_update'):
+        logger.info(f"Startup: {startup.report()}")
+
+
+async def post_init(application: Application) -> None:
+    """Start background workers once the event loop is running"""
+    global connect_task
+    await start_metrics_server()
+    if not use_job_queue:
+        # Nothing has to wait for MongoDB here, so start serving right away
+        connect_task = asyncio.create_task(connect_database())
+        await job_scheduler.start()
+    elif BOT_ROLE == 'all':
+        await job_queue.start(lambda payload: run_queued_job(application, payload))
+    if not use_job_queue or BOT_ROLE == 'all':
+        # Only where videos are processed, which is where the warmed caches are read
+        await cache_warmer.start()
+    startup.mark('ready')
+    logger.info(f"Startup: {startup.report()}")
+
+
+async def post_shutdown(application: Application) -> None:
+    """Release shared resources when the bot stops"""
+    if connect_task and not connect_task.done():
+        connect_task.cancel()
+    await cache_warmer.stop()
+    await job_scheduler.stop()
+    await job_queue.stop()
+    if metrics_server:
+        metrics_server.close()
+    await close_async_client()
+
+
+async def run_worker(application: Application) -> None:
+    """Process jobs from the MongoDB queue without receiving any updates (BOT_ROLE=worker)"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    async with application:
+        await start_metrics_server()
+        await job_queue.start(lambda payload: run_queued_job(application, payload))
+        await cache_warmer.start()
+        logger.info("Worker is running...")
+        await stop.wait()
+        await post_shutdown(application)
 
 
 def main() -> None:
     """Start the bot"""
-    # Connect to MongoDB
-    if not connect_mongodb():
-        logger.warning("MongoDB connection failed. Using config file for admins.")
+    global use_job_queue
     
-    # Create application with increased timeouts
+    # The MongoDB job queue needs the connection up front, otherwise post_init connects in the background
+    use_job_queue = JOB_BACKEND == 'mongodb' or BOT_ROLE == 'worker'
+    if use_job_queue:
+        with startup.phase('database connect'):
+            connected = connect_mongodb()
+        if connected:
+            startup.mark('database')
+        else:
+            logger.warning("MongoDB connection failed. Using config file for admins.")
+            if BOT_ROLE == 'worker':
+                logger.error("Workers need MongoDB for the job queue. Exiting.")
+                return
+            logger.error("The mongodb job backend needs MongoDB. Processing jobs in this process.")
+            use_job_queue = False
+    
+    # Create application with increased timeouts. A local Bot API server gets only a file
+    # path to write, but answers once it has uploaded the (up to 2GB) video to Telegram
     request = HTTPXRequest(
         connection_pool_size=8,
-        read_timeout=600,
-        write_timeout=600,
+        read_timeout=LOCAL_BOT_API_TIMEOUT if local_mode else 600,
+        write_timeout=60 if local_mode else 600,
         connect_timeout=60,
         pool_timeout=60
     )
-    application = Application.builder().token(BOT_TOKEN).request(request).build()
+    # concurrent_updates lets a slow link in one chat not hold up the others
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(request)
+        .concurrent_updates(True)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if local_mode:
+        logger.info(f"Using local Bot API server at {LOCAL_BOT_API_URL}")
+        builder = builder.base_url(LOCAL_BOT_API_URL).base_file_url(LOCAL_BOT_API_FILE_URL).local_mode(True)
+    with startup.phase('application build'):
+        application = builder.build()
+    
+    # Worker replicas only run jobs enqueued by the ingress process
+    if use_job_queue and BOT_ROLE == 'worker':
+        asyncio.run(run_worker(application))
+        return
+    
+    # Runs before the other handlers (group -1) without consuming the update
+    application.add_handler(TypeHandler(Update, track_first_update), group=-1)
     
     # Register command handlers
     application.add_handler(CommandHandler("status", status))
@@ -282,8 +1058,23 @@ def main() -> None:
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
     # Start the bot
-    logger.info("Bot is starting...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == 'webhook' and not WEBHOOK_URL:
+        logger.error("BOT_MODE is webhook but WEBHOOK_URL is not set. Falling back to polling.")
+    
+    if BOT_MODE == 'webhook' and WEBHOOK_URL:
+        # Embedded web server on $PORT, as expected by Render/Koyeb/Fly web services
+        logger.info(f"Bot is starting (webhook on {WEBHOOK_LISTEN}:{PORT}{WEBHOOK_PATH})...")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=PORT,
+            url_path=WEBHOOK_PATH.lstrip('/'),
+            webhook_url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=ALLOWED_UPDATES
+        )
+    else:
+        logger.info("Bot is starting...")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
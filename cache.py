@@ -0,0 +1,306 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+import database
+from config import (
+    METADATA_CACHE_SIZE, METADATA_CACHE_TTL, FILE_ID_CACHE_SIZE, NEGATIVE_CACHE_SIZE, NEGATIVE_CACHE_TTL_NOT_FOUND,
+    NEGATIVE_CACHE_TTL_FORBIDDEN, NEGATIVE_CACHE_TTL_ERROR, NEGATIVE_CACHE_TTL_NO_VIDEO, NEGATIVE_CACHE_PERSIST
+)
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that only track where a link was shared and never change the page
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid',
+    'ref', 'ref_src', 'ref_url', 'source', '_ga', 'si', 'amp'
+}
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize a URL so that trivially different links share one cache key
+    
+    Lowercases scheme and host, drops "www.", the fragment, a trailing slash
+    and tracking query parameters (utm_*, fbclid, ...), and sorts what is left.
+    
+    Args:
+        url: The URL to canonicalize
+        
+    Returns:
+        str: The canonical form of the URL
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    if scheme == 'http':
+        scheme = 'https'
+    host = parsed.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    path = parsed.path.rstrip('/') or '/'
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS
+    )
+    return urlunparse((scheme, host, path, '', urlencode(query), ''))
+
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries expire after a TTL"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a value, counting the lookup as a hit or a miss"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+    
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def delete(self, key: str) -> None:
+        """Remove a key if present"""
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self) -> None:
+        """Remove every entry"""
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def stats(self) -> Dict[str, int]:
+        """Get size and hit/miss counters"""
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class MetadataCache:
+    """
+    Two-tier cache for validate_and_check_url results
+    
+    Tier one is a TTLCache in this process, tier two the MongoDB metadata_cache
+    collection (shared across replicas, expired by a TTL index). Entries are
+    keyed by canonicalize_url so reposted variants of a link share one entry.
+    """
+    
+    collection = 'metadata_cache'
+    
+    def __init__(self, maxsize: int = METADATA_CACHE_SIZE, ttl: float = METADATA_CACHE_TTL, persist: bool = True):
+        self.ttl = ttl
+        self.persist = persist
+        self.memory = TTLCache(maxsize, ttl)
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _entry(result: Dict) -> Dict:
+        """Keep the parts of a result that do not depend on the exact URL posted"""
+        return {
+            'exists': result['exists'],
+            'status_code': result['status_code'],
+            'message': result['message'],
+            'metadata': dict(result['metadata'])
+        }
+    
+    @staticmethod
+    def _result(url: str, entry: Dict) -> Dict:
+        """Rebuild a validate_and_check_url result for the URL that was posted"""
+        return {
+            'valid': True,
+            'exists': entry['exists'],
+            'status_code': entry['status_code'],
+            'message': entry['message'],
+            'url': url,
+            'metadata': dict(entry['metadata'])
+        }
+    
+    def _lookup_memory(self, key: str) -> Optional[Dict]:
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory_hits += 1
+        return entry
+    
+    def _ttl(self, entry: Dict) -> float:
+        """Seconds an entry stays cached"""
+        return self.ttl
+    
+    def _record_db(self, key: str, stored: Optional[Tuple[Dict, float]]) -> Optional[Dict]:
+        if stored is None:
+            self.misses += 1
+            return None
+        self.db_hits += 1
+        entry, expires_in = stored
+        # Only for what is left of its lifetime in MongoDB, not a fresh TTL
+        self.memory.set(key, entry, min(self._ttl(entry), expires_in))
+        return entry
+    
+    def get(self, url: str) -> Optional[Dict]:
+        """Get a cached result for url, or None"""
+        key = canonicalize_url(url)
+        entry = self._lookup_memory(key)
+        if entry is None:
+            stored = database.get_cached_metadata(key, self.collection) if self.persist else None
+            entry = self._record_db(key, stored)
+        return self._result(url, entry) if entry else None
+    
+    async def get_async(self, url: str) -> Optional[Dict]:
+        """Async version of get, the MongoDB lookup runs off the event loop"""
+        key = canonicalize_url(url)
+        entry = self._lookup_memory(key)
+        if entry is None:
+            stored = await database.get_cached_metadata_async(key, self.collection) if self.persist else None
+            entry = self._record_db(key, stored)
+        return self._result(url, entry) if entry else None
+    
+    def set(self, url: str, result: Dict) -> None:
+        """Cache a result in both tiers"""
+        key = canonicalize_url(url)
+        entry = self._entry(result)
+        ttl = self._ttl(entry)
+        self.memory.set(key, entry, ttl)
+        if self.persist:
+            database.save_cached_metadata(key, entry, ttl, self.collection)
+    
+    async def set_async(self, url: str, result: Dict) -> None:
+        """Async version of set"""
+        key = canonicalize_url(url)
+        entry = self._entry(result)
+        ttl = self._ttl(entry)
+        self.memory.set(key, entry, ttl)
+        if self.persist:
+            await database.save_cached_metadata_async(key, entry, ttl, self.collection)
+    
+    def stats(self) -> Dict[str, int]:
+        """Get hit/miss counters for both tiers"""
+        return {
+            'size': len(self.memory),
+            'maxsize': self.memory.maxsize,
+            'memory_hits': self.memory_hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses
+        }
+
+
+# Shared metadata cache used by kand.validate_and_check_url
+metadata_cache = MetadataCache()
+
+
+class NegativeCache(MetadataCache):
+    """
+    Short-lived cache of validate_and_check_url results with nothing to send
+    
+    Holds pages that do not exist, are forbidden, could not be reached or
+    have no video, each for a TTL matching how likely that is to change:
+    hours for 404/410, minutes for 403 and video-less pages, a minute for
+    timeouts, connection errors, 429 and 5xx. It has its own bounded memory
+    tier (and negative_cache collection when persisted), so spammed dead links
+    never push good entries out of the metadata cache.
+    """
+    
+    collection = 'negative_cache'
+    
+    def __init__(self, maxsize: int = NEGATIVE_CACHE_SIZE, persist: bool = NEGATIVE_CACHE_PERSIST):
+        super().__init__(maxsize, NEGATIVE_CACHE_TTL_NOT_FOUND, persist)
+    
+    @staticmethod
+    def is_negative(result: Dict) -> bool:
+        """Whether a result (with metadata extracted) has nothing to send"""
+        return not result['exists'] or not result['metadata'].get('video_url')
+    
+    def _ttl(self, entry: Dict) -> float:
+        status_code = entry['status_code']
+        if entry['exists']:
+            return NEGATIVE_CACHE_TTL_NO_VIDEO
+        if status_code in (404, 410):
+            return NEGATIVE_CACHE_TTL_NOT_FOUND
+        if status_code == 0 or status_code == 429 or status_code >= 500:
+            return NEGATIVE_CACHE_TTL_ERROR
+        return NEGATIVE_CACHE_TTL_FORBIDDEN
+
+
+# Shared negative cache consulted by kand.validate_and_check_url before any request
+negative_cache = NegativeCache()
+
+
+class FileIdCache:
+    """
+    Telegram file_id of every video already uploaded, keyed by video_url
+    
+    Backed by the MongoDB video_files collection, with an in-process LRU in
+    front. A content hash is stored alongside so the same bytes served from a
+    different URL can also be re-sent without uploading them again.
+    """
+    
+    def __init__(self, maxsize: int = FILE_ID_CACHE_SIZE):
+        self.memory = TTLCache(maxsize, float('inf'))
+        self.hits = 0
+        self.misses = 0
+    
+    async def get_async(self, video_url: str) -> Optional[str]:
+        """Get the file_id uploaded for video_url, or None"""
+        file_id = self.memory.get(video_url)
+        if file_id is None:
+            file_id = await database.get_video_file_id_async(video_url)
+            if file_id is not None:
+                self.memory.set(video_url, file_id)
+        if file_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return file_id
+    
+    async def get_by_hash_async(self, content_hash: str) -> Optional[str]:
+        """Get the file_id of any upload with the same content hash, or None"""
+        return await database.get_video_file_id_by_hash_async(content_hash)
+    
+    async def set_async(self, video_url: str, file_id: str, content_hash: Optional[str] = None) -> None:
+        """Remember the file_id Telegram returned for video_url"""
+        self.memory.set(video_url, file_id)
+        await database.save_video_file_id_async(video_url, file_id, content_hash)
+    
+    async def invalidate_async(self, video_url: str, file_id: str) -> None:
+        """Forget a file_id Telegram no longer accepts"""
+        self.memory.delete(video_url)
+        await database.delete_video_file_id_async(file_id)
+    
+    def stats(self) -> Dict[str, int]:
+        """Get hit/miss counters"""
+        return {
+            'size': len(self.memory),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+# Shared Telegram file_id cache used by bot.download_and_upload_video
+file_id_cache = FileIdCache()
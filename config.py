@@ -1,5 +1,6 @@
 import os
 import json
+import tempfile
 
 # Telegram Bot Configuration
 # Reads from environment variables first, falls back to hardcoded values for local development
@@ -27,6 +28,131 @@ except:
     # Fallback: try comma-separated
     GROUP_IDS = [int(x.strip()) for x in group_ids_str.split(",")] if group_ids_str else [-12345]
 
+# Update delivery: "polling" (default) or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Public HTTPS base URL Telegram posts updates to (Render sets RENDER_EXTERNAL_URL itself)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", os.getenv("RENDER_EXTERNAL_URL", ""))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Sent by Telegram in X-Telegram-Bot-Api-Secret-Token, requests without it are rejected
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8080"))
+
+# Prometheus-style metrics served at /metrics on METRICS_PORT (0 disables the endpoint)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "0.0.0.0")
+
 # MongoDB Configuration
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb+srv://#")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "viralkand_bot")
+# Connection pool size (also the number of threads running async database calls)
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "20"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+# Attempts per operation on transient network errors
+MONGODB_RETRIES = int(os.getenv("MONGODB_RETRIES", "3"))
+# Seconds between checks for admin changes made by other replicas
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "30"))
+
+# Outbound HTTP client pool (shared async client used for viralkand.com requests)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# Retries of origin requests (page fetches and video downloads) on connection errors,
+# timeouts and 408/425/429/5xx, with jittered exponential backoff
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "4"))  # downloads resume where they stopped
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.5"))  # seconds
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "10"))  # seconds
+# User-Agent sent with every request to viralkand.com and its video CDN
+HTTP_USER_AGENT = os.getenv(
+    "HTTP_USER_AGENT",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+)
+
+# Per-host limits for origin requests: a token bucket of ORIGIN_RATE requests/second
+# (bursts up to ORIGIN_BURST) and a concurrency limit that halves on 403/429/5xx and
+# timeouts and grows back while the host is healthy (between the MIN and MAX values)
+ORIGIN_RATE = float(os.getenv("ORIGIN_RATE", "10"))
+ORIGIN_BURST = float(os.getenv("ORIGIN_BURST", "20"))
+ORIGIN_CONCURRENCY = int(os.getenv("ORIGIN_CONCURRENCY", "8"))  # starting limit
+ORIGIN_MIN_CONCURRENCY = int(os.getenv("ORIGIN_MIN_CONCURRENCY", "1"))
+ORIGIN_MAX_CONCURRENCY = int(os.getenv("ORIGIN_MAX_CONCURRENCY", "32"))
+ORIGIN_MAX_RETRY_AFTER = float(os.getenv("ORIGIN_MAX_RETRY_AFTER", "60"))  # longest Retry-After honored, seconds
+
+# Metadata cache (in-process LRU in front of the MongoDB metadata_cache collection)
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", "1024"))
+METADATA_CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL", "21600"))  # seconds
+
+# Negative cache of links with nothing to send (dead, forbidden, unreachable or video-less pages),
+# kept apart from the metadata cache so spammed dead links cannot evict good entries.
+# TTLs in seconds depend on why the link failed; MongoDB persistence shares it across replicas
+NEGATIVE_CACHE_SIZE = int(os.getenv("NEGATIVE_CACHE_SIZE", "4096"))
+NEGATIVE_CACHE_TTL_NOT_FOUND = int(os.getenv("NEGATIVE_CACHE_TTL_NOT_FOUND", "21600"))  # 404, 410
+NEGATIVE_CACHE_TTL_FORBIDDEN = int(os.getenv("NEGATIVE_CACHE_TTL_FORBIDDEN", "600"))  # other 4xx
+NEGATIVE_CACHE_TTL_ERROR = int(os.getenv("NEGATIVE_CACHE_TTL_ERROR", "60"))  # timeouts, connection errors, 429, 5xx
+NEGATIVE_CACHE_TTL_NO_VIDEO = int(os.getenv("NEGATIVE_CACHE_TTL_NO_VIDEO", "1800"))  # page without contentURL
+NEGATIVE_CACHE_PERSIST = os.getenv("NEGATIVE_CACHE_PERSIST", "false").lower() in ("1", "true", "yes")
+
+# Telegram file_id cache (in-process LRU in front of the MongoDB video_files collection)
+FILE_ID_CACHE_SIZE = int(os.getenv("FILE_ID_CACHE_SIZE", "4096"))
+
+# Self-hosted Bot API server (https://github.com/tdlib/telegram-bot-api, run with --local),
+# e.g. "http://localhost:8081/bot". Uploads then hand it the path of the downloaded file
+# instead of its bytes, so it must be able to read VIDEO_CACHE_DIR (same host or shared volume)
+LOCAL_BOT_API_URL = os.getenv("LOCAL_BOT_API_URL", "")
+LOCAL_BOT_API_FILE_URL = os.getenv(
+    "LOCAL_BOT_API_FILE_URL", LOCAL_BOT_API_URL[:-len("bot")] + "file/bot" if LOCAL_BOT_API_URL.endswith("bot") else ""
+)
+# Seconds to wait for a send: the local server uploads the file to Telegram before it answers
+LOCAL_BOT_API_TIMEOUT = int(os.getenv("LOCAL_BOT_API_TIMEOUT", "3600"))
+
+# Video downloads
+# Telegram limit for bots: 50MB through the public Bot API, 2000MB through a local server
+MAX_VIDEO_SIZE = int(os.getenv("MAX_VIDEO_SIZE", str((2000 if LOCAL_BOT_API_URL else 50) * 1024 * 1024)))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", "65536"))
+# Concurrent byte ranges per video when the origin supports Range requests,
+# each at least DOWNLOAD_MIN_SEGMENT_SIZE bytes (smaller videos use one stream)
+DOWNLOAD_SEGMENTS = int(os.getenv("DOWNLOAD_SEGMENTS", "4"))
+DOWNLOAD_MIN_SEGMENT_SIZE = int(os.getenv("DOWNLOAD_MIN_SEGMENT_SIZE", str(4 * 1024 * 1024)))
+# Videos up to this size are buffered in memory, larger ones spill to a temp file
+DOWNLOAD_SPOOL_MAX_SIZE = int(os.getenv("DOWNLOAD_SPOOL_MAX_SIZE", str(16 * 1024 * 1024)))
+
+# On-disk video cache reused for upload retries and re-posts (0 disables it;
+# videos are then buffered in memory / a spooled temp file as above)
+VIDEO_CACHE_DIR = os.getenv("VIDEO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "viralkand-videos"))
+VIDEO_CACHE_SIZE = int(os.getenv("VIDEO_CACHE_SIZE", str(1024 * 1024 * 1024)))  # bytes
+
+# Cache warmer: polls viralkand.com's sitemap and/or RSS feeds (comma-separated URLs, empty
+# disables it) and scrapes new posts into the metadata cache while no live requests are being
+# served, so the first link to a post is answered without a scrape
+WARMER_FEED_URLS = [url.strip() for url in os.getenv("WARMER_FEED_URLS", "").split(",") if url.strip()]
+WARMER_INTERVAL = int(os.getenv("WARMER_INTERVAL", "900"))  # seconds between polls
+WARMER_MAX_ENTRIES = int(os.getenv("WARMER_MAX_ENTRIES", "20"))  # new posts scraped per poll, newest first
+WARMER_RATE = float(os.getenv("WARMER_RATE", "0.5"))  # scrapes per second at most
+# Bytes of new posts' videos downloaded into the video cache per poll (0 only scrapes)
+WARMER_PREFETCH_BYTES = int(os.getenv("WARMER_PREFETCH_BYTES", "0"))
+
+# Budget of bytes all video jobs in flight may hold (0 disables a limit): downloaded videos in
+# memory (spooled buffers, upload bodies) and on disk (temp files, downloads into the cache).
+# Jobs reserve their video's size before downloading it and wait up to RESOURCE_WAIT_TIMEOUT
+# seconds for room, then are rejected
+MEMORY_BUDGET = int(os.getenv("MEMORY_BUDGET", str(192 * 1024 * 1024)))
+DISK_BUDGET = int(os.getenv("DISK_BUDGET", str((4096 if LOCAL_BOT_API_URL else 1024) * 1024 * 1024)))
+RESOURCE_WAIT_TIMEOUT = float(os.getenv("RESOURCE_WAIT_TIMEOUT", "120"))
+
+# Video job scheduler
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  # videos processed at once overall
+JOB_PER_CHAT_LIMIT = int(os.getenv("JOB_PER_CHAT_LIMIT", "1"))  # videos processed at once per chat
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))  # further jobs are rejected
+
+# Distributed job queue (MongoDB jobs collection) for running workers on several nodes
+# JOB_BACKEND: "local" (in-process scheduler, default) or "mongodb"
+JOB_BACKEND = os.getenv("JOB_BACKEND", "local").lower()
+# BOT_ROLE with the mongodb backend: "all" (receive updates and process jobs),
+# "ingress" (only receive updates and enqueue) or "worker" (only process jobs)
+BOT_ROLE = os.getenv("BOT_ROLE", "all").lower()
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))  # re-delivered if not renewed in time
+JOB_HEARTBEAT_INTERVAL = int(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # idle workers check for jobs this often
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "86400"))  # seconds finished jobs are kept
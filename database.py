@@ -1,7 +1,15 @@
+import time
+import random
+import asyncio
 import logging
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
-from config import MONGODB_URI, MONGODB_DB_NAME, ADMIN_IDS
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pymongo import MongoClient, IndexModel, UpdateOne
+from pymongo.errors import AutoReconnect, ConnectionFailure, NetworkTimeout, ServerSelectionTimeoutError
+from config import (
+    MONGODB_URI, MONGODB_DB_NAME, ADMIN_IDS, ADMIN_CACHE_TTL,
+    MONGODB_MAX_POOL_SIZE, MONGODB_MIN_POOL_SIZE, MONGODB_RETRIES, JOB_RETENTION
+)
 
 logger = logging.getLogger(__name__)
 
@@ -9,25 +17,110 @@ logger = logging.getLogger(__name__)
 client = None
 db = None
 
+# Threads that run blocking pymongo calls for the async API (one per pooled connection)
+_executor = ThreadPoolExecutor(max_workers=MONGODB_MAX_POOL_SIZE, thread_name_prefix='mongodb')
+
+# In-memory admin set, refreshed from MongoDB when the admins version changes
+_admin_cache = None
+_admin_cache_version = None
+_admin_cache_checked_at = 0.0
+
+# Seconds operations fail right away after no server could be selected (the cluster is down)
+OUTAGE_BACKOFF = 30.0
+_outage_until = 0.0
+
+
+def _retry(operation, *args, **kwargs):
+    """
+    Run a MongoDB operation, retrying transient network failures with backoff
+    
+    A server selection timeout is not retried: it already waited
+    serverSelectionTimeoutMS for any server. It also opens a circuit breaker,
+    operations then fail right away for OUTAGE_BACKOFF seconds (callers fall
+    back as without MongoDB, lease queue workers log it and keep polling)
+    instead of each waiting for the timeout again.
+    """
+    global _outage_until
+    if time.monotonic() < _outage_until:
+        raise ServerSelectionTimeoutError("MongoDB unreachable, skipped during the outage backoff")
+    # At least one attempt, whatever MONGODB_RETRIES says
+    attempts = max(1, MONGODB_RETRIES)
+    for attempt in range(attempts):
+        try:
+            return operation(*args, **kwargs)
+        except ServerSelectionTimeoutError:
+            _outage_until = time.monotonic() + OUTAGE_BACKOFF
+            logger.warning(f"No MongoDB server available, skipping MongoDB for {OUTAGE_BACKOFF:.0f}s")
+            raise
+        except (AutoReconnect, NetworkTimeout) as e:
+            if attempt == attempts - 1:
+                raise
+            delay = min(2.0, 0.1 * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"Transient MongoDB error, retrying in {delay:.2f}s: {str(e)}")
+            time.sleep(delay)
+
+
+async def run_async(func, *args, **kwargs):
+    """
+    Run a blocking database function on the MongoDB thread pool
+    
+    Lets async handlers use any function in this module (or a custom one for
+    a new collection, see get_collection) without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, lambda: func(*args, **kwargs))
+
+
+def get_collection(name: str):
+    """Get a collection by name, or None if MongoDB is not connected"""
+    return db[name] if db is not None else None
+
 
 def connect_mongodb():
-    """Connect to MongoDB and initialize database"""
+    """
+    Connect to MongoDB and initialize database
+    
+    db stays None (everything falls back to config / no caching) until the
+    connection is up and the admin seed and indexes are in place, so this can
+    run in the background while the bot already serves updates.
+    """
     global client, db
     try:
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
+        client = MongoClient(
+            MONGODB_URI,
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=5000,
+            socketTimeoutMS=20000,
+            maxPoolSize=MONGODB_MAX_POOL_SIZE,
+            minPoolSize=MONGODB_MIN_POOL_SIZE,
+            maxIdleTimeMS=60000,
+            retryWrites=True,
+            retryReads=True
+        )
         # Test connection
         client.admin.command('ping')
-        db = client[MONGODB_DB_NAME]
+        database = client[MONGODB_DB_NAME]
         
-        # Initialize admins collection with default admin IDs
-        admins_collection = db['admins']
-        for admin_id in ADMIN_IDS:
-            admins_collection.update_one(
-                {'user_id': admin_id},
-                {'$set': {'user_id': admin_id, 'is_admin': True}},
-                upsert=True
-            )
+        # Initialize admins collection with default admin IDs (one round trip for all of them)
+        if ADMIN_IDS:
+            _retry(database['admins'].bulk_write, [
+                UpdateOne({'user_id': admin_id}, {'$set': {'user_id': admin_id, 'is_admin': True}}, upsert=True)
+                for admin_id in ADMIN_IDS
+            ], ordered=False)
+        
+        # Cached scrape results expire on their own via a TTL index
+        _retry(database['metadata_cache'].create_index, 'expires_at', expireAfterSeconds=0)
+        _retry(database['negative_cache'].create_index, 'expires_at', expireAfterSeconds=0)
+        _retry(database['video_files'].create_index, 'content_hash', sparse=True)
         
+        # Lease queue: claim scans by status, finished jobs are dropped after JOB_RETENTION
+        _retry(database['jobs'].create_indexes, [
+            IndexModel([('status', 1), ('created_at', 1)]),
+            IndexModel([('status', 1), ('lease_expires_at', 1)]),
+            IndexModel('finished_at', expireAfterSeconds=JOB_RETENTION)
+        ])
+        
+        db = database
         logger.info(f"Connected to MongoDB: {MONGODB_DB_NAME}")
         return True
     except (ConnectionFailure, ServerSelectionTimeoutError) as e:
@@ -38,23 +131,52 @@ def connect_mongodb():
         return False
 
 
-def get_admins():
-    """Get list of admin user IDs from MongoDB"""
-    global db
+def _admins_version():
+    """Get the admins version counter, bumped on every add/remove by any replica"""
+    doc = _retry(db['meta'].find_one, {'_id': 'admins'})
+    return doc['version'] if doc else 0
+
+
+def _bump_admins_version():
+    """Tell other replicas that the admins collection changed"""
+    _retry(db['meta'].update_one, {'_id': 'admins'}, {'$inc': {'version': 1}}, upsert=True)
+
+
+def _load_admins():
+    """Load the admin set from MongoDB, merged with config admins"""
+    global _admin_cache, _admin_cache_version, _admin_cache_checked_at
+    version = _admins_version()
+    admins = _retry(lambda: list(db['admins'].find({'is_admin': True}, {'user_id': 1})))
+    _admin_cache = {admin['user_id'] for admin in admins} | set(ADMIN_IDS)
+    _admin_cache_version = version
+    _admin_cache_checked_at = time.monotonic()
+
+
+def _get_admin_set():
+    """Get the cached admin set, re-checking MongoDB at most every ADMIN_CACHE_TTL seconds"""
+    global _admin_cache_checked_at
     if db is None:
         # Fallback to config if MongoDB not connected
-        return ADMIN_IDS
+        return set(ADMIN_IDS)
     
     try:
-        admins_collection = db['admins']
-        admins = admins_collection.find({'is_admin': True})
-        admin_ids = [admin['user_id'] for admin in admins]
-        # Merge with config admins to ensure they're included
-        all_admins = list(set(admin_ids + ADMIN_IDS))
-        return all_admins
+        if _admin_cache is None:
+            _load_admins()
+        elif time.monotonic() - _admin_cache_checked_at >= ADMIN_CACHE_TTL:
+            # Cheap version check; only reload the full set when it changed
+            if _admins_version() != _admin_cache_version:
+                _load_admins()
+            else:
+                _admin_cache_checked_at = time.monotonic()
+        return _admin_cache
     except Exception as e:
         logger.error(f"Error getting admins from MongoDB: {str(e)}")
-        return ADMIN_IDS
+        return _admin_cache if _admin_cache is not None else set(ADMIN_IDS)
+
+
+def get_admins():
+    """Get list of admin user IDs from MongoDB"""
+    return list(_get_admin_set())
 
 
 def add_admin(user_id: int) -> bool:
@@ -66,11 +188,15 @@ def add_admin(user_id: int) -> bool:
     
     try:
         admins_collection = db['admins']
-        result = admins_collection.update_one(
+        result = _retry(
+            admins_collection.update_one,
             {'user_id': user_id},
             {'$set': {'user_id': user_id, 'is_admin': True}},
             upsert=True
         )
+        _bump_admins_version()
+        if _admin_cache is not None:
+            _admin_cache.add(user_id)
         logger.info(f"Admin added: {user_id}")
         return True
     except Exception as e:
@@ -87,10 +213,14 @@ def remove_admin(user_id: int) -> bool:
     
     try:
         admins_collection = db['admins']
-        result = admins_collection.update_one(
+        result = _retry(
+            admins_collection.update_one,
             {'user_id': user_id},
             {'$set': {'is_admin': False}}
         )
+        _bump_admins_version()
+        if _admin_cache is not None and user_id not in ADMIN_IDS:
+            _admin_cache.discard(user_id)
         logger.info(f"Admin removed: {user_id}")
         return True
     except Exception as e:
@@ -99,9 +229,8 @@ def remove_admin(user_id: int) -> bool:
 
 
 def is_admin(user_id: int) -> bool:
-    """Check if user is admin"""
-    admins = get_admins()
-    return user_id in admins
+    """Check if user is admin (O(1) lookup in the cached admin set)"""
+    return user_id in _get_admin_set()
 
 
 def get_bot_stats():
@@ -112,7 +241,7 @@ def get_bot_stats():
     
     try:
         admins_collection = db['admins']
-        total_admins = admins_collection.count_documents({'is_admin': True})
+        total_admins = _retry(admins_collection.count_documents, {'is_admin': True})
         return {
             'total_admins': total_admins
         }
@@ -120,3 +249,173 @@ def get_bot_stats():
         logger.error(f"Error getting bot stats: {str(e)}")
         return None
 
+
+def get_cached_metadata(key: str, collection: str = 'metadata_cache'):
+    """
+    Get a cached scrape result by canonical URL from MongoDB (metadata_cache or negative_cache)
+    
+    Returns:
+        Tuple[dict, float]: (result, seconds until it expires), or None
+    """
+    global db
+    if db is None:
+        return None
+    
+    try:
+        now = datetime.now(timezone.utc)
+        doc = _retry(db[collection].find_one, {
+            '_id': key,
+            'expires_at': {'$gt': now}
+        })
+        if not doc:
+            return None
+        return doc['result'], (doc['expires_at'].replace(tzinfo=timezone.utc) - now).total_seconds()
+    except Exception as e:
+        logger.error(f"Error reading metadata cache: {str(e)}")
+        return None
+
+
+def save_cached_metadata(key: str, result: dict, ttl: int, collection: str = 'metadata_cache') -> bool:
+    """Store a scrape result by canonical URL in MongoDB for ttl seconds"""
+    global db
+    if db is None:
+        return False
+    
+    try:
+        _retry(
+            db[collection].update_one,
+            {'_id': key},
+            {'$set': {
+                'result': result,
+                'expires_at': datetime.now(timezone.utc) + timedelta(seconds=ttl)
+            }},
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Error writing metadata cache: {str(e)}")
+        return False
+
+
+def get_video_file_id(video_url: str):
+    """Get the Telegram file_id previously uploaded for a video URL"""
+    global db
+    if db is None:
+        return None
+    
+    try:
+        doc = _retry(db['video_files'].find_one, {'_id': video_url})
+        return doc['file_id'] if doc else None
+    except Exception as e:
+        logger.error(f"Error reading video file_id: {str(e)}")
+        return None
+
+
+def get_video_file_id_by_hash(content_hash: str):
+    """Get the Telegram file_id of any uploaded video with the given content hash"""
+    global db
+    if db is None:
+        return None
+    
+    try:
+        doc = _retry(db['video_files'].find_one, {'content_hash': content_hash})
+        return doc['file_id'] if doc else None
+    except Exception as e:
+        logger.error(f"Error reading video file_id: {str(e)}")
+        return None
+
+
+def save_video_file_id(video_url: str, file_id: str, content_hash: str = None) -> bool:
+    """Store the Telegram file_id returned for an uploaded video"""
+    global db
+    if db is None:
+        return False
+    
+    try:
+        fields = {'file_id': file_id, 'uploaded_at': datetime.now(timezone.utc)}
+        if content_hash:
+            fields['content_hash'] = content_hash
+        _retry(db['video_files'].update_one, {'_id': video_url}, {'$set': fields}, upsert=True)
+        return True
+    except Exception as e:
+        logger.error(f"Error saving video file_id: {str(e)}")
+        return False
+
+
+def delete_video_file_id(file_id: str) -> bool:
+    """Forget a stored file_id for every video using it (e.g. after Telegram rejected it)"""
+    global db
+    if db is None:
+        return False
+    
+    try:
+        _retry(db['video_files'].delete_many, {'file_id': file_id})
+        return True
+    except Exception as e:
+        logger.error(f"Error deleting video file_id: {str(e)}")
+        return False
+
+
+# Async versions of the functions above, for use from Telegram handlers.
+# Each runs on the MongoDB thread pool so a slow cluster never blocks the event loop.
+
+async def connect_mongodb_async():
+    """Async version of connect_mongodb"""
+    return await run_async(connect_mongodb)
+
+
+async def get_admins_async():
+    """Async version of get_admins"""
+    return await run_async(get_admins)
+
+
+async def add_admin_async(user_id: int) -> bool:
+    """Async version of add_admin"""
+    return await run_async(add_admin, user_id)
+
+
+async def remove_admin_async(user_id: int) -> bool:
+    """Async version of remove_admin"""
+    return await run_async(remove_admin, user_id)
+
+
+async def is_admin_async(user_id: int) -> bool:
+    """Async version of is_admin, answered in place while the admin set is fresh"""
+    if db is not None and _admin_cache is not None and time.monotonic() - _admin_cache_checked_at < ADMIN_CACHE_TTL:
+        return user_id in _admin_cache
+    return await run_async(is_admin, user_id)
+
+
+async def get_bot_stats_async():
+    """Async version of get_bot_stats"""
+    return await run_async(get_bot_stats)
+
+
+async def get_cached_metadata_async(key: str, collection: str = 'metadata_cache'):
+    """Async version of get_cached_metadata"""
+    return await run_async(get_cached_metadata, key, collection)
+
+
+async def save_cached_metadata_async(key: str, result: dict, ttl: int, collection: str = 'metadata_cache') -> bool:
+    """Async version of save_cached_metadata"""
+    return await run_async(save_cached_metadata, key, result, ttl, collection)
+
+
+async def get_video_file_id_async(video_url: str):
+    """Async version of get_video_file_id"""
+    return await run_async(get_video_file_id, video_url)
+
+
+async def get_video_file_id_by_hash_async(content_hash: str):
+    """Async version of get_video_file_id_by_hash"""
+    return await run_async(get_video_file_id_by_hash, content_hash)
+
+
+async def save_video_file_id_async(video_url: str, file_id: str, content_hash: str = None) -> bool:
+    """Async version of save_video_file_id"""
+    return await run_async(save_video_file_id, video_url, file_id, content_hash)
+
+
+async def delete_video_file_id_async(file_id: str) -> bool:
+    """Async version of delete_video_file_id"""
+    return await run_async(delete_video_file_id, file_id)
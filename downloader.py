@@ -0,0 +1,338 @@
+import io
+import os
+import re
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import BinaryIO, Optional, Tuple
+import httpx
+from kand import get_async_client
+from retry import backoff_delay, is_transient
+from config import (
+    MAX_VIDEO_SIZE, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_SEGMENTS, DOWNLOAD_MIN_SEGMENT_SIZE, DOWNLOAD_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+
+class VideoTooLarge(Exception):
+    """Raised when a video is (or turns out to be) larger than the allowed size"""
+    
+    def __init__(self, size: int, limit: int):
+        self.size = size
+        self.limit = limit
+        super().__init__(f"Video is {size} bytes, limit is {limit} bytes")
+
+
+class DownloadError(Exception):
+    """Raised when the origin sends something other than the bytes asked for"""
+
+
+class IncompleteDownload(DownloadError):
+    """Raised when a response ends before all of its bytes arrived (resumable)"""
+
+
+def _content_length(response: httpx.Response) -> Optional[int]:
+    """Get the full size of the video from Content-Range or Content-Length"""
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        if total.isdigit():
+            return int(total)
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit():
+        return int(content_length)
+    return None
+
+
+def _fileno(dest: BinaryIO, size: int) -> Optional[int]:
+    """Get a file descriptor for positional writes of size bytes, or None for in-memory buffers"""
+    if isinstance(dest, tempfile.SpooledTemporaryFile) and not dest._rolled and size <= dest._max_size:
+        # Asking for one would roll the spool over to disk although the video fits in memory
+        return None
+    try:
+        # SpooledTemporaryFile rolls over to a real file here
+        return dest.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return None
+
+
+def _hash_file(fd: int, size: int) -> str:
+    """Compute the sha256 hex digest of the first size bytes of a file"""
+    content_hash = hashlib.sha256()
+    offset = 0
+    while offset < size:
+        chunk = os.pread(fd, min(1024 * 1024, size - offset), offset)
+        if not chunk:
+            break
+        content_hash.update(chunk)
+        offset += len(chunk)
+    return content_hash.hexdigest()
+
+
+def _resumable(error: BaseException) -> bool:
+    """Whether a download can carry on from where it stopped after this error"""
+    return isinstance(error, IncompleteDownload) or is_transient(error)
+
+
+def _validator(response: httpx.Response) -> Optional[str]:
+    """Get an If-Range validator (strong ETag or Last-Modified) for the video"""
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+def _range_start(response: httpx.Response) -> Optional[int]:
+    """Get the first byte offset of a 206 response from its Content-Range"""
+    match = re.match(r'bytes (\d+)-', response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+
+async def _open(client: httpx.AsyncClient, video_url: str, timeout: int, headers: Optional[dict] = None,
+                retries: int = 0) -> httpx.Response:
+    """Send a streamed GET, retrying transient failures, and return the open response"""
+    for attempt in range(retries + 1):
+        try:
+            request = client.build_request('GET', video_url, headers=headers, timeout=timeout)
+            response = await client.send(request, stream=True)
+            try:
+                response.raise_for_status()
+            except httpx.HTTPStatusError:
+                await response.aclose()
+                raise
+            return response
+        except httpx.HTTPError as e:
+            if attempt == retries or not is_transient(e):
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"Request for {video_url} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def probe_size(video_url: str, timeout: int = 30, retries: int = DOWNLOAD_RETRIES) -> Optional[int]:
+    """
+    Get the size of a video without downloading it
+    
+    Asks with HEAD, falling back to the headers of a GET (closed before any of
+    the body is read) for origins that do not answer HEAD with a length.
+    
+    Returns:
+        Optional[int]: Size in bytes, None if the origin does not announce it
+    
+    Raises:
+        httpx.HTTPError: If the GET fails (after retries, for transient failures)
+    """
+    client = get_async_client()
+    try:
+        response = await client.head(video_url, timeout=timeout)
+        if response.status_code == 200 and _content_length(response) is not None:
+            return _content_length(response)
+    except httpx.HTTPError:
+        pass
+    response = await _open(client, video_url, timeout, retries=retries)
+    try:
+        return _content_length(response)
+    finally:
+        await response.aclose()
+
+
+class _Segment:
+    """Byte range start..end (inclusive) of the video, written up to offset so far"""
+    
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.offset = start
+
+
+async def _write_range(response: httpx.Response, fd: int, segment: _Segment) -> None:
+    """Write a streamed response at the segment's offsets, advancing segment.offset"""
+    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+        chunk = chunk[:segment.end + 1 - segment.offset]
+        os.pwrite(fd, chunk, segment.offset)
+        segment.offset += len(chunk)
+        if segment.offset > segment.end:
+            break
+    if segment.offset != segment.end + 1:
+        raise IncompleteDownload(f"Range {segment.start}-{segment.end} ended early at byte {segment.offset}")
+
+
+async def _fetch_range(client: httpx.AsyncClient, video_url: str, fd: int, segment: _Segment, timeout: int,
+                       validator: Optional[str], response: Optional[httpx.Response] = None,
+                       retries: int = DOWNLOAD_RETRIES) -> None:
+    """
+    Fetch one byte range of the video, resuming from segment.offset after transient failures
+    
+    response, if given, is already positioned at the segment start (the initial response).
+    """
+    attempt = 0
+    while True:
+        try:
+            if response is None:
+                headers = {'Range': f'bytes={segment.offset}-{segment.end}'}
+                if validator:
+                    headers['If-Range'] = validator
+                response = await _open(client, video_url, timeout, headers)
+                if response.status_code != 206 or _range_start(response) != segment.offset:
+                    # A full 200 here means the video changed since the first response
+                    raise DownloadError(f"Range request answered with status {response.status_code}")
+            await _write_range(response, fd, segment)
+            return
+        except Exception as e:
+            if attempt >= retries or not _resumable(e):
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logger.warning(f"Range {segment.start}-{segment.end} of {video_url} failed at byte {segment.offset} "
+                           f"({type(e).__name__}), resuming in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        finally:
+            if response is not None:
+                await response.aclose()
+                response = None
+
+
+async def _gather_or_cancel(*coroutines) -> None:
+    """Run coroutines concurrently; if one fails, cancel and await the others before raising"""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # Segments still running would keep writing into a file the caller is about to close
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def download_video(video_url: str, dest: BinaryIO, max_size: int = MAX_VIDEO_SIZE,
+                         timeout: int = 300, segments: int = DOWNLOAD_SEGMENTS,
+                         retries: int = DOWNLOAD_RETRIES) -> Tuple[int, str]:
+    """
+    Download a video into a file-like object without blocking the event loop
+    
+    The size is checked against max_size from the response headers before any
+    of the body is read, and again while streaming for servers that do not
+    send a Content-Length.
+    
+    When the origin sends Accept-Ranges: bytes and the video is large enough,
+    it is split into up to `segments` byte ranges fetched concurrently and
+    written with positional writes into dest (preallocated to the full size),
+    unless dest is a spooled buffer the video fits in (it stays in memory).
+    The first range is read from the initial response. Otherwise the video is
+    streamed over a single connection.
+    
+    Connection errors, timeouts and 408/425/429/5xx answers are retried up to
+    `retries` times with jittered exponential backoff. A broken transfer
+    resumes from the last byte written with a Range request guarded by
+    If-Range, so a video that changed meanwhile starts over instead of being
+    spliced. The final size is checked against the announced one.
+    
+    Args:
+        video_url: The video URL to download
+        dest: Writable binary file-like object (temp file, spooled buffer, ...)
+        max_size: Maximum video size in bytes (default: MAX_VIDEO_SIZE)
+        timeout: Request timeout in seconds (default: 300)
+        segments: Maximum number of concurrent ranges (default: DOWNLOAD_SEGMENTS)
+        retries: Retries per request or range after a transient failure (default: DOWNLOAD_RETRIES)
+        
+    Returns:
+        Tuple[int, str]: (size in bytes, sha256 hex digest of the content)
+        
+    Raises:
+        VideoTooLarge: If the video is larger than max_size
+        DownloadError: If the video could not be downloaded completely
+        httpx.HTTPError: If a request fails (after retries, for transient failures)
+    """
+    client = get_async_client()
+    response = await _open(client, video_url, timeout, retries=retries)
+    try:
+        # Reject oversized videos before reading any of the body
+        expected_size = _content_length(response)
+        if expected_size is not None and expected_size > max_size:
+            raise VideoTooLarge(expected_size, max_size)
+        
+        accepts_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        validator = _validator(response)
+        
+        # Split into concurrent ranges when the origin supports them
+        segment_count = 1
+        if expected_size and accepts_ranges:
+            segment_count = min(segments, expected_size // DOWNLOAD_MIN_SEGMENT_SIZE)
+        fd = _fileno(dest, expected_size) if segment_count > 1 else None
+        
+        if fd is not None:
+            os.ftruncate(fd, expected_size)
+            segment_size = -(-expected_size // segment_count)
+            parts = [
+                _Segment(start, min(start + segment_size, expected_size) - 1)
+                for start in range(0, expected_size, segment_size)
+            ]
+            logger.info(f"Downloading {expected_size} bytes in {len(parts)} ranges: {video_url}")
+            first, response = response, None
+            await _gather_or_cancel(
+                _fetch_range(client, video_url, fd, parts[0], timeout, validator, first, retries),
+                *(_fetch_range(client, video_url, fd, part, timeout, validator, retries=retries) for part in parts[1:])
+            )
+            return expected_size, await asyncio.to_thread(_hash_file, fd, expected_size)
+        
+        stream, response = response, None
+        return await _stream(client, video_url, dest, stream, expected_size, max_size, timeout,
+                             accepts_ranges, validator, retries)
+    finally:
+        if response is not None:
+            await response.aclose()
+
+
+async def _stream(client: httpx.AsyncClient, video_url: str, dest: BinaryIO, response: httpx.Response,
+                  expected_size: Optional[int], max_size: int, timeout: int, accepts_ranges: bool,
+                  validator: Optional[str], retries: int) -> Tuple[int, str]:
+    """Download over a single connection, resuming with Range requests when the origin allows it"""
+    content_hash = hashlib.sha256()
+    size = 0
+    attempt = 0
+    while True:
+        try:
+            if response is None:
+                headers = None
+                if accepts_ranges and size:
+                    headers = {'Range': f'bytes={size}-'}
+                    if validator:
+                        headers['If-Range'] = validator
+                response = await _open(client, video_url, timeout, headers)
+                if response.status_code != 206 or _range_start(response) != size:
+                    # The origin sent the whole video again - start over
+                    dest.seek(0)
+                    dest.truncate()
+                    content_hash = hashlib.sha256()
+                    size = 0
+                    expected_size = _content_length(response)
+                    if expected_size is not None and expected_size > max_size:
+                        raise VideoTooLarge(expected_size, max_size)
+            
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                # Abort mid-stream when the server did not announce the size
+                if size > max_size:
+                    raise VideoTooLarge(size, max_size)
+                dest.write(chunk)
+                content_hash.update(chunk)
+            
+            if expected_size is not None and size != expected_size:
+                raise IncompleteDownload(f"Download ended at byte {size} of {expected_size}")
+            return size, content_hash.hexdigest()
+        except Exception as e:
+            # Without Range support a retry starts from scratch, which is still worth it
+            if attempt >= retries or not _resumable(e):
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logger.warning(f"Download of {video_url} failed at byte {size} ({type(e).__name__}), "
+                           f"{'resuming' if accepts_ranges else 'restarting'} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        finally:
+            if response is not None:
+                await response.aclose()
+                response = None
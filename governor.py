@@ -0,0 +1,170 @@
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+from config import MEMORY_BUDGET, DISK_BUDGET, RESOURCE_WAIT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+RESOURCES = ('memory', 'disk')
+
+
+class BudgetExhausted(Exception):
+    """Raised when a job could not reserve its bytes within the wait timeout"""
+    
+    def __init__(self, resource: str, size: int, used: int, limit: int):
+        super().__init__(f"{resource} budget exhausted: {size} bytes needed, {used}/{limit} in use")
+        self.resource = resource
+        self.size = size
+        self.used = used
+        self.limit = limit
+
+
+class ResourceGovernor:
+    """
+    Global budget of memory and disk bytes held by video jobs in flight
+    
+    Jobs reserve the bytes their video will take (known from Content-Length)
+    before downloading it and wait until that fits next to what the other
+    jobs hold; after `wait_timeout` seconds they are rejected. A reservation
+    larger than a whole budget is cut down to it, so such a job waits until
+    it has the budget to itself. A limit of 0 disables that budget.
+    """
+    
+    def __init__(self, memory: int = MEMORY_BUDGET, disk: int = DISK_BUDGET,
+                 wait_timeout: float = RESOURCE_WAIT_TIMEOUT):
+        self.limits = {'memory': memory, 'disk': disk}
+        self.used = {resource: 0 for resource in RESOURCES}
+        self.peak = {resource: 0 for resource in RESOURCES}
+        self.wait_timeout = wait_timeout
+        self.waited = 0
+        self.rejected = 0
+        self._waiters: List[asyncio.Future] = []
+    
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+    
+    def _clamp(self, amounts: Dict[str, int]) -> Dict[str, int]:
+        return {
+            resource: min(size, self.limits[resource]) if self.limits[resource] else size
+            for resource, size in amounts.items() if size > 0
+        }
+    
+    def _over(self, amounts: Dict[str, int]) -> List[str]:
+        """Resources on which amounts does not fit right now"""
+        return [
+            resource for resource, size in amounts.items()
+            if self.limits[resource] and self.used[resource] + size > self.limits[resource]
+        ]
+    
+    async def acquire(self, amounts: Dict[str, int], timeout: Optional[float] = None) -> Dict[str, int]:
+        """
+        Reserve bytes per resource, waiting for other jobs to release theirs
+        
+        Args:
+            amounts: Bytes to reserve per resource ('memory', 'disk')
+            timeout: Seconds to wait at most (default: wait_timeout, 0 fails right away)
+        
+        Returns:
+            Dict[str, int]: The amounts actually reserved (see clamping above), to release later
+        
+        Raises:
+            BudgetExhausted: If they did not fit in time
+        """
+        amounts = self._clamp(amounts)
+        timeout = self.wait_timeout if timeout is None else timeout
+        if self._over(amounts) and timeout <= 0:
+            # Optional work (e.g. prefetching) that is not worth waiting or counting as rejected
+            resource = self._over(amounts)[0]
+            raise BudgetExhausted(resource, amounts[resource], self.used[resource], self.limits[resource])
+        if self._over(amounts):
+            self.waited += 1
+            logger.info(f"Waiting for {', '.join(self._over(amounts))} budget ({amounts} bytes needed)")
+            deadline = time.monotonic() + timeout
+            while self._over(amounts):
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(waiter, max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    resource = (self._over(amounts) or list(amounts))[0]
+                    self.rejected += 1
+                    raise BudgetExhausted(resource, amounts[resource], self.used[resource],
+                                          self.limits[resource]) from None
+                finally:
+                    self._waiters.remove(waiter)
+        for resource, size in amounts.items():
+            self.used[resource] += size
+            self.peak[resource] = max(self.peak[resource], self.used[resource])
+        return amounts
+    
+    def admit(self, requests: List[Dict[str, int]]) -> List[int]:
+        """
+        Pick the requests that fit within the limits together, in order
+        
+        For a job needing several reservations at once (an album): it reserves
+        the picked ones in one go instead of holding some while waiting for
+        more. The first request is always picked (reserving it is clamped).
+        
+        Returns:
+            List[int]: Indices of the picked requests
+        """
+        total = {resource: 0 for resource in RESOURCES}
+        picked = []
+        for index, amounts in enumerate(requests):
+            fits = all(
+                not self.limits[resource] or total[resource] + size <= self.limits[resource]
+                for resource, size in amounts.items()
+            )
+            if fits or not picked:
+                picked.append(index)
+                for resource, size in amounts.items():
+                    total[resource] += size
+        return picked
+    
+    def release(self, amounts: Dict[str, int]) -> None:
+        """Give reserved bytes back and let waiting jobs re-check"""
+        for resource, size in amounts.items():
+            self.used[resource] -= size
+        self._wake()
+    
+    def _wake(self) -> None:
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+    
+    def reservation(self) -> 'Reservation':
+        """Start an empty reservation for a job"""
+        return Reservation(self)
+    
+    def stats(self) -> Dict[str, int]:
+        stats = {'waiting': self.waiting, 'waited': self.waited, 'rejected': self.rejected}
+        for resource in RESOURCES:
+            stats[f'{resource}_used'] = self.used[resource]
+            stats[f'{resource}_peak'] = self.peak[resource]
+            stats[f'{resource}_limit'] = self.limits[resource]
+        return stats
+
+
+class Reservation:
+    """Bytes held by one job, grown as its videos' sizes become known and released all at once"""
+    
+    def __init__(self, governor: ResourceGovernor):
+        self.governor = governor
+        self.amounts = {resource: 0 for resource in RESOURCES}
+    
+    async def reserve(self, memory: int = 0, disk: int = 0, timeout: Optional[float] = None) -> None:
+        """Add bytes to the reservation, waiting for room (raises BudgetExhausted)"""
+        reserved = await self.governor.acquire({'memory': memory, 'disk': disk}, timeout)
+        for resource, size in reserved.items():
+            self.amounts[resource] += size
+    
+    def release(self) -> None:
+        """Give everything back (safe to call more than once)"""
+        amounts, self.amounts = self.amounts, {resource: 0 for resource in RESOURCES}
+        self.governor.release(amounts)
+
+
+# Budget shared by every video job of this process
+resource_governor = ResourceGovernor()
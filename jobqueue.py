@@ -0,0 +1,303 @@
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+from pymongo import ReturnDocument
+import database
+from scheduler import QueueFull
+from config import (
+    JOB_WORKERS, JOB_PER_CHAT_LIMIT, JOB_MAX_QUEUED,
+    JOB_LEASE_SECONDS, JOB_HEARTBEAT_INTERVAL, JOB_POLL_INTERVAL, JOB_MAX_ATTEMPTS
+)
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class LeaseQueue:
+    """
+    Job queue stored in the MongoDB jobs collection, shared by every replica
+    
+    Any process can enqueue; workers on any node claim jobs atomically with a
+    lease (findOneAndUpdate), extend it with heartbeats while the job runs and
+    mark it done or failed when it ends. A job whose lease runs out (its worker
+    died) is handed to the next worker, up to `max_attempts` times. Only the
+    current lease holder can complete, fail or extend a job, so a worker that
+    lost its lease cannot overwrite the outcome of the one that took over.
+    
+    Jobs are claimed oldest first, skipping chats that already have
+    `per_chat_limit` jobs running anywhere (best effort across nodes).
+    """
+    
+    def __init__(self, workers: int = JOB_WORKERS, per_chat_limit: int = JOB_PER_CHAT_LIMIT,
+                 max_queued: int = JOB_MAX_QUEUED, lease: float = JOB_LEASE_SECONDS,
+                 heartbeat_interval: float = JOB_HEARTBEAT_INTERVAL, poll_interval: float = JOB_POLL_INTERVAL,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.workers = workers
+        self.per_chat_limit = per_chat_limit
+        self.max_queued = max_queued
+        self.lease = lease
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.lost = 0
+        self._running = 0
+        self._waits = deque(maxlen=100)
+        self._handler: Optional[Handler] = None
+        self._tasks = []
+    
+    @property
+    def running(self) -> int:
+        """Jobs this process is running"""
+        return self._running
+    
+    @property
+    def _jobs(self):
+        return database.get_collection('jobs')
+    
+    # Blocking MongoDB operations (run on the database thread pool)
+    
+    def enqueue(self, chat_id: int, payload: Dict[str, Any]) -> int:
+        """
+        Add a job to the queue
+        
+        Args:
+            chat_id: Chat the job belongs to (used for per-chat limits)
+            payload: BSON-serializable job data handed to the worker's handler
+        
+        Returns:
+            int: 0 if no job is waiting ahead of this one, otherwise its position in the queue
+        
+        Raises:
+            QueueFull: If max_queued jobs are already waiting
+        """
+        queued = database._retry(self._jobs.count_documents, {'status': 'queued'})
+        if queued >= self.max_queued:
+            self.rejected += 1
+            raise QueueFull(f"{queued} jobs already queued")
+        
+        now = datetime.now(timezone.utc)
+        database._retry(self._jobs.insert_one, {
+            'chat_id': chat_id,
+            'payload': payload,
+            'status': 'queued',
+            'attempts': 0,
+            'created_at': now,
+            'available_at': now,
+            'lease_owner': None,
+            'lease_expires_at': None
+        })
+        return queued + 1 if queued else 0
+    
+    def _busy_chats(self, now: datetime) -> list:
+        """Chats with per_chat_limit jobs under a live lease on any worker"""
+        busy = database._retry(lambda: list(self._jobs.aggregate([
+            {'$match': {'status': 'running', 'lease_expires_at': {'$gte': now}}},
+            {'$group': {'_id': '$chat_id', 'running': {'$sum': 1}}},
+            {'$match': {'running': {'$gte': self.per_chat_limit}}}
+        ])))
+        return [doc['_id'] for doc in busy]
+    
+    def claim(self) -> Optional[Dict]:
+        """Atomically lease the oldest runnable job to this worker, or return None"""
+        now = datetime.now(timezone.utc)
+        
+        # Jobs whose worker died on the last attempt are given up on
+        database._retry(
+            self._jobs.update_many,
+            {'status': 'running', 'lease_expires_at': {'$lt': now}, 'attempts': {'$gte': self.max_attempts}},
+            {'$set': {'status': 'failed', 'error': 'lease expired', 'finished_at': now, 'lease_owner': None}}
+        )
+        
+        return database._retry(
+            self._jobs.find_one_and_update,
+            {
+                '$or': [
+                    {'status': 'queued', 'available_at': {'$lte': now}},
+                    # Re-deliver jobs whose worker stopped heartbeating
+                    {'status': 'running', 'lease_expires_at': {'$lt': now}}
+                ],
+                'chat_id': {'$nin': self._busy_chats(now)}
+            },
+            {
+                '$set': {
+                    'status': 'running',
+                    'lease_owner': self.worker_id,
+                    'lease_expires_at': now + timedelta(seconds=self.lease),
+                    'started_at': now
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('created_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    def _update_leased(self, job_id, update: Dict) -> bool:
+        """Apply update only if this worker still holds the job's lease"""
+        result = database._retry(
+            self._jobs.update_one,
+            {'_id': job_id, 'status': 'running', 'lease_owner': self.worker_id},
+            update
+        )
+        return result.modified_count == 1
+    
+    def heartbeat(self, job_id) -> bool:
+        """Extend the lease, returns False if it was lost to another worker"""
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.lease)
+        return self._update_leased(job_id, {'$set': {'lease_expires_at': expires_at}})
+    
+    def complete(self, job_id) -> bool:
+        """Mark the job done (a no-op if already completed or leased elsewhere)"""
+        return self._update_leased(job_id, {'$set': {
+            'status': 'done',
+            'finished_at': datetime.now(timezone.utc),
+            'lease_owner': None
+        }})
+    
+    def fail(self, job_id, attempts: int, error: str) -> bool:
+        """Re-queue the job with backoff, or mark it failed after max_attempts"""
+        now = datetime.now(timezone.utc)
+        if attempts >= self.max_attempts:
+            fields = {'status': 'failed', 'finished_at': now}
+        else:
+            fields = {'status': 'queued', 'available_at': now + timedelta(seconds=min(300, 5 * 2 ** attempts))}
+        fields.update({'error': error, 'lease_owner': None, 'lease_expires_at': None})
+        return self._update_leased(job_id, {'$set': fields})
+    
+    def release(self, job_id) -> bool:
+        """Hand a job back untouched (worker shutting down), not counted as an attempt"""
+        return self._update_leased(job_id, {
+            '$set': {'status': 'queued', 'lease_owner': None, 'lease_expires_at': None},
+            '$inc': {'attempts': -1}
+        })
+    
+    def counts(self) -> Dict[str, Any]:
+        """Get cluster-wide queued/running counts and the oldest queued job's creation time"""
+        queued = database._retry(self._jobs.count_documents, {'status': 'queued'})
+        running = database._retry(self._jobs.count_documents, {'status': 'running'})
+        oldest = database._retry(
+            self._jobs.find_one, {'status': 'queued'}, {'created_at': 1}, sort=[('created_at', 1)]
+        )
+        return {'queued': queued, 'running': running, 'oldest': oldest['created_at'] if oldest else None}
+    
+    # Async API
+    
+    async def submit(self, chat_id: int, payload: Dict[str, Any]) -> int:
+        """Async version of enqueue"""
+        return await database.run_async(self.enqueue, chat_id, payload)
+    
+    async def start(self, handler: Handler) -> None:
+        """Start claiming jobs on this node, running each payload through handler"""
+        self._handler = handler
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Lease queue worker {self.worker_id} started with {self.workers} workers")
+    
+    async def stop(self) -> None:
+        """Stop the workers, handing running jobs back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await database.run_async(self.claim)
+            except Exception as e:
+                logger.error(f"Error claiming job: {type(e).__name__}: {str(e)}")
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                # A worker must outlive any one job, or this node quietly stops claiming
+                logger.error(f"Error running job {job['_id']}: {type(e).__name__}: {str(e)}", exc_info=True)
+    
+    async def _record(self, operation, job_id, *args) -> None:
+        """Store a job's outcome; if MongoDB fails the lease runs out and the job is delivered again"""
+        try:
+            await database.run_async(operation, job_id, *args)
+        except Exception as e:
+            logger.error(f"Could not record the outcome of job {job_id}: {type(e).__name__}: {str(e)}")
+    
+    async def _heartbeat(self, job_id, task: asyncio.Task) -> None:
+        """Keep the lease alive while task runs, cancelling it if the lease is lost"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                alive = await database.run_async(self.heartbeat, job_id)
+            except Exception as e:
+                # Retry on the next beat; the lease outlives a few missed ones
+                logger.warning(f"Heartbeat for job {job_id} failed: {str(e)}")
+                continue
+            if not alive:
+                self.lost += 1
+                logger.warning(f"Lost lease on job {job_id}, abandoning it")
+                task.cancel()
+                return
+    
+    async def _run(self, job: Dict) -> None:
+        job_id = job['_id']
+        self._waits.append((datetime.now(timezone.utc) - job['created_at'].replace(tzinfo=timezone.utc)).total_seconds())
+        self._running += 1
+        task = asyncio.create_task(self._handler(job['payload']))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, task))
+        try:
+            await task
+        except asyncio.CancelledError:
+            if heartbeat.done():
+                # Lease lost; the job now belongs to another worker
+                return
+            await asyncio.shield(self._record(self.release, job_id))
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Job {job_id} for chat {job['chat_id']} failed: {type(e).__name__}: {str(e)}", exc_info=True)
+            await self._record(self.fail, job_id, job['attempts'], f"{type(e).__name__}: {str(e)}")
+        else:
+            self.completed += 1
+            await self._record(self.complete, job_id)
+        finally:
+            self._running -= 1
+            heartbeat.cancel()
+    
+    async def stats_async(self) -> Dict:
+        """
+        Get queue depth and running jobs (cluster-wide) and wait times (seconds, this node)
+        
+        queued is None when MongoDB could not be asked; running is then this node's count.
+        """
+        try:
+            counts = await database.run_async(self.counts)
+        except Exception as e:
+            logger.warning(f"Could not count queued jobs: {type(e).__name__}: {str(e)}")
+            counts = {'queued': None, 'running': self._running, 'oldest': None}
+        oldest = counts['oldest']
+        return {
+            'queued': counts['queued'],
+            'running': counts['running'],
+            'workers': sum(not task.done() for task in self._tasks),
+            'local_running': self._running,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'lost': self.lost,
+            'avg_wait': sum(self._waits) / len(self._waits) if self._waits else 0.0,
+            'max_wait': max(self._waits, default=0.0),
+            'oldest_wait': (datetime.now(timezone.utc) - oldest.replace(tzinfo=timezone.utc)).total_seconds() if oldest else 0.0
+        }
+
+
+# Shared MongoDB job queue, used instead of scheduler.job_scheduler when JOB_BACKEND is mongodb
+job_queue = LeaseQueue()
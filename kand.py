@@ -1,13 +1,78 @@
 import requests
+import httpx
 import re
+import sys
+import json
+import time
+import codecs
+import asyncio
 import logging
+import argparse
+from html.parser import HTMLParser
 from urllib.parse import urlparse
-from typing import Dict, Tuple, List, Optional
+from typing import AsyncIterator, Dict, Iterable, Tuple, List, Optional
 from bs4 import BeautifulSoup
+from cache import metadata_cache, negative_cache, NegativeCache, canonicalize_url
+from singleflight import SingleFlight
+from metrics import timed, stage_seconds
+from retry import TRANSIENT_STATUS, backoff_delay, is_transient
+from ratelimit import LimitedTransport, origin_limiter
+from config import (
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, HTTP_RETRIES, HTTP_USER_AGENT
+)
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+# Browser-like headers sent with every request to viralkand.com
+HEADERS = {
+    'User-Agent': HTTP_USER_AGENT
+}
+
+# Bytes read per chunk when streaming a page for its <head> metadata
+STREAM_CHUNK_SIZE = 16384
+
+# Bytes of a page kept for the full-parse fallback, the rest is not read
+PAGE_MAX_SIZE = 4 * 1024 * 1024
+
+# Coalesces concurrent scrapes of the same page
+scrape_flight = SingleFlight()
+
+# Shared async HTTP client (created lazily, reused across requests for keep-alive)
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Get the shared pooled async HTTP client, creating it on first use
+    
+    Requests go through ratelimit.origin_limiter, which rate limits each host
+    and adapts its concurrency to throttling answers.
+    
+    Returns:
+        httpx.AsyncClient: Client with keep-alive connection pooling
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            headers=HEADERS,
+            follow_redirects=True,
+            transport=LimitedTransport(httpx.AsyncHTTPTransport(limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )), origin_limiter)
+        )
+    return _async_client
+
+
+async def close_async_client() -> None:
+    """Close the shared async HTTP client and its pooled connections"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
 
 def extract_urls(text: str) -> List[str]:
     """
@@ -48,6 +113,220 @@ def is_valid_viralkand_url(url: str) -> bool:
         return False
 
 
+def _status_result(status_code: int) -> Tuple[bool, int, str]:
+    """Map an HTTP status code to the (exists, status_code, message) verdict"""
+    # Consider 2xx and 3xx as valid (exists)
+    if 200 <= status_code < 400:
+        return True, status_code, "URL exists and is accessible"
+    elif status_code == 404:
+        return False, status_code, "URL not found (404)"
+    elif status_code == 403:
+        return False, status_code, "Access forbidden (403)"
+    else:
+        return False, status_code, f"URL returned status code: {status_code}"
+
+
+def _empty_metadata() -> Dict[str, Optional[str]]:
+    """Return a metadata dict with every field unset"""
+    return {
+        'title': None,
+        'description': None,
+        'image': None,
+        'video_url': None
+    }
+
+
+def _parse_metadata(content: bytes) -> Dict[str, Optional[str]]:
+    """Parse og:title, og:description, og:image and contentURL from an HTML page"""
+    metadata = _empty_metadata()
+    soup = BeautifulSoup(content, 'html.parser')
+    
+    # Extract og:title
+    og_title = soup.find('meta', property='og:title')
+    if og_title and og_title.get('content'):
+        metadata['title'] = og_title.get('content')
+    
+    # Extract og:description
+    og_description = soup.find('meta', property='og:description')
+    if og_description and og_description.get('content'):
+        metadata['description'] = og_description.get('content')
+    
+    # Extract og:image
+    og_image = soup.find('meta', property='og:image')
+    if og_image and og_image.get('content'):
+        metadata['image'] = og_image.get('content')
+    
+    # Extract video URL from contentURL meta tag
+    content_url = soup.find('meta', itemprop='contentURL')
+    if content_url and content_url.get('content'):
+        metadata['video_url'] = content_url.get('content')
+    
+    return metadata
+
+
+class _HeadMetaParser(HTMLParser):
+    """Incremental parser that collects the og:/contentURL meta tags until </head>"""
+    
+    PROPERTIES = {
+        'og:title': 'title',
+        'og:description': 'description',
+        'og:image': 'image'
+    }
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.metadata = _empty_metadata()
+        self.seen = set()
+        self.done = False
+    
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'body':
+            self.done = True
+            return
+        if tag != 'meta':
+            return
+        
+        attrs = dict(attrs)
+        key = self.PROPERTIES.get(attrs.get('property'))
+        if key is None and attrs.get('itemprop') == 'contentURL':
+            key = 'video_url'
+        # Like soup.find, only the first matching tag counts
+        if key is None or key in self.seen:
+            return
+        
+        self.seen.add(key)
+        if attrs.get('content'):
+            self.metadata[key] = attrs['content']
+        if len(self.seen) == len(self.metadata):
+            self.done = True
+    
+    def handle_endtag(self, tag):
+        if tag == 'head':
+            self.done = True
+
+
+class _MetadataStream:
+    """
+    Feeds a page to _HeadMetaParser chunk by chunk so reading can stop at </head>
+    
+    Everything fed is kept so the page can still be handed to BeautifulSoup
+    when the fast path does not find a video URL, up to PAGE_MAX_SIZE bytes
+    (the fallback then parses the truncated page).
+    """
+    
+    def __init__(self, content_type: Optional[str]):
+        self.parser = _HeadMetaParser()
+        self.decoder = codecs.getincrementaldecoder(_charset(content_type))(errors='replace')
+        self.chunks = []
+        self.size = 0
+        self.truncated = False
+        self.parse_seconds = 0.0
+    
+    def keep(self, chunk: bytes) -> bool:
+        """Keep a chunk for the fallback, returns False once the page is over PAGE_MAX_SIZE"""
+        if self.truncated or self.size + len(chunk) > PAGE_MAX_SIZE:
+            if not self.truncated:
+                logger.warning(f"Page is over {PAGE_MAX_SIZE} bytes, parsing only the start of it")
+            self.truncated = True
+            return False
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        return True
+    
+    def feed(self, chunk: bytes) -> bool:
+        """Feed a chunk, returns True once the head metadata is complete (or the page is too large)"""
+        if not self.keep(chunk):
+            return True
+        if not self.parser.done:
+            started = time.perf_counter()
+            self.parser.feed(self.decoder.decode(chunk))
+            self.parse_seconds += time.perf_counter() - started
+        return self.parser.done
+    
+    @property
+    def complete(self) -> bool:
+        """Whether the fast path found what the bot needs (the video URL)"""
+        return self.parser.metadata['video_url'] is not None
+    
+    def metadata(self) -> Dict[str, Optional[str]]:
+        """Return the fast-path metadata, or a full BeautifulSoup parse as fallback"""
+        if self.complete:
+            metadata = self.parser.metadata
+        else:
+            started = time.perf_counter()
+            metadata = _parse_metadata(b''.join(self.chunks))
+            self.parse_seconds += time.perf_counter() - started
+        # Parsing is interleaved with reading, so its time is summed and recorded once
+        stage_seconds.observe(self.parse_seconds, stage='parse')
+        return metadata
+
+
+def _charset(content_type: Optional[str]) -> str:
+    """Get the charset declared in a Content-Type header, defaulting to utf-8"""
+    match = re.search(r'charset=["\']?([\w-]+)', content_type or '', re.IGNORECASE)
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+
+def _read_metadata(response: requests.Response) -> Dict[str, Optional[str]]:
+    """Stream a page until its <head> metadata is known (reads on only for the fallback)"""
+    stream = _MetadataStream(response.headers.get('Content-Type'))
+    chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+    for chunk in chunks:
+        if stream.feed(chunk):
+            break
+    if not stream.complete and not stream.truncated:
+        for chunk in chunks:
+            if not stream.keep(chunk):
+                break
+    return stream.metadata()
+
+
+async def _read_metadata_async(response: httpx.Response) -> Dict[str, Optional[str]]:
+    """Async version of _read_metadata for a streamed httpx response"""
+    stream = _MetadataStream(response.headers.get('Content-Type'))
+    chunks = response.aiter_bytes(STREAM_CHUNK_SIZE)
+    async for chunk in chunks:
+        if stream.feed(chunk):
+            break
+    if not stream.complete and not stream.truncated:
+        async for chunk in chunks:
+            if not stream.keep(chunk):
+                break
+    return stream.metadata()
+
+
+def _fetch_page(url: str, timeout: int) -> Tuple[int, Dict[str, Optional[str]]]:
+    """
+    GET a page and read its metadata, retrying connection errors, timeouts and 408/425/429/5xx
+    
+    Returns:
+        Tuple[int, Dict]: (status_code, metadata - empty unless status is 200)
+    """
+    for attempt in range(HTTP_RETRIES + 1):
+        try:
+            # Stream the page and stop at </head>; closing drops the unread body
+            with timed('fetch'), requests.get(url, headers=HEADERS, timeout=timeout, allow_redirects=True, stream=True) as response:
+                if response.status_code == 200:
+                    return response.status_code, _read_metadata(response)
+                if response.status_code not in TRANSIENT_STATUS or attempt == HTTP_RETRIES:
+                    return response.status_code, _empty_metadata()
+                reason = f"status {response.status_code}"
+        except requests.exceptions.RequestException as e:
+            if attempt == HTTP_RETRIES or not is_transient(e):
+                raise
+            reason = type(e).__name__
+        delay = backoff_delay(attempt)
+        logger.warning(f"Fetching {url} failed ({reason}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+
 def check_url_exists(url: str, timeout: int = 10) -> Tuple[bool, int, str]:
     """
     Check if the URL exists and is accessible
@@ -63,26 +342,14 @@ def check_url_exists(url: str, timeout: int = 10) -> Tuple[bool, int, str]:
             - message: Status message
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.head(url, headers=headers, timeout=timeout, allow_redirects=True)
-        
-        # If HEAD request fails, try GET request
-        if response.status_code >= 400:
-            response = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True)
-        
-        status_code = response.status_code
-        
-        # Consider 2xx and 3xx as valid (exists)
-        if 200 <= status_code < 400:
-            return True, status_code, "URL exists and is accessible"
-        elif status_code == 404:
-            return False, status_code, "URL not found (404)"
-        elif status_code == 403:
-            return False, status_code, "Access forbidden (403)"
-        else:
-            return False, status_code, f"URL returned status code: {status_code}"
+        with timed('check'):
+            response = requests.head(url, headers=HEADERS, timeout=timeout, allow_redirects=True)
+            
+            # If HEAD request fails, try GET request
+            if response.status_code >= 400:
+                response = requests.get(url, headers=HEADERS, timeout=timeout, allow_redirects=True)
+        
+        return _status_result(response.status_code)
             
     except requests.exceptions.Timeout:
         return False, 0, "Request timeout - URL may not be accessible"
@@ -109,41 +376,10 @@ def extract_metadata(url: str, timeout: int = 10) -> Dict[str, Optional[str]]:
             - image: str or None - og:image content
             - video_url: str or None - contentURL (video URL)
     """
-    metadata = {
-        'title': None,
-        'description': None,
-        'image': None,
-        'video_url': None
-    }
+    metadata = _empty_metadata()
     
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True)
-        
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract og:title
-            og_title = soup.find('meta', property='og:title')
-            if og_title and og_title.get('content'):
-                metadata['title'] = og_title.get('content')
-            
-            # Extract og:description
-            og_description = soup.find('meta', property='og:description')
-            if og_description and og_description.get('content'):
-                metadata['description'] = og_description.get('content')
-            
-            # Extract og:image
-            og_image = soup.find('meta', property='og:image')
-            if og_image and og_image.get('content'):
-                metadata['image'] = og_image.get('content')
-            
-            # Extract video URL from contentURL meta tag
-            content_url = soup.find('meta', itemprop='contentURL')
-            if content_url and content_url.get('content'):
-                metadata['video_url'] = content_url.get('content')
+        _, metadata = _fetch_page(url, timeout)
         
     except requests.exceptions.Timeout:
         logger.warning(f"Timeout while extracting metadata from {url}")
@@ -155,13 +391,58 @@ def extract_metadata(url: str, timeout: int = 10) -> Dict[str, Optional[str]]:
     return metadata
 
 
-def validate_and_check_url(url: str, extract_meta: bool = True) -> Dict:
+def check_and_extract(url: str, timeout: int = 10) -> Tuple[bool, int, str, Dict[str, Optional[str]]]:
+    """
+    Check if the URL exists and extract its metadata with a single GET request
+    
+    Args:
+        url: The URL to check
+        timeout: Request timeout in seconds (default: 10)
+        
+    Returns:
+        Tuple[bool, int, str, Dict]: (exists, status_code, message, metadata)
+            - exists, status_code, message: same as check_url_exists
+            - metadata: same as extract_metadata (empty unless status is 200)
+    """
+    metadata = _empty_metadata()
+    try:
+        status_code, metadata = _fetch_page(url, timeout)
+        return (*_status_result(status_code), metadata)
+            
+    except requests.exceptions.Timeout:
+        return False, 0, "Request timeout - URL may not be accessible", metadata
+    except requests.exceptions.ConnectionError:
+        return False, 0, "Connection error - Unable to reach the URL", metadata
+    except requests.exceptions.RequestException as e:
+        return False, 0, f"Request error: {str(e)}", metadata
+    except Exception as e:
+        return False, 0, f"Unexpected error: {str(e)}", metadata
+
+
+def _empty_result(url: str) -> Dict:
+    """Return a validate_and_check_url result dict with nothing checked yet"""
+    return {
+        'valid': False,
+        'exists': False,
+        'status_code': 0,
+        'message': '',
+        'url': url,
+        'metadata': _empty_metadata()
+    }
+
+
+def validate_and_check_url(url: str, extract_meta: bool = True, single_fetch: bool = True,
+                           use_cache: bool = True) -> Dict:
     """
     Complete API function: Validates URL format, checks if it exists, and extracts metadata
     
     Args:
         url: The URL to validate and check
         extract_meta: Whether to extract metadata if URL is valid and exists (default: True)
+        single_fetch: Check existence and extract metadata with one GET instead of
+            HEAD + GET (default: True, only applies when extract_meta is True)
+        use_cache: Answer from / store into cache.metadata_cache and, for links
+            with nothing to send, cache.negative_cache (default: True)
         
     Returns:
         Dict with keys:
@@ -172,19 +453,7 @@ def validate_and_check_url(url: str, extract_meta: bool = True) -> Dict:
             - url: str - The original URL
             - metadata: Dict - Contains title, description, image (only if valid and exists)
     """
-    result = {
-        'valid': False,
-        'exists': False,
-        'status_code': 0,
-        'message': '',
-        'url': url,
-        'metadata': {
-            'title': None,
-            'description': None,
-            'image': None,
-            'video_url': None
-        }
-    }
+    result = _empty_result(url)
     
     # Step 1: Validate URL format
     if not is_valid_viralkand_url(url):
@@ -193,32 +462,282 @@ def validate_and_check_url(url: str, extract_meta: bool = True) -> Dict:
     
     result['valid'] = True
     
-    # Step 2: Check if URL exists
-    exists, status_code, message = check_url_exists(url)
-    result['exists'] = exists
-    result['status_code'] = status_code
-    result['message'] = message
+    # Reposted links are answered from the caches without any request
+    if use_cache:
+        cached = negative_cache.get(url)
+        if cached is None and extract_meta:
+            cached = metadata_cache.get(url)
+        if cached is not None:
+            return cached
     
-    # Step 3: Extract metadata if URL is valid and exists
-    if exists and extract_meta:
-        metadata = extract_metadata(url)
+    # Step 2 + 3 in one round trip: the GET gives both the status and the page
+    if extract_meta and single_fetch:
+        exists, status_code, message, metadata = check_and_extract(url)
+        result['exists'] = exists
+        result['status_code'] = status_code
+        result['message'] = message
         result['metadata'] = metadata
+    else:
+        # Step 2: Check if URL exists
+        exists, status_code, message = check_url_exists(url)
+        result['exists'] = exists
+        result['status_code'] = status_code
+        result['message'] = message
+        
+        # Step 3: Extract metadata if URL is valid and exists
+        if exists and extract_meta:
+            result['metadata'] = extract_metadata(url)
+    
+    if use_cache:
+        if extract_meta and not NegativeCache.is_negative(result):
+            metadata_cache.set(url, result)
+        elif extract_meta or not exists:
+            negative_cache.set(url, result)
     
     return result
 
 
-# Example usage
-if __name__ == "__main__":
-    # Test the API
-    test_url = "https://viralkand.com/devar-ne-diwar-par-jhuka-ke-bhabhi-ki-chut-faad-di/"
-    result = validate_and_check_url(test_url)
-    print(f"URL: {result['url']}")
-    print(f"Valid: {result['valid']}")
-    print(f"Exists: {result['exists']}")
-    print(f"Status Code: {result['status_code']}")
-    print(f"Message: {result['message']}")
-    print("\nMetadata:")
-    print(f"Title: {result['metadata']['title']}")
-    print(f"Description: {result['metadata']['description']}")
-    print(f"Image: {result['metadata']['image']}")
+async def _fetch_page_async(url: str, timeout: int) -> Tuple[int, Dict[str, Optional[str]]]:
+    """Async version of _fetch_page using the shared pooled client"""
+    client = get_async_client()
+    for attempt in range(HTTP_RETRIES + 1):
+        try:
+            with timed('fetch'):
+                async with client.stream('GET', url, timeout=timeout) as response:
+                    if response.status_code == 200:
+                        return response.status_code, await _read_metadata_async(response)
+                    if response.status_code not in TRANSIENT_STATUS or attempt == HTTP_RETRIES:
+                        return response.status_code, _empty_metadata()
+                    reason = f"status {response.status_code}"
+        except httpx.HTTPError as e:
+            if attempt == HTTP_RETRIES or not is_transient(e):
+                raise
+            reason = type(e).__name__
+        delay = backoff_delay(attempt)
+        logger.warning(f"Fetching {url} failed ({reason}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+
+async def check_url_exists_async(url: str, timeout: int = 10) -> Tuple[bool, int, str]:
+    """
+    Async version of check_url_exists using the shared pooled client
+    
+    Args:
+        url: The URL to check
+        timeout: Request timeout in seconds (default: 10)
+        
+    Returns:
+        Tuple[bool, int, str]: (exists, status_code, message)
+    """
+    client = get_async_client()
+    try:
+        with timed('check'):
+            response = await client.head(url, timeout=timeout)
+            
+            # If HEAD request fails, try GET request
+            if response.status_code >= 400:
+                response = await client.get(url, timeout=timeout)
+        
+        return _status_result(response.status_code)
+            
+    except httpx.TimeoutException:
+        return False, 0, "Request timeout - URL may not be accessible"
+    except httpx.ConnectError:
+        return False, 0, "Connection error - Unable to reach the URL"
+    except httpx.HTTPError as e:
+        return False, 0, f"Request error: {str(e)}"
+    except Exception as e:
+        return False, 0, f"Unexpected error: {str(e)}"
+
+
+async def extract_metadata_async(url: str, timeout: int = 10) -> Dict[str, Optional[str]]:
+    """
+    Async version of extract_metadata using the shared pooled client
+    
+    Args:
+        url: The URL to extract metadata from
+        timeout: Request timeout in seconds (default: 10)
+        
+    Returns:
+        Dict with keys title, description, image and video_url (see extract_metadata)
+    """
+    metadata = _empty_metadata()
+    
+    try:
+        _, metadata = await _fetch_page_async(url, timeout)
+        
+    except httpx.TimeoutException:
+        logger.warning(f"Timeout while extracting metadata from {url}")
+    except httpx.HTTPError as e:
+        logger.warning(f"Error extracting metadata from {url}: {str(e)}")
+    except Exception as e:
+        logger.warning(f"Unexpected error extracting metadata from {url}: {str(e)}")
+    
+    return metadata
+
+
+async def check_and_extract_async(url: str, timeout: int = 10) -> Tuple[bool, int, str, Dict[str, Optional[str]]]:
+    """
+    Async version of check_and_extract using the shared pooled client
+    
+    Args:
+        url: The URL to check
+        timeout: Request timeout in seconds (default: 10)
+        
+    Returns:
+        Tuple[bool, int, str, Dict]: (exists, status_code, message, metadata)
+    """
+    metadata = _empty_metadata()
+    try:
+        status_code, metadata = await _fetch_page_async(url, timeout)
+        return (*_status_result(status_code), metadata)
+            
+    except httpx.TimeoutException:
+        return False, 0, "Request timeout - URL may not be accessible", metadata
+    except httpx.ConnectError:
+        return False, 0, "Connection error - Unable to reach the URL", metadata
+    except httpx.HTTPError as e:
+        return False, 0, f"Request error: {str(e)}", metadata
+    except Exception as e:
+        return False, 0, f"Unexpected error: {str(e)}", metadata
+
+
+async def validate_and_check_url_async(url: str, extract_meta: bool = True, single_fetch: bool = True,
+                                       use_cache: bool = True) -> Dict:
+    """
+    Async version of validate_and_check_url - does not block the event loop
+    
+    Args:
+        url: The URL to validate and check
+        extract_meta: Whether to extract metadata if URL is valid and exists (default: True)
+        single_fetch: Check existence and extract metadata with one GET (default: True)
+        use_cache: Answer from / store into the metadata and negative caches (default: True)
+        
+    Returns:
+        Dict with the same keys as validate_and_check_url
+    """
+    result = _empty_result(url)
+    
+    # Step 1: Validate URL format
+    if not is_valid_viralkand_url(url):
+        result['message'] = 'Invalid URL format - Must be a viralkand.com URL'
+        return result
+    
+    result['valid'] = True
+    
+    # Reposted links are answered from the caches without any request
+    if use_cache:
+        cached = await negative_cache.get_async(url)
+        if cached is None and extract_meta:
+            cached = await metadata_cache.get_async(url)
+        if cached is not None:
+            return cached
+    
+    # Concurrent requests for the same page (e.g. a link posted in several groups) share one scrape
+    key = (canonicalize_url(url), extract_meta, single_fetch)
+    scraped, shared = await scrape_flight.do(key, lambda: _scrape_async(url, extract_meta, single_fetch))
+    result['exists'] = scraped['exists']
+    result['status_code'] = scraped['status_code']
+    result['message'] = scraped['message']
+    result['metadata'] = dict(scraped['metadata'])
+    
+    if use_cache and not shared:
+        if extract_meta and not NegativeCache.is_negative(result):
+            await metadata_cache.set_async(url, result)
+        elif extract_meta or not result['exists']:
+            await negative_cache.set_async(url, result)
+    
+    return result
+
+
+async def _scrape_async(url: str, extract_meta: bool, single_fetch: bool) -> Dict:
+    """Steps 2 and 3 of validate_and_check_url_async (the network part)"""
+    result = _empty_result(url)
+    
+    # Step 2 + 3 in one round trip: the GET gives both the status and the page
+    if extract_meta and single_fetch:
+        exists, status_code, message, metadata = await check_and_extract_async(url)
+        result['exists'] = exists
+        result['status_code'] = status_code
+        result['message'] = message
+        result['metadata'] = metadata
+    else:
+        # Step 2: Check if URL exists
+        exists, status_code, message = await check_url_exists_async(url)
+        result['exists'] = exists
+        result['status_code'] = status_code
+        result['message'] = message
+        
+        # Step 3: Extract metadata if URL is valid and exists
+        if exists and extract_meta:
+            result['metadata'] = await extract_metadata_async(url)
+    
+    return result
+
+
+async def validate_many_async(urls: Iterable[str], concurrency: int = 10, **kwargs) -> AsyncIterator[Dict]:
+    """
+    Run validate_and_check_url_async over many URLs with bounded concurrency
+    
+    URLs are read from the iterable lazily, so a long (or streamed) list never
+    has more than `concurrency` requests in flight or tasks pending.
+    
+    Args:
+        urls: The URLs to check
+        concurrency: Maximum number of URLs checked at once (default: 10)
+        **kwargs: Passed on to validate_and_check_url_async
+        
+    Yields:
+        Dict: One validate_and_check_url result per URL, in completion order
+    """
+    urls = iter(urls)
+    pending = set()
+    while True:
+        for url in urls:
+            pending.add(asyncio.ensure_future(validate_and_check_url_async(url, **kwargs)))
+            if len(pending) >= concurrency:
+                break
+        if not pending:
+            return
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield task.result()
+
+
+def _read_urls(paths: List[str]) -> Iterable[str]:
+    """Yield the URLs in the given files ("-" for stdin), one or more per line"""
+    for path in paths:
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        try:
+            for line in stream:
+                yield from extract_urls(line)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
 
+async def _bulk(args) -> None:
+    try:
+        async for result in validate_many_async(_read_urls(args.files), concurrency=args.concurrency,
+                                                use_cache=not args.no_cache):
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+    finally:
+        await close_async_client()
+
+
+def main() -> None:
+    """Bulk mode: check URLs from files or stdin and print one JSON result per line"""
+    parser = argparse.ArgumentParser(
+        prog='python -m kand',
+        description='Validate viralkand.com URLs and extract their metadata as JSON lines'
+    )
+    parser.add_argument('files', nargs='*', default=['-'], help='files with URLs (default: stdin)')
+    parser.add_argument('-c', '--concurrency', type=int, default=10, help='URLs checked at once (default: 10)')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the metadata cache')
+    args = parser.parse_args()
+    logging.basicConfig(format='%(levelname)s - %(message)s', level=logging.WARNING)
+    asyncio.run(_bulk(args))
+
+
+if __name__ == "__main__":
+    main()
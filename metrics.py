@@ -0,0 +1,232 @@
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cached page fetch to a slow 50MB upload
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (
+        f'{key}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+    
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def get(self, **labels) -> float:
+        return self._values.get(_labels(labels), 0)
+    
+    def items(self) -> List[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            return [(dict(key), value) for key, value in self._values.items()]
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    Value read from a callback at scrape time
+    
+    The callback returns a number, or {label value: number} when label is set.
+    kind can be "counter" for totals kept elsewhere (e.g. cache hit counters).
+    """
+    
+    def __init__(self, name: str, help: str, func: Callable[[], object], label: Optional[str] = None,
+                 kind: str = 'gauge'):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.label = label
+        self.kind = kind
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.warning(f"Metric {self.name} failed: {str(e)}")
+            return lines
+        if isinstance(value, dict):
+            for label_value, number in value.items():
+                lines.append(f"{self.name}{_format_labels(((self.label, str(label_value)),))} {number}")
+        else:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus style), optionally split by labels"""
+    
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+    
+    def summary(self, **labels) -> Dict[str, float]:
+        """Get count, sum, mean and bucket-estimated p50/p95 for one label set"""
+        with self._lock:
+            entry = self._values.get(_labels(labels))
+            if entry is None:
+                return {'count': 0, 'sum': 0.0, 'avg': 0.0, 'p50': 0.0, 'p95': 0.0}
+            counts, total, count = list(entry[0]), entry[1], entry[2]
+        return {
+            'count': count,
+            'sum': total,
+            'avg': total / count,
+            'p50': self._quantile(counts, count, 0.5),
+            'p95': self._quantile(counts, count, 0.95)
+        }
+    
+    def _quantile(self, counts: List[int], count: int, q: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket (like histogram_quantile)"""
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return 0.0
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', le))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """Set of metrics rendered together in the Prometheus text format"""
+    
+    def __init__(self):
+        self._metrics = []
+    
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Stages: check (existence check), fetch (page download), parse (HTML parsing),
+# download (video download) and upload (Telegram upload)
+stage_seconds = registry.register(Histogram('viralkand_stage_seconds', 'Time spent per processing stage'))
+stage_bytes = registry.register(Counter('viralkand_stage_bytes_total', 'Bytes transferred per stage'))
+errors = registry.register(Counter('viralkand_errors_total', 'Errors per stage and exception type'))
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the time spent in the block under stage, counting any exception it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        record_error(stage, e)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=stage)
+
+
+def record_error(stage: str, error: BaseException) -> None:
+    """Count an error for a stage by its exception type"""
+    errors.inc(stage=stage, type=type(error).__name__)
+
+
+def throughput(stage: str) -> float:
+    """Average bytes per second moved by a stage since startup"""
+    seconds = stage_seconds.summary(stage=stage)['sum']
+    return stage_bytes.get(stage=stage) / seconds if seconds else 0.0
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+        # Skip the request headers
+        while (await asyncio.wait_for(reader.readline(), timeout=10)).strip():
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[1].split('?', 1)[0] == '/metrics':
+            # Rendered off the event loop, callbacks may query MongoDB
+            status, body = '200 OK', (await asyncio.to_thread(registry.render)).encode()
+        else:
+            status, body = '404 Not Found', b'Not found\n'
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host: str, port: int) -> asyncio.AbstractServer:
+    """Serve GET /metrics in the Prometheus text format on host:port"""
+    server = await asyncio.start_server(_handle, host, port)
+    logger.info(f"Metrics served on http://{host}:{port}/metrics")
+    return server
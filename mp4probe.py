@@ -0,0 +1,138 @@
+import struct
+import logging
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A moov atom larger than this is not read (typical ones are a few hundred KB)
+MAX_MOOV_SIZE = 16 * 1024 * 1024
+
+
+class VideoInfo(NamedTuple):
+    duration: Optional[int]  # seconds, rounded
+    width: Optional[int]
+    height: Optional[int]
+    faststart: bool  # moov before mdat, so players can start before the whole file arrived
+
+
+def _boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """Iterate over the boxes in data[start:end] as (type, payload start, box end)"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def _child(data: bytes, start: int, end: int, kind: bytes) -> Optional[Tuple[int, int]]:
+    """Find the first child box of a type, returns (payload start, box end)"""
+    for child, payload, box_end in _boxes(data, start, end):
+        if child == kind:
+            return payload, box_end
+    return None
+
+
+def _duration(data: bytes, moov: Tuple[int, int]) -> Optional[int]:
+    """Movie duration in seconds from mvhd"""
+    mvhd = _child(data, *moov, b'mvhd')
+    if mvhd is None:
+        return None
+    offset = mvhd[0]
+    if data[offset] == 1:
+        timescale, duration = struct.unpack_from('>IQ', data, offset + 20)
+    else:
+        timescale, duration = struct.unpack_from('>II', data, offset + 12)
+    return round(duration / timescale) if timescale else None
+
+
+def _dimensions(data: bytes, moov: Tuple[int, int]) -> Tuple[Optional[int], Optional[int]]:
+    """Display width and height of the first video track from its tkhd"""
+    for kind, payload, box_end in _boxes(data, *moov):
+        if kind != b'trak':
+            continue
+        mdia = _child(data, payload, box_end, b'mdia')
+        hdlr = mdia and _child(data, *mdia, b'hdlr')
+        # hdlr: version/flags, pre_defined, then the handler type
+        if not hdlr or data[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+            continue
+        tkhd = _child(data, payload, box_end, b'tkhd')
+        if tkhd is None:
+            return None, None
+        # Skip version/flags, the times/track id/duration fields, then reserved/layer/group/volume
+        matrix = tkhd[0] + 4 + (32 if data[tkhd[0]] == 1 else 20) + 16
+        a, b = struct.unpack_from('>ii', data, matrix)
+        width, height = struct.unpack_from('>II', data, matrix + 36)
+        width, height = width >> 16, height >> 16
+        # Rotated by 90 or 270 degrees: players show it with the sides swapped
+        if a == 0 and b != 0:
+            width, height = height, width
+        return width or None, height or None
+    return None, None
+
+
+def _read_moov(video_file: BinaryIO) -> Optional[Tuple[bytes, bool]]:
+    """Find the moov atom by hopping over top-level box headers, returns (moov payload, faststart)"""
+    video_file.seek(0, 2)
+    file_size = video_file.tell()
+    offset = 0
+    seen_mdat = False
+    while offset + 8 <= file_size:
+        video_file.seek(offset)
+        header = video_file.read(16)
+        if len(header) < 8:
+            return None
+        size, kind = struct.unpack_from('>I4s', header)
+        header_size = 8
+        if size == 1 and len(header) == 16:
+            size = struct.unpack_from('>Q', header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header_size:
+            return None
+        if kind == b'moov':
+            if size - header_size > MAX_MOOV_SIZE:
+                return None
+            video_file.seek(offset + header_size)
+            return video_file.read(size - header_size), not seen_mdat
+        if kind == b'mdat':
+            seen_mdat = True
+        offset += size
+    return None
+
+
+def probe(video_file: BinaryIO) -> Optional[VideoInfo]:
+    """
+    Read duration and dimensions from an MP4 file's moov atom
+    
+    Only the top-level box headers and the moov atom are read, wherever it
+    is in the file (files without faststart keep it after the media data).
+    
+    Args:
+        video_file: Seekable binary file-like object with the whole video
+    
+    Returns:
+        VideoInfo or None if the file is not an MP4 or its moov is missing
+    """
+    try:
+        found = _read_moov(video_file)
+        if found is None:
+            return None
+        data, faststart = found
+        moov = (0, len(data))
+        width, height = _dimensions(data, moov)
+        return VideoInfo(_duration(data, moov), width, height, faststart)
+    except (struct.error, IndexError, OSError) as e:
+        logger.warning(f"Could not parse MP4 header: {str(e)}")
+        return None
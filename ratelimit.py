@@ -0,0 +1,215 @@
+import time
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+import httpx
+from config import (
+    ORIGIN_RATE, ORIGIN_BURST, ORIGIN_CONCURRENCY, ORIGIN_MIN_CONCURRENCY, ORIGIN_MAX_CONCURRENCY,
+    ORIGIN_MAX_RETRY_AFTER
+)
+
+logger = logging.getLogger(__name__)
+
+# Answers meaning the host is overloaded or pushing back on us
+THROTTLE_STATUS = {403, 429, 500, 502, 503, 504}
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Get the Retry-After delay of a response in seconds (delta-seconds or HTTP-date)"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimiter:
+    """
+    Request rate and concurrency limit for one host
+    
+    Requests take a token from a bucket refilled at `rate` per second (up to
+    `burst` tokens) and a slot out of `limit` concurrent ones. The limit
+    adapts AIMD-style: every success adds 1/limit (about one slot per round
+    of requests), a throttling answer or timeout halves it, at most once per
+    second so one burst of failures counts once. Retry-After pauses the host.
+    """
+    
+    def __init__(self, host: str, rate: float = ORIGIN_RATE, burst: float = ORIGIN_BURST,
+                 limit: float = ORIGIN_CONCURRENCY, min_limit: int = ORIGIN_MIN_CONCURRENCY,
+                 max_limit: int = ORIGIN_MAX_CONCURRENCY):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.active = 0
+        self.throttled = 0
+        self.paused_until = 0.0
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._waiters: List[asyncio.Future] = []
+    
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+    
+    async def acquire(self) -> None:
+        """Wait for a concurrency slot and a token"""
+        while self.active >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                self._waiters.remove(waiter)
+        self.active += 1
+        try:
+            await self._take_token()
+        except BaseException:
+            self.release()
+            raise
+    
+    async def _take_token(self) -> None:
+        while True:
+            now = time.monotonic()
+            wait = self.paused_until - now
+            if wait <= 0:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+    
+    def release(self) -> None:
+        """Give a slot back and let waiting requests re-check the limit"""
+        self.active -= 1
+        self._wake()
+    
+    def _wake(self) -> None:
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+    
+    def success(self) -> None:
+        """Additive increase after a request the host served normally"""
+        if self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+    
+    def throttle(self, reason: str, retry_after: Optional[float] = None) -> None:
+        """Multiplicative decrease after a throttling answer or timeout, pausing for retry_after"""
+        self.throttled += 1
+        now = time.monotonic()
+        if retry_after:
+            retry_after = min(retry_after, ORIGIN_MAX_RETRY_AFTER)
+            self.paused_until = max(self.paused_until, now + retry_after)
+            self._tokens = 0
+        if now - self._last_decrease >= 1:
+            self._last_decrease = now
+            self.limit = max(self.min_limit, self.limit / 2)
+            logger.warning(f"{self.host} is throttling ({reason}), concurrency limit now {int(self.limit)}"
+                           + (f", paused for {retry_after:.0f}s" if retry_after else ""))
+    
+    def observe(self, response: httpx.Response) -> None:
+        """Adapt to a response's status code and Retry-After"""
+        if response.status_code in THROTTLE_STATUS:
+            self.throttle(f"status {response.status_code}", _retry_after(response))
+        else:
+            self.success()
+    
+    def stats(self) -> Dict[str, float]:
+        return {
+            'limit': int(self.limit),
+            'active': self.active,
+            'waiting': self.waiting,
+            'throttled': self.throttled,
+            'paused': max(0.0, self.paused_until - time.monotonic())
+        }
+
+
+class OriginLimiter:
+    """HostLimiter per host, created on first request"""
+    
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.hosts: Dict[str, HostLimiter] = {}
+    
+    def get(self, host: str) -> HostLimiter:
+        limiter = self.hosts.get(host)
+        if limiter is None:
+            limiter = self.hosts[host] = HostLimiter(host, **self.kwargs)
+        return limiter
+    
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {host: limiter.stats() for host, limiter in self.hosts.items()}
+
+
+class _SlotStream(httpx.AsyncByteStream):
+    """Response body that holds its host slot until closed, reporting read timeouts"""
+    
+    def __init__(self, stream: httpx.AsyncByteStream, limiter: HostLimiter):
+        self.stream = stream
+        self.limiter = limiter
+        self.released = False
+    
+    async def __aiter__(self):
+        try:
+            async for chunk in self.stream:
+                yield chunk
+        except httpx.TimeoutException:
+            self.limiter.throttle('read timeout')
+            raise
+    
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            if not self.released:
+                self.released = True
+                self.limiter.release()
+
+
+class LimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Transport applying the per-host limits of an OriginLimiter to every request
+    
+    A slot is held from sending the request until its response is closed, so
+    streamed video downloads count against the host's concurrency for as long
+    as they run.
+    """
+    
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: OriginLimiter):
+        self.transport = transport
+        self.limiter = limiter
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = self.limiter.get(request.url.host)
+        await limiter.acquire()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TimeoutException:
+            limiter.throttle('timeout')
+            limiter.release()
+            raise
+        except BaseException:
+            limiter.release()
+            raise
+        limiter.observe(response)
+        response.stream = _SlotStream(response.stream, limiter)
+        return response
+    
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+# Limits shared by every request of kand's async client (page fetches and video downloads)
+origin_limiter = OriginLimiter()
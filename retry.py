@@ -0,0 +1,22 @@
+import random
+import requests
+import httpx
+from config import RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX
+
+# Statuses worth retrying: the origin (or a proxy in front of it) is overloaded or restarting
+TRANSIENT_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def backoff_delay(attempt: int) -> float:
+    """Seconds to wait before retry number attempt + 1 (exponential, jittered)"""
+    return min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed httpx/requests call is worth retrying"""
+    if isinstance(error, (httpx.TransportError, requests.exceptions.ConnectionError,
+                          requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(error, (httpx.HTTPStatusError, requests.exceptions.HTTPError)) and error.response is not None:
+        return error.response.status_code in TRANSIENT_STATUS
+    return False
@@ -0,0 +1,145 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, Optional
+from config import JOB_WORKERS, JOB_PER_CHAT_LIMIT, JOB_MAX_QUEUED
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at its limit"""
+
+
+class JobScheduler:
+    """
+    Bounded job queue run by a fixed pool of workers
+    
+    Jobs are queued per chat and picked round-robin across chats, so one chat
+    posting many links cannot starve the others. At most `workers` jobs run at
+    once overall and at most `per_chat_limit` per chat.
+    """
+    
+    def __init__(self, workers: int = JOB_WORKERS, per_chat_limit: int = JOB_PER_CHAT_LIMIT,
+                 max_queued: int = JOB_MAX_QUEUED):
+        self.workers = workers
+        self.per_chat_limit = per_chat_limit
+        self.max_queued = max_queued
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._pending: Dict[int, deque] = OrderedDict()
+        self._running: Dict[int, int] = {}
+        self._queued = 0
+        self._waits = deque(maxlen=100)
+        self._condition: Optional[asyncio.Condition] = None
+        self._tasks = []
+    
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+    
+    @property
+    def queued(self) -> int:
+        return self._queued
+    
+    async def start(self) -> None:
+        """Start the worker tasks (call from inside the event loop)"""
+        self._condition = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Job scheduler started with {self.workers} workers")
+    
+    async def stop(self) -> None:
+        """Cancel the workers, dropping anything still queued"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    async def submit(self, chat_id: int, job: Job) -> int:
+        """
+        Queue a job for a chat
+        
+        Args:
+            chat_id: Chat the job belongs to (used for fairness and per-chat limits)
+            job: Coroutine function to run
+            
+        Returns:
+            int: 0 if the job starts right away, otherwise its position in the queue
+            
+        Raises:
+            QueueFull: If max_queued jobs are already waiting
+        """
+        if self._queued >= self.max_queued:
+            self.rejected += 1
+            raise QueueFull(f"{self._queued} jobs already queued")
+        
+        async with self._condition:
+            starts_now = (
+                self.running + self._queued < self.workers
+                and self._running.get(chat_id, 0) + len(self._pending.get(chat_id, ())) < self.per_chat_limit
+            )
+            self._pending.setdefault(chat_id, deque()).append((time.monotonic(), job))
+            self._queued += 1
+            self._condition.notify()
+            return 0 if starts_now else self._queued
+    
+    def _next_job(self):
+        """Pop the next job, rotating through chats that are under their limit"""
+        for chat_id, jobs in self._pending.items():
+            if self._running.get(chat_id, 0) < self.per_chat_limit:
+                enqueued_at, job = jobs.popleft()
+                # Move the chat to the back of the rotation (or drop it when empty)
+                del self._pending[chat_id]
+                if jobs:
+                    self._pending[chat_id] = jobs
+                self._queued -= 1
+                self._running[chat_id] = self._running.get(chat_id, 0) + 1
+                return chat_id, enqueued_at, job
+        return None
+    
+    async def _worker(self) -> None:
+        while True:
+            async with self._condition:
+                picked = self._next_job()
+                while picked is None:
+                    await self._condition.wait()
+                    picked = self._next_job()
+            
+            chat_id, enqueued_at, job = picked
+            self._waits.append(time.monotonic() - enqueued_at)
+            try:
+                await job()
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Job for chat {chat_id} failed: {type(e).__name__}: {str(e)}", exc_info=True)
+            finally:
+                async with self._condition:
+                    self._running[chat_id] -= 1
+                    if not self._running[chat_id]:
+                        del self._running[chat_id]
+                    self._condition.notify_all()
+    
+    def stats(self) -> Dict:
+        """Get queue depth, running jobs and wait times (seconds)"""
+        now = time.monotonic()
+        oldest = min((jobs[0][0] for jobs in self._pending.values() if jobs), default=now)
+        return {
+            'queued': self._queued,
+            'running': self.running,
+            'workers': self.workers,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'avg_wait': sum(self._waits) / len(self._waits) if self._waits else 0.0,
+            'max_wait': max(self._waits, default=0.0),
+            'oldest_wait': now - oldest
+        }
+
+
+# Shared scheduler for video jobs, started by the bot application
+job_scheduler = JobScheduler()
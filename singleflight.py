@@ -0,0 +1,89 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single call
+    
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait for and share its result (or exception). If the
+    caller running it is cancelled, the waiting callers run it again (one of
+    them becomes the new leader) rather than being cancelled with it.
+    """
+    
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+    
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run func once for all concurrent callers with the same key
+        
+        Args:
+            key: Identifies the work (e.g. canonical URL)
+            func: Coroutine function doing the work
+            
+        Returns:
+            Tuple[Any, bool]: (result, shared) - shared is True for callers that
+            reused another caller's result
+        """
+        future = self._inflight.get(key)
+        while future is not None:
+            self.coalesced += 1
+            try:
+                # shield: a cancelled follower must not cancel the leader's work
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                # Only the leader was cancelled (not this caller): take over its work
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                self.coalesced -= 1
+            future = self._inflight.get(key)
+        
+        self.calls += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await func()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a leader without followers does not log a warning
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+    
+    def claim(self, key: Hashable) -> Optional[asyncio.Future]:
+        """
+        Start a call for key that the caller runs itself and ends with finish
+        
+        For work not done by a single coroutine (e.g. several keys uploaded in
+        one request); callers of do with the same key wait for it meanwhile.
+        
+        Returns:
+            Optional[asyncio.Future]: None if a call for key is already running
+        """
+        if key in self._inflight:
+            return None
+        self.calls += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+    
+    def finish(self, key: Hashable, result: Any) -> None:
+        """End a claimed call, handing result to the callers waiting for it"""
+        self._inflight.pop(key).set_result(result)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether a call for key is running"""
+        return key in self._inflight
+    
+    def __len__(self) -> int:
+        return len(self._inflight)
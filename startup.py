@@ -0,0 +1,48 @@
+import time
+import logging
+import importlib
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Reference point of every timing: when this module, the first one bot.py imports, was loaded
+STARTED = time.perf_counter()
+
+# Seconds spent in each startup phase (heavy imports, application build, database connect)
+phases: Dict[str, float] = {}
+
+# Seconds after STARTED at which each milestone (imported, ready, database, first_update) was reached
+milestones: Dict[str, float] = {}
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time a block of startup work as phase name"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - started
+
+
+def time_imports(*modules: str) -> None:
+    """Import modules one by one, timing each (later imports of them are then free)"""
+    for module in modules:
+        with phase(f"import {module}"):
+            importlib.import_module(module)
+
+
+def mark(milestone: str) -> bool:
+    """Record when a milestone is first reached, returns False if it was already"""
+    if milestone in milestones:
+        return False
+    milestones[milestone] = time.perf_counter() - STARTED
+    return True
+
+
+def report() -> str:
+    """One-line summary of the phases and milestones so far"""
+    parts = [f"{name} {seconds:.2f}s" for name, seconds in phases.items()]
+    parts += [f"{name} at {seconds:.2f}s" for name, seconds in milestones.items()]
+    return ", ".join(parts)
@@ -0,0 +1,57 @@
+"""
+Shared setup of the unit tests
+
+The tests run without MongoDB or network access: viralkand.com is served
+by benchmarks.fake_origin.FakeOrigin and Telegram by
+benchmarks.fake_bot_api.FakeBotAPI. Coroutines are run with asyncio.run, so
+no pytest plugin is needed.
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+
+# Set before the bot's config is imported: no /metrics server or video cache, every chat allowed
+os.environ.setdefault('GROUP_IDS', '[]')
+os.environ.setdefault('VIDEO_CACHE_SIZE', '0')
+os.environ.setdefault('ADMIN_IDS', '[1000]')
+os.environ.setdefault('METRICS_PORT', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import pytest
+import kand
+from benchmarks.fake_origin import FakeOrigin
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.bench_e2e import _OriginTransport
+
+
+@pytest.fixture
+def origin():
+    """A started FakeOrigin, stopped after the test"""
+    server = FakeOrigin().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def origin_client(origin, monkeypatch):
+    """
+    Route the shared async client (kand.get_async_client) to the fake origin
+    
+    Tests close it with kand.close_async_client() before their event loop ends.
+    """
+    client = httpx.AsyncClient(headers=kand.HEADERS, follow_redirects=True,
+                               transport=_OriginTransport(origin._server.server_port))
+    monkeypatch.setattr(kand, '_async_client', client)
+    return client
+
+
+@pytest.fixture
+def bot_api():
+    """A started FakeBotAPI, stopped after the test"""
+    server = FakeBotAPI().start()
+    yield server
+    server.stop()
@@ -0,0 +1,129 @@
+import time
+import struct
+import asyncio
+import pytest
+from telegram import Bot, Update
+import kand
+import bot
+from cache import FileIdCache
+from governor import ResourceGovernor
+from singleflight import SingleFlight
+from benchmarks.fake_origin import synthetic_video
+
+MB = 1024 * 1024
+ADMIN_ID = 1000
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    """Uploads, file_ids and budgets of one test are not seen by the next"""
+    monkeypatch.setattr(bot, 'upload_flight', SingleFlight())
+    monkeypatch.setattr(bot, 'file_id_cache', FileIdCache())
+    monkeypatch.setattr(bot, 'resource_governor', ResourceGovernor(memory=64 * MB, disk=0, wait_timeout=5))
+
+
+def _update(telegram_bot: Bot, chat_id: int) -> Update:
+    return Update.de_json({
+        'update_id': chat_id,
+        'message': {
+            'message_id': chat_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'Test'},
+            'from': {'id': ADMIN_ID, 'is_bot': False, 'first_name': 'Admin'},
+            'text': 'https://viralkand.com/post/'
+        }
+    }, telegram_bot)
+
+
+def _run(bot_api, scenario):
+    """Run scenario(telegram_bot) against the fake Bot API"""
+    async def main():
+        try:
+            async with Bot('123456:test', base_url=bot_api.base_url) as telegram_bot:
+                await scenario(telegram_bot)
+        finally:
+            await kand.close_async_client()
+    asyncio.run(main())
+
+
+def _texts(bot_api, chat_id: int):
+    return [call.text for call in bot_api.calls if call.chat_id == chat_id and call.text]
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    """A JPEG header: SOI, an APP0 segment and a baseline start-of-frame"""
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + bytes(9)
+    sof0 = b'\xff\xc0' + struct.pack('>HBHHB', 17, 8, height, width, 3) + bytes(9)
+    return b'\xff\xd8' + app0 + sof0 + b'\xff\xd9'
+
+
+def test_jpeg_size():
+    assert bot._jpeg_size(_jpeg(320, 180)) == (320, 180)
+    assert bot._jpeg_size(b'\xff\xd8not a jpeg') is None
+
+
+@pytest.mark.parametrize('width, height, usable', [(320, 180, True), (640, 360, False)])
+def test_thumbnail_sides_are_checked(origin, origin_client, width, height, usable):
+    url = origin.add_video('/thumb.jpg', _jpeg(width, height))
+    
+    async def scenario():
+        try:
+            return await bot.fetch_thumbnail(url)
+        finally:
+            await kand.close_async_client()
+    
+    assert (asyncio.run(scenario()) is not None) == usable
+
+
+def test_thumbnail_of_an_invalid_url_is_skipped():
+    assert asyncio.run(bot.fetch_thumbnail('not a url')) is None
+    assert asyncio.run(bot.fetch_thumbnail('https://')) is None
+
+
+def test_chats_asking_for_the_same_video_share_one_download(origin, origin_client, bot_api):
+    url = origin.add_video('/v.mp4', synthetic_video(MB))
+    
+    async def scenario(telegram_bot):
+        await asyncio.gather(*(bot.download_and_upload_video(url, _update(telegram_bot, chat_id))
+                               for chat_id in (1, 2)))
+    
+    _run(bot_api, scenario)
+    videos = [call for call in bot_api.calls if call.method == 'sendVideo']
+    assert sorted(call.chat_id for call in videos) == [1, 2]
+    # One probe and one download; the second chat got the first one's file_id
+    assert origin.requests == 2
+    assert min(call.size for call in videos) < 1024
+
+
+def test_chats_sharing_a_failed_upload_get_its_reason(origin, origin_client, bot_api, monkeypatch):
+    monkeypatch.setattr(bot, 'MAX_VIDEO_SIZE', MB)
+    url = origin.add_video('/large.mp4', synthetic_video(2 * MB))
+    
+    async def scenario(telegram_bot):
+        await asyncio.gather(*(bot.download_and_upload_video(url, _update(telegram_bot, chat_id))
+                               for chat_id in (1, 2)))
+    
+    _run(bot_api, scenario)
+    for chat_id in (1, 2):
+        assert any('too large' in text for text in _texts(bot_api, chat_id))
+    # A video too large stays too large: only the leader probed it
+    assert origin.requests == 1
+
+
+def test_album_upload_error_is_reported_and_deferred_videos_still_sent(origin, origin_client, bot_api, monkeypatch):
+    # Room for two of the three videos (a spooled video counts twice in memory)
+    monkeypatch.setattr(bot, 'resource_governor', ResourceGovernor(memory=5 * MB, disk=0, wait_timeout=5))
+    bot_api.failures = {'sendMediaGroup': 1}
+    videos = [(origin.add_video(f'/v{i}.mp4', synthetic_video(MB)), f'Video {i}', None) for i in range(3)]
+    
+    async def scenario(telegram_bot):
+        await bot.send_video_group(videos, _update(telegram_bot, 1))
+    
+    _run(bot_api, scenario)
+    methods = [call.method for call in bot_api.calls]
+    assert methods.count('sendMediaGroup') == 1
+    assert any(text.startswith('❌ Error uploading video: NetworkError') for text in _texts(bot_api, 1))
+    # The deferred video went out on its own after the failed album
+    assert methods.index('sendVideo') > methods.index('sendMediaGroup')
+    assert methods.count('sendVideo') == 1
+    assert bot.resource_governor.used['memory'] == 0
@@ -0,0 +1,83 @@
+import time
+import pytest
+import database
+from cache import TTLCache, MetadataCache, NegativeCache, canonicalize_url
+from config import (
+    NEGATIVE_CACHE_TTL_NOT_FOUND, NEGATIVE_CACHE_TTL_FORBIDDEN, NEGATIVE_CACHE_TTL_ERROR, NEGATIVE_CACHE_TTL_NO_VIDEO
+)
+
+
+def _result(exists=True, status_code=200, video_url='https://cdn.example/v.mp4'):
+    return {'valid': True, 'exists': exists, 'status_code': status_code, 'message': '',
+            'url': 'https://viralkand.com/post/', 'metadata': {'video_url': video_url}}
+
+
+def _expires_in(cache: MetadataCache, url: str) -> float:
+    expires_at, _ = cache.memory._data[canonicalize_url(url)]
+    return expires_at - time.monotonic()
+
+
+@pytest.mark.parametrize('url, canonical', [
+    ('http://www.ViralKand.com/post/?utm_source=x&b=2&a=1#top', 'https://viralkand.com/post?a=1&b=2'),
+    ('https://viralkand.com/post/', 'https://viralkand.com/post'),
+    ('https://viralkand.com/?fbclid=abc', 'https://viralkand.com/'),
+])
+def test_canonicalize_url(url, canonical):
+    assert canonicalize_url(url) == canonical
+
+
+def test_ttl_cache_expires_and_evicts():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=-1)
+    assert cache.get('b') is None
+    cache.set('c', 3)
+    cache.get('a')
+    cache.set('d', 4)
+    # c was the least recently used
+    assert cache.get('c') is None and cache.get('a') == 1 and cache.get('d') == 4
+
+
+def test_reposted_variants_share_an_entry():
+    cache = MetadataCache(persist=False)
+    cache.set('https://www.viralkand.com/post/?utm_source=telegram', _result())
+    result = cache.get('http://viralkand.com/post')
+    assert result['metadata']['video_url'] == 'https://cdn.example/v.mp4'
+    assert result['url'] == 'http://viralkand.com/post'
+
+
+def test_database_entry_is_cached_for_its_remaining_lifetime(monkeypatch):
+    stored = MetadataCache._entry(_result())
+    monkeypatch.setattr(database, 'get_cached_metadata', lambda key, collection: (stored, 5.0))
+    cache = MetadataCache(ttl=3600)
+    assert cache.get('https://viralkand.com/post/') is not None
+    assert cache.db_hits == 1
+    assert _expires_in(cache, 'https://viralkand.com/post/') <= 5.0
+
+
+def test_database_entry_never_outlives_its_own_ttl(monkeypatch):
+    stored = MetadataCache._entry(_result(exists=False, status_code=503))
+    monkeypatch.setattr(database, 'get_cached_metadata', lambda key, collection: (stored, 3600.0))
+    cache = NegativeCache(persist=True)
+    cache.get('https://viralkand.com/post/')
+    assert _expires_in(cache, 'https://viralkand.com/post/') <= NEGATIVE_CACHE_TTL_ERROR
+
+
+@pytest.mark.parametrize('result, ttl', [
+    (_result(exists=False, status_code=404), NEGATIVE_CACHE_TTL_NOT_FOUND),
+    (_result(exists=False, status_code=410), NEGATIVE_CACHE_TTL_NOT_FOUND),
+    (_result(exists=False, status_code=403), NEGATIVE_CACHE_TTL_FORBIDDEN),
+    (_result(exists=False, status_code=0), NEGATIVE_CACHE_TTL_ERROR),
+    (_result(exists=False, status_code=429), NEGATIVE_CACHE_TTL_ERROR),
+    (_result(exists=False, status_code=502), NEGATIVE_CACHE_TTL_ERROR),
+    (_result(video_url=None), NEGATIVE_CACHE_TTL_NO_VIDEO),
+])
+def test_negative_ttl_depends_on_the_failure(result, ttl):
+    cache = NegativeCache(persist=False)
+    assert NegativeCache.is_negative(result)
+    cache.set('https://viralkand.com/post/', result)
+    assert ttl - 1 < _expires_in(cache, 'https://viralkand.com/post/') <= ttl
+
+
+def test_good_results_are_not_negative():
+    assert not NegativeCache.is_negative(_result())
@@ -0,0 +1,61 @@
+import pytest
+from pymongo.errors import AutoReconnect, ServerSelectionTimeoutError
+import database
+
+
+@pytest.fixture(autouse=True)
+def no_outage(monkeypatch):
+    monkeypatch.setattr(database, '_outage_until', 0.0)
+    monkeypatch.setattr(database.time, 'sleep', lambda seconds: None)
+
+
+def _failing(error, times):
+    calls = []
+    
+    def operation():
+        calls.append(1)
+        if len(calls) <= times:
+            raise error
+        return 'ok'
+    return operation, calls
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(database, 'MONGODB_RETRIES', 3)
+    operation, calls = _failing(AutoReconnect('reset'), 2)
+    assert database._retry(operation) == 'ok'
+    assert len(calls) == 3
+
+
+def test_retries_give_up(monkeypatch):
+    monkeypatch.setattr(database, 'MONGODB_RETRIES', 2)
+    operation, calls = _failing(AutoReconnect('reset'), 5)
+    with pytest.raises(AutoReconnect):
+        database._retry(operation)
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('retries', [0, -1])
+def test_at_least_one_attempt_is_made(monkeypatch, retries):
+    monkeypatch.setattr(database, 'MONGODB_RETRIES', retries)
+    operation, calls = _failing(AutoReconnect('reset'), 0)
+    assert database._retry(operation) == 'ok'
+    assert len(calls) == 1
+
+
+def test_outage_is_not_retried_and_skips_later_calls(monkeypatch):
+    monkeypatch.setattr(database, 'MONGODB_RETRIES', 3)
+    operation, calls = _failing(ServerSelectionTimeoutError('down'), 10)
+    for _ in range(3):
+        with pytest.raises(ServerSelectionTimeoutError):
+            database._retry(operation)
+    assert len(calls) == 1
+
+
+def test_outage_backoff_ends(monkeypatch):
+    monkeypatch.setattr(database, 'OUTAGE_BACKOFF', 0.0)
+    operation, calls = _failing(ServerSelectionTimeoutError('down'), 1)
+    with pytest.raises(ServerSelectionTimeoutError):
+        database._retry(operation)
+    assert database._retry(operation) == 'ok'
+    assert len(calls) == 2
@@ -0,0 +1,155 @@
+import io
+import asyncio
+import hashlib
+import tempfile
+import httpx
+import pytest
+import kand
+import downloader
+from downloader import download_video, probe_size, VideoTooLarge
+
+MB = 1024 * 1024
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(downloader, 'backoff_delay', lambda attempt: 0.01)
+    monkeypatch.setattr(downloader, 'DOWNLOAD_MIN_SEGMENT_SIZE', MB)
+
+
+def _video(origin, size: int, path: str = '/v.mp4'):
+    data = bytes(range(256)) * (size // 256)
+    return origin.add_video(path, data), data
+
+
+def _download(url: str, dest, **kwargs):
+    async def scenario():
+        try:
+            return await download_video(url, dest, **kwargs)
+        finally:
+            await kand.close_async_client()
+    return asyncio.run(scenario())
+
+
+def _content(dest) -> bytes:
+    dest.seek(0)
+    return dest.read()
+
+
+def test_single_stream_download(origin, origin_client):
+    origin.accept_ranges = False
+    url, data = _video(origin, 3 * MB)
+    with tempfile.TemporaryFile() as dest:
+        size, content_hash = _download(url, dest)
+        assert _content(dest) == data
+    assert size == len(data) and content_hash == hashlib.sha256(data).hexdigest()
+    assert origin.requests == 1
+
+
+def test_segmented_download_into_a_file(origin, origin_client):
+    url, data = _video(origin, 4 * MB)
+    with tempfile.TemporaryFile() as dest:
+        size, content_hash = _download(url, dest, segments=4)
+        assert _content(dest) == data
+    assert content_hash == hashlib.sha256(data).hexdigest()
+    # The first range comes from the initial response
+    assert origin.requests == 4
+
+
+def test_spooled_download_that_fits_stays_in_memory(origin, origin_client):
+    url, data = _video(origin, 4 * MB)
+    dest = tempfile.SpooledTemporaryFile(max_size=8 * MB)
+    _download(url, dest, segments=4)
+    assert not dest._rolled
+    assert _content(dest) == data
+    assert origin.requests == 1
+
+
+def test_spooled_download_too_large_for_memory_is_segmented(origin, origin_client):
+    url, data = _video(origin, 4 * MB)
+    dest = tempfile.SpooledTemporaryFile(max_size=2 * MB)
+    _download(url, dest, segments=4)
+    assert dest._rolled
+    assert _content(dest) == data
+    assert origin.requests == 4
+
+
+def test_in_memory_buffer(origin, origin_client):
+    url, data = _video(origin, 2 * MB)
+    dest = io.BytesIO()
+    _download(url, dest, segments=4)
+    assert dest.getvalue() == data
+
+
+def test_dropped_connection_resumes(origin, origin_client):
+    origin.accept_ranges = True
+    origin.drops = 1
+    origin.drop_after = MB // 2
+    url, data = _video(origin, 2 * MB)
+    dest = io.BytesIO()
+    _download(url, dest, segments=1)
+    assert dest.getvalue() == data
+    assert origin.requests == 2
+
+
+def test_transient_status_is_retried(origin, origin_client):
+    origin.errors = 2
+    url, data = _video(origin, MB)
+    dest = io.BytesIO()
+    _download(url, dest)
+    assert dest.getvalue() == data
+
+
+def test_oversized_video_is_rejected_before_its_body(origin, origin_client):
+    url, _ = _video(origin, 2 * MB)
+    with pytest.raises(VideoTooLarge) as raised:
+        _download(url, io.BytesIO(), max_size=MB)
+    assert raised.value.size == 2 * MB and raised.value.limit == MB
+
+
+def test_failing_range_cancels_its_siblings(origin, origin_client, monkeypatch):
+    url, _ = _video(origin, 4 * MB)
+    fetch_range = downloader._fetch_range
+    siblings = []
+    
+    async def failing_range(client, video_url, fd, segment, *args, **kwargs):
+        if segment.start == 2 * MB:
+            await asyncio.sleep(0.01)
+            raise downloader.DownloadError('range failed')
+        siblings.append(asyncio.current_task())
+        return await fetch_range(client, video_url, fd, segment, *args, **kwargs)
+    
+    monkeypatch.setattr(downloader, '_fetch_range', failing_range)
+    # Slow enough that the other ranges are still running when one fails
+    origin.rate_per_connection = MB
+    
+    async def scenario():
+        try:
+            with tempfile.TemporaryFile() as dest:
+                with pytest.raises(downloader.DownloadError):
+                    await download_video(url, dest, segments=4)
+            return [task.done() for task in siblings]
+        finally:
+            await kand.close_async_client()
+    
+    assert asyncio.run(scenario()) == [True, True, True]
+
+
+def _probe(url: str):
+    async def scenario():
+        try:
+            return await probe_size(url)
+        finally:
+            await kand.close_async_client()
+    return asyncio.run(scenario())
+
+
+def test_probe_size_reads_only_headers(origin, origin_client):
+    url, data = _video(origin, MB)
+    assert _probe(url) == len(data)
+    assert origin.requests == 1
+
+
+def test_probe_size_of_a_dead_link_raises(origin, origin_client):
+    with pytest.raises(httpx.HTTPStatusError):
+        _probe(origin.url('/missing.mp4'))
@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from governor import ResourceGovernor, BudgetExhausted
+
+
+def test_reservations_wait_for_room():
+    async def scenario():
+        governor = ResourceGovernor(memory=100, disk=0, wait_timeout=1)
+        first = governor.reservation()
+        await first.reserve(memory=80)
+        second = governor.reservation()
+        waiting = asyncio.create_task(second.reserve(memory=50))
+        await asyncio.sleep(0.01)
+        assert not waiting.done() and governor.waiting == 1
+        first.release()
+        await waiting
+        return governor.stats()
+    
+    stats = asyncio.run(scenario())
+    assert stats['memory_used'] == 50
+    assert stats['memory_peak'] == 80
+    assert stats['waited'] == 1
+
+
+def test_reservation_is_rejected_after_the_timeout():
+    async def scenario():
+        governor = ResourceGovernor(memory=100, disk=0, wait_timeout=0.05)
+        await governor.reservation().reserve(memory=80)
+        with pytest.raises(BudgetExhausted) as raised:
+            await governor.reservation().reserve(memory=50)
+        return governor, raised.value
+    
+    governor, error = asyncio.run(scenario())
+    assert error.resource == 'memory' and error.used == 80
+    assert governor.rejected == 1 and governor.waiting == 0
+
+
+def test_zero_timeout_fails_fast_without_counting_a_rejection():
+    async def scenario():
+        governor = ResourceGovernor(memory=0, disk=100, wait_timeout=10)
+        await governor.reservation().reserve(disk=80)
+        with pytest.raises(BudgetExhausted):
+            await governor.reservation().reserve(disk=50, timeout=0)
+        return governor
+    
+    governor = asyncio.run(scenario())
+    assert governor.rejected == 0 and governor.waited == 0
+
+
+def test_oversized_reservation_is_clamped_to_the_budget():
+    async def scenario():
+        governor = ResourceGovernor(memory=100, disk=0, wait_timeout=0.05)
+        reservation = governor.reservation()
+        await reservation.reserve(memory=500, disk=500)
+        amounts = dict(reservation.amounts)
+        reservation.release()
+        reservation.release()
+        return amounts, governor.used
+    
+    amounts, used = asyncio.run(scenario())
+    # Disk has no limit (0), so it is reserved as asked
+    assert amounts == {'memory': 100, 'disk': 500}
+    assert used == {'memory': 0, 'disk': 0}
+
+
+def test_admit_picks_requests_that_fit_together():
+    governor = ResourceGovernor(memory=0, disk=25, wait_timeout=1)
+    assert governor.admit([{'disk': 10}, {'disk': 20}, {'disk': 10}, {'disk': 10}]) == [0, 2]
+    # The first one is always picked, reserving it is clamped
+    assert governor.admit([{'disk': 40}, {'disk': 10}]) == [0]
+    assert governor.admit([]) == []
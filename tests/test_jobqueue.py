@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime, timezone
+from pymongo.errors import ServerSelectionTimeoutError
+from jobqueue import LeaseQueue
+
+
+def _queue(jobs, **kwargs) -> LeaseQueue:
+    """A LeaseQueue whose MongoDB operations are replaced by an in-memory job list"""
+    queue = LeaseQueue(workers=1, poll_interval=0.01, heartbeat_interval=0.01, **kwargs)
+    queue.claim = lambda: jobs.pop(0) if jobs else None
+    queue.outcomes = []
+    queue.complete = lambda job_id: queue.outcomes.append(('complete', job_id))
+    queue.fail = lambda job_id, attempts, error: queue.outcomes.append(('fail', job_id))
+    queue.release = lambda job_id: queue.outcomes.append(('release', job_id))
+    queue.heartbeat = lambda job_id: True
+    return queue
+
+
+def _job(job_id, payload=None):
+    return {'_id': job_id, 'chat_id': 1, 'attempts': 1, 'payload': payload or {},
+            'created_at': datetime.now(timezone.utc)}
+
+
+def _unreachable(*args):
+    raise ServerSelectionTimeoutError('cluster down')
+
+
+def test_worker_survives_failing_to_record_outcomes():
+    async def scenario():
+        queue = _queue([_job(1), _job(2, {'fail': True}), _job(3)])
+        queue.complete = _unreachable
+        queue.fail = _unreachable
+        handled = []
+        
+        async def handler(payload):
+            handled.append(payload)
+            if payload.get('fail'):
+                raise RuntimeError('job failed')
+        
+        await queue.start(handler)
+        await asyncio.sleep(0.2)
+        alive = [not task.done() for task in queue._tasks]
+        await queue.stop()
+        return handled, alive, queue
+    
+    handled, alive, queue = asyncio.run(scenario())
+    assert len(handled) == 3
+    assert alive == [True]
+    assert (queue.completed, queue.failed) == (2, 1)
+
+
+def test_outcomes_are_recorded():
+    async def scenario():
+        queue = _queue([_job(1), _job(2, {'fail': True})])
+        
+        async def handler(payload):
+            if payload.get('fail'):
+                raise RuntimeError('job failed')
+        
+        await queue.start(handler)
+        await asyncio.sleep(0.1)
+        await queue.stop()
+        return queue.outcomes
+    
+    assert asyncio.run(scenario()) == [('complete', 1), ('fail', 2)]
+
+
+def test_stopping_hands_running_jobs_back():
+    async def scenario():
+        queue = _queue([_job(1)])
+        
+        async def handler(payload):
+            await asyncio.sleep(10)
+        
+        await queue.start(handler)
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return queue.outcomes
+    
+    assert asyncio.run(scenario()) == [('release', 1)]
+
+
+def test_lost_lease_cancels_the_job():
+    async def scenario():
+        queue = _queue([_job(1)])
+        queue.heartbeat = lambda job_id: False
+        cancelled = []
+        
+        async def handler(payload):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+        
+        await queue.start(handler)
+        await asyncio.sleep(0.1)
+        await queue.stop()
+        return cancelled, queue.lost, queue.outcomes
+    
+    cancelled, lost, outcomes = asyncio.run(scenario())
+    assert cancelled == [1] and lost == 1
+    # The job belongs to whoever took the lease over: nothing is recorded
+    assert outcomes == []
+
+
+def test_stats_survive_an_unreachable_database():
+    async def scenario():
+        queue = _queue([])
+        queue.counts = _unreachable
+        await queue.start(lambda payload: None)
+        stats = await queue.stats_async()
+        await queue.stop()
+        return stats
+    
+    stats = asyncio.run(scenario())
+    assert stats['queued'] is None
+    assert stats['workers'] == 1
@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+import kand
+from benchmarks.fake_origin import synthetic_page
+
+VIDEO_URL = 'https://cdn.viralkand.com/videos/1.mp4'
+
+
+def _scrape(url: str):
+    async def scenario():
+        try:
+            return await kand.validate_and_check_url_async(url, use_cache=False)
+        finally:
+            await kand.close_async_client()
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('url, valid', [
+    ('https://viralkand.com/some-post/', True),
+    ('https://www.viralkand.com/some-post/', True),
+    ('https://example.com/some-post/', False),
+    ('viralkand.com/some-post/', False),
+])
+def test_url_validation(url, valid):
+    assert kand.is_valid_viralkand_url(url) == valid
+
+
+def test_metadata_is_read_from_the_head(origin, origin_client):
+    origin.add_page('/post/', synthetic_page(title='A post', video_url=VIDEO_URL, body_size=512 * 1024))
+    result = _scrape('https://viralkand.com/post/')
+    assert result['exists'] and result['status_code'] == 200
+    assert result['metadata']['video_url'] == VIDEO_URL
+    assert result['metadata']['title'] == 'A post'
+
+
+def test_video_url_outside_the_head_is_found_by_the_fallback(origin, origin_client):
+    page = (f'<html><head><title>Late</title></head><body>{"<p>text</p>" * 1000}'
+            f'<video><meta itemprop="contentURL" content="{VIDEO_URL}"></video></body></html>').encode()
+    origin.add_page('/late/', page)
+    assert _scrape('https://viralkand.com/late/')['metadata']['video_url'] == VIDEO_URL
+
+
+def test_fallback_parses_at_most_page_max_size(origin, origin_client, monkeypatch):
+    monkeypatch.setattr(kand, 'PAGE_MAX_SIZE', 256 * 1024)
+    parsed = []
+    parse_metadata = kand._parse_metadata
+    monkeypatch.setattr(kand, '_parse_metadata', lambda content: parsed.append(len(content)) or parse_metadata(content))
+    page = b'<html><head><title>Huge</title></head><body>' + b'<p>text</p>' * 200000 + b'</body></html>'
+    origin.add_page('/huge/', page)
+    result = _scrape('https://viralkand.com/huge/')
+    assert result['exists'] and result['metadata']['video_url'] is None
+    assert parsed and parsed[0] <= 256 * 1024
+
+
+def test_missing_page(origin, origin_client):
+    result = _scrape('https://viralkand.com/missing/')
+    assert not result['exists'] and result['status_code'] == 404
+
+
+def test_transient_errors_are_retried(origin, origin_client, monkeypatch):
+    monkeypatch.setattr(kand, 'backoff_delay', lambda attempt: 0.01)
+    origin.add_page('/post/', synthetic_page(video_url=VIDEO_URL))
+    origin.errors = 1
+    result = _scrape('https://viralkand.com/post/')
+    assert result['exists'] and result['metadata']['video_url'] == VIDEO_URL
+    assert origin.requests == 2
+
+
+def test_metadata_stream_stops_keeping_chunks_past_the_cap(monkeypatch):
+    monkeypatch.setattr(kand, 'PAGE_MAX_SIZE', 100)
+    stream = kand._MetadataStream('text/html; charset=utf-8')
+    assert not stream.feed(b'<html><head><title>x</title>')
+    assert stream.feed(b'x' * 100)
+    assert stream.truncated and stream.size < 100
+    assert not stream.keep(b'more')
@@ -0,0 +1,25 @@
+import io
+import pytest
+from mp4probe import probe
+from benchmarks.fake_origin import synthetic_video
+
+
+@pytest.mark.parametrize('faststart', [True, False])
+def test_duration_and_dimensions_wherever_the_moov_is(faststart):
+    video = synthetic_video(256 * 1024, duration=42, width=640, height=360, faststart=faststart)
+    info = probe(io.BytesIO(video))
+    assert (info.duration, info.width, info.height) == (42, 640, 360)
+    assert info.faststart == faststart
+
+
+def test_not_an_mp4():
+    assert probe(io.BytesIO(b'<html>not a video</html>' * 100)) is None
+
+
+def test_truncated_before_the_moov():
+    video = synthetic_video(256 * 1024, faststart=False)
+    assert probe(io.BytesIO(video[:128 * 1024])) is None
+
+
+def test_empty_file():
+    assert probe(io.BytesIO(b'')) is None
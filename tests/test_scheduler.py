@@ -0,0 +1,103 @@
+import asyncio
+import pytest
+from scheduler import JobScheduler, QueueFull
+
+
+def test_jobs_are_picked_round_robin_across_chats():
+    async def scenario():
+        scheduler = JobScheduler(workers=1, per_chat_limit=1, max_queued=10)
+        await scheduler.start()
+        order = []
+        
+        def job(name):
+            async def run():
+                order.append(name)
+                await asyncio.sleep(0.01)
+            return run
+        
+        for name in ('a1', 'a2', 'a3'):
+            await scheduler.submit(1, job(name))
+        await scheduler.submit(2, job('b1'))
+        while scheduler.queued or scheduler.running:
+            await asyncio.sleep(0.01)
+        await scheduler.stop()
+        return order
+    
+    order = asyncio.run(scenario())
+    # Chat 2 does not wait for all of chat 1's jobs
+    assert order.index('b1') < order.index('a3')
+
+
+def test_per_chat_limit_and_worker_count_are_respected():
+    async def scenario():
+        scheduler = JobScheduler(workers=3, per_chat_limit=2, max_queued=20)
+        await scheduler.start()
+        peak = {'total': 0, 'chat': 0}
+        running = {'total': 0, 'chat': 0}
+        
+        def job(chat):
+            async def run():
+                running['total'] += 1
+                running['chat'] += chat == 1
+                peak['total'] = max(peak['total'], running['total'])
+                peak['chat'] = max(peak['chat'], running['chat'])
+                await asyncio.sleep(0.02)
+                running['total'] -= 1
+                running['chat'] -= chat == 1
+            return run
+        
+        for i in range(6):
+            await scheduler.submit(1, job(1))
+            await scheduler.submit(2 + i, job(2 + i))
+        while scheduler.queued or scheduler.running:
+            await asyncio.sleep(0.01)
+        await scheduler.stop()
+        return peak, scheduler.completed
+    
+    peak, completed = asyncio.run(scenario())
+    assert peak == {'total': 3, 'chat': 2}
+    assert completed == 12
+
+
+def test_failing_job_does_not_stop_its_worker():
+    async def scenario():
+        scheduler = JobScheduler(workers=1, per_chat_limit=1, max_queued=10)
+        await scheduler.start()
+        
+        async def fail():
+            raise RuntimeError('boom')
+        
+        async def succeed():
+            pass
+        
+        await scheduler.submit(1, fail)
+        await scheduler.submit(1, succeed)
+        while scheduler.queued or scheduler.running:
+            await asyncio.sleep(0.01)
+        await scheduler.stop()
+        return scheduler.failed, scheduler.completed
+    
+    assert asyncio.run(scenario()) == (1, 1)
+
+
+def test_full_queue_rejects_jobs():
+    async def scenario():
+        scheduler = JobScheduler(workers=1, per_chat_limit=1, max_queued=2)
+        await scheduler.start()
+        release = asyncio.Event()
+        
+        async def block():
+            await release.wait()
+        
+        await scheduler.submit(1, block)
+        await asyncio.sleep(0.01)
+        positions = [await scheduler.submit(1, block), await scheduler.submit(1, block)]
+        with pytest.raises(QueueFull):
+            await scheduler.submit(1, block)
+        release.set()
+        await scheduler.stop()
+        return positions, scheduler.rejected
+    
+    positions, rejected = asyncio.run(scenario())
+    assert positions == [1, 2]
+    assert rejected == 1
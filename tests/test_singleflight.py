@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    async def scenario():
+        flight = SingleFlight()
+        runs = []
+        
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return 'result'
+        
+        results = await asyncio.gather(*(flight.do('key', work) for _ in range(5)))
+        return flight, runs, results
+    
+    flight, runs, results = asyncio.run(scenario())
+    assert len(runs) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(result == 'result' for result, _ in results)
+    assert flight.coalesced == 4 and len(flight) == 0
+
+
+def test_followers_get_the_leaders_exception():
+    async def scenario():
+        flight = SingleFlight()
+        
+        async def work():
+            await asyncio.sleep(0.05)
+            raise ValueError('boom')
+        
+        return await asyncio.gather(*(flight.do('key', work) for _ in range(3)), return_exceptions=True)
+    
+    assert all(isinstance(result, ValueError) for result in asyncio.run(scenario()))
+
+
+def test_followers_take_over_when_the_leader_is_cancelled():
+    async def scenario():
+        flight = SingleFlight()
+        runs = []
+        
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return len(runs)
+        
+        leader = asyncio.create_task(flight.do('key', work))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(flight.do('key', work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(leader, *followers, return_exceptions=True)
+    
+    leader, *followers = asyncio.run(scenario())
+    assert isinstance(leader, asyncio.CancelledError)
+    # One follower ran the work again, the others shared its result
+    assert sorted(shared for _, shared in followers) == [False, True, True]
+    assert all(result == 2 for result, _ in followers)
+
+
+def test_cancelled_follower_does_not_cancel_the_leader():
+    async def scenario():
+        flight = SingleFlight()
+        
+        async def work():
+            await asyncio.sleep(0.05)
+            return 'result'
+        
+        leader = asyncio.create_task(flight.do('key', work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do('key', work))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+    
+    leader, follower = asyncio.run(scenario())
+    assert leader == ('result', False)
+    assert isinstance(follower, asyncio.CancelledError)
+
+
+def test_claimed_call_is_shared_until_finished():
+    async def scenario():
+        flight = SingleFlight()
+        assert flight.claim('key') is not None
+        assert flight.claim('key') is None
+        assert 'key' in flight
+        
+        async def work():
+            raise AssertionError('a claimed key must not run again')
+        
+        follower = asyncio.create_task(flight.do('key', work))
+        await asyncio.sleep(0.01)
+        flight.finish('key', 'file_id')
+        return await follower, 'key' in flight
+    
+    result, still_running = asyncio.run(scenario())
+    assert result == ('file_id', True)
+    assert not still_running
+
+
+@pytest.mark.parametrize('key', ['a', ('chat', 1)])
+def test_keys_are_independent(key):
+    async def scenario():
+        flight = SingleFlight()
+        
+        async def work():
+            await asyncio.sleep(0.01)
+            return key
+        
+        return await asyncio.gather(flight.do(key, work), flight.do('other', work))
+    
+    assert [shared for _, shared in asyncio.run(scenario())] == [False, False]
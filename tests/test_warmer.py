@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+import warmer
+from warmer import CacheWarmer, parse_feed
+from benchmarks.fake_origin import synthetic_sitemap, synthetic_feed
+
+POSTS = [f'https://viralkand.com/post-{i}/' for i in range(5)]
+
+
+def test_sitemap_posts_are_sorted_newest_first():
+    # synthetic_sitemap modifies the last url latest
+    assert parse_feed(synthetic_sitemap(POSTS)) == {'posts': POSTS[::-1], 'sitemaps': []}
+
+
+def test_rss_keeps_the_feed_order():
+    assert parse_feed(synthetic_feed(POSTS))['posts'] == POSTS
+
+
+def test_atom_links():
+    atom = ('<feed xmlns="http://www.w3.org/2005/Atom">'
+            '<entry><link href="https://viralkand.com/a/"/><link rel="edit" href="https://viralkand.com/edit/"/></entry>'
+            '<entry><link rel="alternate" href="https://viralkand.com/b/"/></entry></feed>').encode()
+    assert parse_feed(atom)['posts'] == ['https://viralkand.com/a/', 'https://viralkand.com/b/']
+
+
+def test_sitemap_index_lists_child_sitemaps_newest_first():
+    index = ('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+             '<sitemap><loc>https://viralkand.com/old.xml</loc><lastmod>2025-01-01</lastmod></sitemap>'
+             '<sitemap><loc>https://viralkand.com/new.xml</loc><lastmod>2026-01-01</lastmod></sitemap>'
+             '</sitemapindex>').encode()
+    assert parse_feed(index) == {'posts': [], 'sitemaps': ['https://viralkand.com/new.xml',
+                                                           'https://viralkand.com/old.xml']}
+
+
+def test_foreign_links_are_dropped():
+    assert parse_feed(synthetic_feed(['https://example.com/x/', POSTS[0]]))['posts'] == [POSTS[0]]
+
+
+def _warmer(feed, results, max_entries=2):
+    """A warmer over an in-memory feed, and a scrape answering with the status codes in results"""
+    cache_warmer = CacheWarmer(feed_urls=['https://viralkand.com/feed/'], max_entries=max_entries,
+                               rate=1000, prefetch_bytes=0)
+    
+    async def fetch_feed(url):
+        return {'posts': list(feed), 'sitemaps': []}
+    
+    cache_warmer._fetch_feed = fetch_feed
+    cache_warmer.scraped = []
+    
+    async def scrape(post):
+        cache_warmer.scraped.append(post)
+        return {'status_code': results.get(post, 200), 'metadata': {}}
+    
+    return cache_warmer, scrape
+
+
+@pytest.fixture(autouse=True)
+def idle(monkeypatch):
+    monkeypatch.setattr(warmer, '_busy', lambda: False)
+
+
+def test_first_poll_skips_the_archive(monkeypatch):
+    feed = list(POSTS)
+    cache_warmer, scrape = _warmer(feed, {})
+    monkeypatch.setattr(warmer, 'validate_and_check_url_async', scrape)
+    
+    async def scenario():
+        await cache_warmer.poll()
+        first = list(cache_warmer.scraped)
+        feed.insert(0, 'https://viralkand.com/brand-new/')
+        await cache_warmer.poll()
+        return first, cache_warmer.scraped[len(first):]
+    
+    first, second = asyncio.run(scenario())
+    assert first == POSTS[:2]
+    assert second == ['https://viralkand.com/brand-new/']
+
+
+def test_failed_scrapes_are_tried_again(monkeypatch):
+    results = {POSTS[0]: 0, POSTS[1]: 503}
+    cache_warmer, scrape = _warmer(POSTS[:3], results, max_entries=3)
+    monkeypatch.setattr(warmer, 'validate_and_check_url_async', scrape)
+    
+    async def scenario():
+        await cache_warmer.poll()
+        results.clear()
+        await cache_warmer.poll()
+        await cache_warmer.poll()
+        return cache_warmer.scraped
+    
+    assert asyncio.run(scenario()) == POSTS[:3] + POSTS[:2]
@@ -0,0 +1,216 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Optional, Tuple
+from config import VIDEO_CACHE_DIR, VIDEO_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class VideoCache:
+    """
+    Content-addressed on-disk cache of downloaded videos with an LRU byte budget
+    
+    Each video is stored once as <sha256>.mp4, and every video_url that served
+    those bytes has a small <sha256 of url>.url record pointing to it. Files
+    are written under a temporary name, fsynced and moved into place with
+    os.replace, so a crash never leaves a partial video under a real name;
+    leftover temporary files are removed when the cache is first used. When the
+    total size exceeds `max_bytes`, the least recently used videos are deleted.
+    """
+    
+    def __init__(self, directory: str = VIDEO_CACHE_DIR, max_bytes: int = VIDEO_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._files: Dict[str, int] = OrderedDict()  # content hash -> size, least recently used first
+        self._urls: Dict[str, str] = {}  # video_url -> content hash
+        self._size = 0
+        self._loaded = False
+        self._lock = threading.RLock()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+    
+    def _video_path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, f"{content_hash}.mp4")
+    
+    def path(self, content_hash: str) -> Optional[str]:
+        """Get the file path of a cached video, or None if it is not cached"""
+        with self._lock:
+            return self._video_path(content_hash) if content_hash in self._files else None
+    
+    def _url_path(self, video_url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(video_url.encode()).hexdigest() + '.url')
+    
+    def _load(self) -> None:
+        """Rebuild the index from the cache directory (first use only)"""
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        videos = []
+        url_records = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                # Debris from a write interrupted by a crash
+                os.unlink(entry.path)
+            elif entry.name.endswith('.mp4'):
+                stat = entry.stat()
+                videos.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+            elif entry.name.endswith('.url'):
+                url_records.append(entry.path)
+        
+        # Hits touch the file's mtime, so it orders videos by last use across restarts
+        for _, content_hash, size in sorted(videos):
+            self._files[content_hash] = size
+            self._size += size
+        for path in url_records:
+            try:
+                with open(path, encoding='utf-8') as record:
+                    data = json.load(record)
+                if data['hash'] in self._files:
+                    self._urls[data['url']] = data['hash']
+                    continue
+            except (OSError, ValueError, KeyError):
+                pass
+            os.unlink(path)
+        self._loaded = True
+        logger.info(f"Video cache at {self.directory}: {len(self._files)} videos, {self._size / (1024 * 1024):.1f}MB")
+    
+    def __contains__(self, video_url: str) -> bool:
+        """Whether the video for video_url is cached (without counting a hit or miss)"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._load()
+            return video_url in self._urls
+    
+    def open(self, video_url: str) -> Optional[Tuple[BinaryIO, int, str]]:
+        """
+        Open the cached video for video_url
+        
+        Returns:
+            Tuple[BinaryIO, int, str]: (file opened for reading, size, content hash),
+            or None if the video is not cached
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._load()
+            content_hash = self._urls.get(video_url)
+            if content_hash is None:
+                self.misses += 1
+                return None
+            path = self._video_path(content_hash)
+            try:
+                video_file = open(path, 'rb')
+                os.utime(path)
+            except FileNotFoundError:
+                # Deleted behind our back - forget it
+                self._remove(content_hash)
+                self.misses += 1
+                return None
+            self._files.move_to_end(content_hash)
+            self.hits += 1
+            return video_file, self._files[content_hash], content_hash
+    
+    def create(self) -> BinaryIO:
+        """Create a temporary file in the cache directory to download a video into"""
+        with self._lock:
+            self._load()
+        return tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False)
+    
+    def commit(self, video_file: BinaryIO, video_url: str, content_hash: str, size: int) -> bool:
+        """
+        Move a fully downloaded temporary file into the cache
+        
+        The file stays open and readable either way. Videos larger than the
+        whole budget are not kept (their temporary file stays until discard()).
+        
+        Returns:
+            bool: True if the video was cached
+        """
+        temp_path = video_file.name
+        if size > self.max_bytes:
+            return False
+        
+        video_file.flush()
+        os.fsync(video_file.fileno())
+        with self._lock:
+            path = self._video_path(content_hash)
+            if content_hash in self._files:
+                # Same bytes already cached under another URL
+                os.unlink(temp_path)
+                self._files.move_to_end(content_hash)
+            else:
+                os.replace(temp_path, path)
+                self._files[content_hash] = size
+                self._size += size
+            self._write_url(video_url, content_hash)
+            self._evict(keep=content_hash)
+        return True
+    
+    def discard(self, video_file: BinaryIO) -> None:
+        """Close a file from create() or open(), deleting it unless it was committed to the cache"""
+        video_file.close()
+        if not str(video_file.name).endswith('.tmp'):
+            return
+        try:
+            os.unlink(video_file.name)
+        except FileNotFoundError:
+            pass
+    
+    def _write_url(self, video_url: str, content_hash: str) -> None:
+        """Atomically record that video_url serves the video with content_hash"""
+        path = self._url_path(video_url)
+        with open(path + '.tmp', 'w', encoding='utf-8') as record:
+            json.dump({'url': video_url, 'hash': content_hash}, record)
+        os.replace(path + '.tmp', path)
+        self._urls[video_url] = content_hash
+    
+    def _remove(self, content_hash: str) -> None:
+        """Drop a video and every URL record pointing to it"""
+        self._size -= self._files.pop(content_hash, 0)
+        try:
+            os.unlink(self._video_path(content_hash))
+        except FileNotFoundError:
+            pass
+        for video_url in [url for url, cached in self._urls.items() if cached == content_hash]:
+            del self._urls[video_url]
+            try:
+                os.unlink(self._url_path(video_url))
+            except FileNotFoundError:
+                pass
+    
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Delete least recently used videos until the cache fits its budget"""
+        while self._size > self.max_bytes and len(self._files) > 1:
+            content_hash = next(iter(self._files))
+            if content_hash == keep:
+                self._files.move_to_end(content_hash)
+                continue
+            # Files still open for an upload stay readable until closed
+            self._remove(content_hash)
+            self.evictions += 1
+    
+    def stats(self) -> Dict[str, int]:
+        """Get size and hit/miss counters"""
+        return {
+            'files': len(self._files),
+            'bytes': self._size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+# Shared on-disk video cache used by bot.upload_video and bot.send_video_group
+video_cache = VideoCache()
@@ -0,0 +1,243 @@
+import time
+import asyncio
+import logging
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import httpx
+from kand import get_async_client, validate_and_check_url_async, is_valid_viralkand_url
+from cache import file_id_cache
+from videocache import video_cache
+from downloader import download_video, probe_size, VideoTooLarge, DownloadError
+from governor import resource_governor, BudgetExhausted
+from scheduler import job_scheduler
+from jobqueue import job_queue
+from ratelimit import origin_limiter
+from retry import TRANSIENT_STATUS
+from config import (
+    MAX_VIDEO_SIZE, WARMER_FEED_URLS, WARMER_INTERVAL, WARMER_MAX_ENTRIES, WARMER_RATE, WARMER_PREFETCH_BYTES
+)
+
+logger = logging.getLogger(__name__)
+
+# Feeds larger than this are not parsed
+FEED_MAX_SIZE = 10 * 1024 * 1024
+
+# Post URLs remembered as already warmed
+SEEN_MAX = 10000
+
+
+def _tag(element: ElementTree.Element) -> str:
+    """Tag name without its XML namespace"""
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def _text(element: ElementTree.Element, name: str) -> str:
+    for child in element:
+        if _tag(child) == name:
+            return (child.text or '').strip()
+    return ''
+
+
+def parse_feed(content: bytes) -> Dict[str, List[str]]:
+    """
+    Read post URLs from a sitemap, sitemap index, RSS or Atom feed
+    
+    Returns:
+        Dict with 'posts' (newest first where the feed says so) and 'sitemaps'
+        (child sitemaps of an index, most recently modified first)
+    """
+    root = ElementTree.fromstring(content)
+    kind = _tag(root)
+    if kind == 'sitemapindex':
+        sitemaps = [(_text(entry, 'lastmod'), _text(entry, 'loc')) for entry in root if _tag(entry) == 'sitemap']
+        return {'posts': [], 'sitemaps': [loc for _, loc in sorted(sitemaps, reverse=True) if loc]}
+    if kind == 'urlset':
+        # Sitemaps are not ordered; lastmod (ISO 8601, so sortable as text) puts new posts first
+        entries = [(_text(entry, 'lastmod'), _text(entry, 'loc')) for entry in root if _tag(entry) == 'url']
+        posts = [loc for _, loc in sorted(entries, key=lambda entry: entry[0], reverse=True)]
+    elif kind == 'feed':
+        # Atom: <entry><link href="..."/>
+        posts = [
+            link.get('href', '') for entry in root if _tag(entry) == 'entry'
+            for link in entry if _tag(link) == 'link' and link.get('rel', 'alternate') == 'alternate'
+        ]
+    else:
+        # RSS 2.0: <channel><item><link>, newest first
+        posts = [_text(item, 'link') for item in root.iter() if _tag(item) == 'item']
+    return {'posts': [post for post in posts if is_valid_viralkand_url(post)], 'sitemaps': []}
+
+
+def _busy() -> bool:
+    """Whether live requests are being served (video jobs running or queued, origin requests waiting)"""
+    return bool(
+        job_scheduler.running or job_scheduler.queued or job_queue.running or resource_governor.waiting
+        or any(stats['waiting'] for stats in origin_limiter.stats().values())
+    )
+
+
+class CacheWarmer:
+    """
+    Background task scraping new viralkand.com posts before anyone posts them
+    
+    Every `interval` seconds the feeds (sitemaps, sitemap indexes or RSS/Atom
+    feeds) are fetched and up to `max_entries` posts not seen before go
+    through the same validate-and-scrape path as links posted in chats, which
+    stores the results in the metadata (or negative) cache. The first poll
+    only takes the newest `max_entries` posts and counts the rest of the feeds
+    as seen, so the site's archive is not scraped. Posts whose scrape failed
+    (network error or transient status) are tried again on the next poll. Scrapes are paced
+    to `rate` per second, share the origin rate limits with live requests and
+    only start while no live request is being served. With `prefetch_bytes`
+    and the video cache enabled, the posts' videos are downloaded into the
+    video cache too, up to that many bytes per poll and only when the memory
+    and disk budget has room right away.
+    """
+    
+    def __init__(self, feed_urls: Optional[List[str]] = None, interval: float = WARMER_INTERVAL,
+                 max_entries: int = WARMER_MAX_ENTRIES, rate: float = WARMER_RATE,
+                 prefetch_bytes: int = WARMER_PREFETCH_BYTES):
+        self.feed_urls = WARMER_FEED_URLS if feed_urls is None else feed_urls
+        self.interval = interval
+        self.max_entries = max_entries
+        self.rate = rate
+        self.prefetch_bytes = prefetch_bytes
+        self.polls = 0
+        self.warmed = 0
+        self.prefetched = 0
+        self.prefetched_bytes = 0
+        self.errors = 0
+        self._seen: Dict[str, None] = OrderedDict()
+        self._seeded = False
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.feed_urls)
+    
+    async def start(self) -> None:
+        """Start polling in the background (call from inside the event loop)"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Cache warmer started for {len(self.feed_urls)} feeds every {self.interval}s")
+    
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Cache warmer poll failed: {type(e).__name__}: {str(e)}", exc_info=True)
+            await asyncio.sleep(self.interval)
+    
+    async def _fetch_feed(self, url: str) -> Dict[str, List[str]]:
+        """GET and parse one feed, empty on errors"""
+        try:
+            async with get_async_client().stream('GET', url, timeout=30) as response:
+                if response.status_code != 200:
+                    logger.warning(f"Feed {url} answered {response.status_code}")
+                    return {'posts': [], 'sitemaps': []}
+                content = bytearray()
+                async for chunk in response.aiter_bytes():
+                    content += chunk
+                    if len(content) > FEED_MAX_SIZE:
+                        logger.warning(f"Feed {url} is over {FEED_MAX_SIZE} bytes, skipped")
+                        return {'posts': [], 'sitemaps': []}
+            return parse_feed(bytes(content))
+        except (httpx.HTTPError, ElementTree.ParseError) as e:
+            self.errors += 1
+            logger.warning(f"Could not read feed {url}: {type(e).__name__}: {str(e)}")
+            return {'posts': [], 'sitemaps': []}
+    
+    async def new_posts(self) -> List[str]:
+        """Post URLs from all feeds not warmed before, newest first, at most max_entries"""
+        posts = []
+        for url in self.feed_urls:
+            feed = await self._fetch_feed(url)
+            if feed['sitemaps']:
+                # Sitemap index: new posts are in the most recently modified sitemap
+                feed = await self._fetch_feed(feed['sitemaps'][0])
+            posts += [post for post in feed['posts'] if post not in self._seen and post not in posts]
+        if not self._seeded:
+            # Everything already published when the warmer starts is the archive, not new posts
+            self._seeded = True
+            for post in reversed(posts[self.max_entries:]):
+                self._remember(post)
+        return posts[:self.max_entries]
+    
+    async def poll(self) -> int:
+        """Warm the new posts of all feeds once, returns how many were scraped"""
+        self.polls += 1
+        budget = self.prefetch_bytes if video_cache.enabled else 0
+        warmed = 0
+        for post in await self.new_posts():
+            while _busy():
+                await asyncio.sleep(1)
+            started = time.monotonic()
+            result = await validate_and_check_url_async(post)
+            if result['status_code'] and result['status_code'] not in TRANSIENT_STATUS:
+                self._remember(post)
+            warmed += 1
+            self.warmed += 1
+            video_url = result['metadata'].get('video_url')
+            if budget > 0 and video_url and not _busy():
+                budget -= await self._prefetch(video_url, budget)
+            # Pace scrapes (and prefetches) to at most rate per second
+            await asyncio.sleep(max(0.0, 1 / self.rate - (time.monotonic() - started)))
+        if warmed:
+            logger.info(f"Cache warmer scraped {warmed} new posts")
+        return warmed
+    
+    def _remember(self, post: str) -> None:
+        self._seen[post] = None
+        while len(self._seen) > SEEN_MAX:
+            self._seen.popitem(last=False)
+    
+    async def _prefetch(self, video_url: str, budget: int) -> int:
+        """Download a video into the video cache (at most budget bytes), returns the bytes downloaded"""
+        if video_url in video_cache or await file_id_cache.get_async(video_url):
+            return 0
+        reservation = resource_governor.reservation()
+        video_file = None
+        try:
+            expected_size = await probe_size(video_url)
+            if expected_size is not None and expected_size > min(MAX_VIDEO_SIZE, budget):
+                raise VideoTooLarge(expected_size, min(MAX_VIDEO_SIZE, budget))
+            # Never wait for room: live jobs need it more
+            await reservation.reserve(disk=budget if expected_size is None else expected_size, timeout=0)
+            video_file = await asyncio.to_thread(video_cache.create)
+            size, content_hash = await download_video(video_url, video_file, max_size=min(MAX_VIDEO_SIZE, budget))
+            await asyncio.to_thread(video_cache.commit, video_file, video_url, content_hash, size)
+        except (VideoTooLarge, BudgetExhausted) as e:
+            logger.info(f"Video not prefetched ({str(e)}): {video_url}")
+            return 0
+        except (httpx.HTTPError, DownloadError) as e:
+            self.errors += 1
+            logger.warning(f"Could not prefetch {video_url}: {str(e)}")
+            return 0
+        finally:
+            if video_file is not None:
+                video_cache.discard(video_file)
+            reservation.release()
+        self.prefetched += 1
+        self.prefetched_bytes += size
+        return size
+    
+    def stats(self) -> Dict[str, float]:
+        return {
+            'polls': self.polls,
+            'warmed': self.warmed,
+            'prefetched': self.prefetched,
+            'prefetched_bytes': self.prefetched_bytes,
+            'errors': self.errors
+        }
+
+
+# Warmer run by the bot when WARMER_FEED_URLS is set
+cache_warmer = CacheWarmer()